@@ -1,14 +1,26 @@
 import os
+import re
 import sqlite3
 import argparse
 import time
 import json
 import sys
-from flask import Flask, request, jsonify, g, send_from_directory, abort
+import threading
+import queue
+import urllib.parse
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from flask import Flask, request, jsonify, g, send_from_directory, send_file, abort, redirect, Response, stream_with_context
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import torch
+import index_store
+import result_cache
+import metrics
+import thumbnails
+import metadata_store
+import text_encoder
+import neighbor_graph
 
 # --- Global Variables ---
 config = {}
@@ -16,7 +28,221 @@ app = Flask(__name__)
 embedding_model = None
 image_index = None
 text_index = None
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+index_generation = None # Changes whenever the indices are rebuilt or reloaded
+metadata = None # Optional in-memory MetadataStore, refreshed together with the indices
+neighbors = None # NeighborGraph published with the indices (memory-mapped), for /similar
+search_result_cache = None
+result_cache_fingerprint = "" # Settings the cached results were computed under; see load_resources()
+retrieval_pool = None # Runs the FTS and Faiss legs of a search concurrently
+resources_lock = threading.Lock() # Guards swapping image_index/text_index/index_generation
+DEVICE = None # Resolved when the encoder is loaded, so importing the app doesn't import torch
+startup_report = {} # Seconds spent in each load_resources phase, plus RSS when ready
+DEFAULT_QUERY_CACHE_SIZE = 1024
+DEFAULT_QUERY_CACHE_TTL = 3600 # Seconds; 0 disables expiry
+DEFAULT_RETRIEVAL_THREADS = 6 # Two concurrent requests' worth of legs
+DEFAULT_LEG_TIMEOUT_MS = 1000
+DEFAULT_RELOAD_INTERVAL = 5 # Seconds between manifest polls
+DEFAULT_ENCODE_BATCH_SIZE = 16
+DEFAULT_ENCODE_MAX_WAIT_MS = 2
+ENCODE_RESULT_TIMEOUT = 30 # Seconds a request waits for its batched embedding
+DEFAULT_BATCH_MAX_QUERIES = 10000 # Per /search/batch request
+DEFAULT_BATCH_CHUNK_SIZE = 256 # Queries encoded/searched together while streaming a batch
+DEFAULT_SQLITE_CACHE_MB = 16 # Page cache per read connection
+DEFAULT_SQLITE_MMAP_MB = 256 # Shared across connections and processes through the OS page cache
+SQLITE_CACHED_STATEMENTS = 64
+DEFAULT_SUGGEST_MIN_CHARS = 2 # Shorter words aren't completed; memes_fts has prefix indexes from 2 characters
+DEFAULT_SUGGEST_COMPLETIONS = 8
+DEFAULT_SUGGEST_IDS = 12
+
+# --- Query Embedding Cache ---
+class QueryEmbeddingCache:
+    """Thread-safe LRU cache of normalized query text -> float32 query embedding."""
+
+    def __init__(self, max_size=DEFAULT_QUERY_CACHE_SIZE, ttl=DEFAULT_QUERY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (embedding, stored_at)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query):
+        # CLIP's tokenizer lowercases and collapses whitespace itself, so these
+        # variants produce identical embeddings.
+        return " ".join(query.split()).lower()
+
+    def get(self, query):
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (not self.ttl or time.time() - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key] # Expired
+            self.misses += 1
+            return None
+
+    def put(self, query, embedding):
+        if self.max_size <= 0:
+            return
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding.setflags(write=False) # Shared between requests
+        key = self.normalize(query)
+        with self._lock:
+            self._entries[key] = (embedding, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+query_embedding_cache = QueryEmbeddingCache()
+
+# --- Micro-batching Query Encoder ---
+class QueryEncoder:
+    """Encodes queries from concurrent requests in shared batches.
+
+    Requests enqueue their text and block on a Future. A background thread takes the
+    first pending query, keeps collecting for up to max_wait_ms or until max_batch_size
+    queries are waiting, and runs them through the model in a single encode() call.
+    With max_batch_size <= 1 queries are encoded inline on the request thread.
+    """
+
+    def __init__(self, model, max_batch_size=DEFAULT_ENCODE_BATCH_SIZE, max_wait_ms=DEFAULT_ENCODE_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.encoded = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker_pid = None
+
+    def _ensure_worker(self):
+        # Started lazily, and again in each forked worker process (threads don't survive fork)
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, name="query-encoder", daemon=True).start()
+                self._worker_pid = os.getpid()
+
+    def encode(self, text):
+        if self.max_batch_size <= 1:
+            return np.asarray(self.model.encode(text), dtype=np.float32)
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result(timeout=ENCODE_RESULT_TIMEOUT)
+
+    def _collect_batch(self, pending):
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = self._collect_batch(pending)
+            texts = list(dict.fromkeys(text for text, _ in batch)) # Identical queries share a row
+            try:
+                embeddings = np.asarray(
+                    self.model.encode(texts, batch_size=len(texts), show_progress_bar=False), dtype=np.float32)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            rows = {text: row for row, text in enumerate(texts)}
+            for text, future in batch:
+                future.set_result(embeddings[rows[text]])
+            with self._lock:
+                self.batches += 1
+                self.encoded += len(batch)
+
+    def stats(self):
+        with self._lock:
+            return {"max_batch_size": self.max_batch_size, "max_wait_ms": self.max_wait * 1000.0,
+                    "batches": self.batches, "queries": self.encoded,
+                    "mean_batch_size": self.encoded / self.batches if self.batches else 0.0}
+
+query_encoder = None
+
+# --- Metrics ---
+# Exported on /metrics; per-request stage timings also go out as a Server-Timing header.
+SEARCH_STAGES = {"keyword": "fts", "image_vector": "image_ann", "text_vector": "text_ann"} # Retrieval leg -> stage
+stage_seconds = metrics.Histogram("meme_search_stage_seconds", "Time spent in each stage of a search request.", ("stage",))
+request_seconds = metrics.Histogram("meme_search_request_seconds", "Time to produce a response, by endpoint.", ("endpoint",))
+requests_total = metrics.Counter("meme_search_requests_total", "Responses by endpoint and HTTP status.", ("endpoint", "status"))
+searches_total = metrics.Counter("meme_search_searches_total", "Searches by outcome (ok, degraded, cached, error).", ("outcome",))
+leg_failures_total = metrics.Counter("meme_search_leg_failures_total", "Retrieval legs that failed or timed out.", ("stage", "reason"))
+in_flight_requests = metrics.Gauge("meme_search_in_flight_requests", "Requests currently being handled.")
+
+def _index_sizes():
+    image_idx, text_idx, _ = current_indices()
+    return {("image",): image_idx.ntotal if image_idx is not None else None,
+            ("text",): text_idx.ntotal if text_idx is not None else None}
+
+def _cache_hit_rates():
+    rates = {("query_embedding",): query_embedding_cache.stats()["hit_rate"]}
+    if search_result_cache is not None:
+        rates[("result",)] = search_result_cache.stats()["hit_rate"]
+    return rates
+
+metrics.Gauge("meme_search_index_vectors", "Vectors (ntotal) in each live Faiss index.", ("index",), callback=_index_sizes)
+metrics.Gauge("meme_search_cache_hit_ratio", "Lifetime hit rate of each cache.", ("cache",), callback=_cache_hit_rates)
+metrics.Gauge("meme_search_metadata_store_bytes", "Memory held by the in-memory metadata store.",
+              callback=lambda: current_metadata().memory_bytes() if current_metadata() is not None else None)
+metrics.Gauge("meme_search_index_generation_info", "Live index generation.", ("generation",),
+              callback=lambda: {(str(index_generation),): 1})
+
+def add_server_timing(stage, seconds, description=None):
+    g.setdefault("server_timing", []).append((stage, seconds, description))
+
+def record_stage(stage, seconds, description=None):
+    """Adds a stage duration to the request's Server-Timing header and the stage histogram."""
+    stage_seconds.observe(seconds, stage)
+    add_server_timing(stage, seconds, description)
+
+def _timed(stage, func, *args):
+    """Runs func(*args) and returns (result, seconds). The histogram is updated even if the
+    caller stopped waiting, so legs that time out still show up in the latency distribution."""
+    start = time.perf_counter()
+    try:
+        return func(*args), time.perf_counter() - start
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage)
+
+def _timed_json(payload):
+    start = time.perf_counter()
+    response = jsonify(payload)
+    record_stage("serialize", time.perf_counter() - start)
+    return response
 
 # --- Config Loading ---
 # (load_config function remains the same)
@@ -51,65 +277,253 @@ def load_config(config_path):
 
 # --- Model & Index Loading ---
 # (load_resources function remains the same)
+def _read_index(label, index_path):
+    """Reads one Faiss index and applies the query-time search params. Returns None if missing."""
+    print(f"Loading Faiss {label} index from: {index_path}")
+    if not index_path or not os.path.exists(index_path):
+        print(f"Warning: {label.capitalize()} index file not found at {index_path}. "
+              f"{label.capitalize()} vector search disabled.", file=sys.stderr)
+        return None
+    index = index_store.read_index(index_path, config.get("index_load_mode", "memory"))
+    index_store.apply_search_params(index, config["search_params"])
+    print(f"{label.capitalize()} index loaded: {index_store.describe_index(index)}")
+    return index
+
+def process_memory():
+    """Resident memory of this process in MB, split into private (anon) and file-backed pages.
+
+    File-backed pages (mmapped indices, shared libraries) live in the page cache and are
+    shared between worker processes; anon pages are private to each worker.
+    """
+    memory = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "RssAnon", "RssFile", "RssShmem"):
+                    key = {"VmRSS": "rss_mb", "RssAnon": "rss_anon_mb",
+                           "RssFile": "rss_file_mb", "RssShmem": "rss_shmem_mb"}[name]
+                    memory[key] = int(value.split()[0]) / 1024.0
+        # PSS splits shared pages between the processes mapping them: the fair per-worker cost
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    memory["pss_mb"] = int(line.split()[1]) / 1024.0
+    except OSError:
+        if not memory:
+            import resource # Not Linux: peak RSS is the best available figure
+            memory["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return memory
+
+def manifest_file():
+    return config.get("index_manifest_file") or index_store.default_manifest_file(config["image_index_file"])
+
+def load_indices():
+    """Reads the currently published indices without touching the globals.
+
+    Returns (image_index, text_index, generation, metadata, graph). Uses the indexer's
+    manifest when one exists, else the configured paths. metadata is a MetadataStore
+    snapshot of the database when "metadata_store" is enabled, else None. graph is the
+    generation's NeighborGraph, or None if it was published without one.
+    """
+    manifest = index_store.read_manifest(manifest_file())
+    if manifest is not None:
+        paths = index_store.manifest_paths(manifest, manifest_file())
+        image_index_path, text_index_path = paths.get("image_index"), paths.get("text_index")
+        generation = f"g{manifest['generation']}"
+    else:
+        image_index_path, text_index_path = config.get("image_index_file"), config.get("text_index_file")
+        generation = index_store.index_generation([image_index_path, text_index_path])
+    new_image_index = _read_index("image", image_index_path)
+    new_text_index = _read_index("text", text_index_path)
+    if new_image_index is None and new_text_index is None:
+         print("Warning: Both Faiss indices failed to load. Vector search will not function.", file=sys.stderr)
+    new_metadata = None
+    store_config = config.get("metadata_store", {})
+    if store_config.get("enabled", False):
+        # The indexer commits metadata before publishing a generation, so this snapshot covers its ids
+        new_metadata = metadata_store.load_metadata_store(
+            config["database_file"], store_config.get("ocr_text_chars", metadata_store.DEFAULT_OCR_TEXT_CHARS))
+    new_graph = neighbor_graph.load_published(manifest, manifest_file())
+    return new_image_index, new_text_index, generation, new_metadata, new_graph
+
+def swap_indices(new_image_index, new_text_index, generation, new_metadata=None, new_graph=None):
+    """Publishes freshly loaded indices to request handlers.
+
+    Requests take a snapshot with current_indices(), so in-flight searches finish
+    on the indices they started with.
+    """
+    global image_index, text_index, index_generation, metadata, neighbors
+    with resources_lock:
+        image_index, text_index, index_generation = new_image_index, new_text_index, generation
+        metadata, neighbors = new_metadata, new_graph
+    print(f"Index generation {generation} is live.")
+
+def current_indices():
+    with resources_lock:
+        return image_index, text_index, index_generation
+
+def current_metadata():
+    with resources_lock:
+        return metadata
+
+def current_graph():
+    with resources_lock:
+        return neighbors, index_generation
+
+def reload_indices_if_changed():
+    """Loads and swaps in a newly published index generation. Returns True if it swapped."""
+    manifest = index_store.read_manifest(manifest_file())
+    if manifest is None or f"g{manifest['generation']}" == index_generation:
+        return False
+    try:
+        swap_indices(*load_indices()) # Loading happens outside the lock
+        return True
+    except Exception as e:
+        # Keep serving the old generation; the next poll retries
+        app.logger.error(f"Failed to reload indices for generation {manifest['generation']}: {e}")
+        return False
+
+def _watch_indices(interval):
+    while True:
+        time.sleep(interval)
+        reload_indices_if_changed()
+
+def start_index_watcher():
+    """Polls the manifest every server.reload_interval seconds (0 disables hot reload)."""
+    interval = config.get("server", {}).get("reload_interval", DEFAULT_RELOAD_INTERVAL)
+    if interval and interval > 0:
+        threading.Thread(target=_watch_indices, args=(interval,), name="index-watcher", daemon=True).start()
+        print(f"Watching {manifest_file()} for new index generations every {interval}s.")
+
+def configure_worker_threads():
+    """Re-applies text_encoder.torch_threads; gunicorn calls this in each worker after fork."""
+    encoder_config = config.get("text_encoder", {})
+    if encoder_config.get("backend") != "onnx" and "torch" in sys.modules:
+        text_encoder.set_torch_threads(encoder_config.get("torch_threads"))
+
 def load_resources():
-    """Loads the embedding model and Faiss indices based on loaded config."""
-    global embedding_model, image_index, text_index
+    """Loads the query encoder and Faiss indices based on loaded config."""
+    global embedding_model, query_embedding_cache, query_encoder, search_result_cache, result_cache_fingerprint, retrieval_pool
+    global DEVICE, startup_report
     if not config:
         print("Error: Configuration not loaded. Cannot load resources.", file=sys.stderr)
         return False
     print("Loading resources...")
+    start_time = time.time()
+    timings = {}
     embedding_model_name = config.get("embedding_model")
-    image_index_path = config.get("image_index_file")
-    text_index_path = config.get("text_index_file")
+    encoder_config = config.get("text_encoder", {})
+    print(f"Configured index type: {config.get('index_factory', index_store.DEFAULT_INDEX_FACTORY)} "
+          f"(query-time params: { {k: v for k, v in config['search_params'].items() if k in index_store.QUERY_TIME_PARAMS} })")
     try:
-        print(f"Loading embedding model: {embedding_model_name} on {DEVICE}")
-        embedding_model = SentenceTransformer(embedding_model_name, device=DEVICE)
-        print("Embedding model loaded.")
-        print(f"Loading Faiss image index from: {image_index_path}")
-        if os.path.exists(image_index_path):
-            image_index = faiss.read_index(image_index_path)
-            print(f"Image index loaded. Total vectors: {image_index.ntotal}")
-        else:
-            print(f"Warning: Image index file not found at {image_index_path}. Image vector search disabled.", file=sys.stderr)
-            image_index = None
-        print(f"Loading Faiss text index from: {text_index_path}")
-        if os.path.exists(text_index_path):
-            text_index = faiss.read_index(text_index_path)
-            print(f"Text index loaded. Total vectors: {text_index.ntotal}")
-        else:
-             print(f"Warning: Text index file not found at {text_index_path}. Text vector search disabled.", file=sys.stderr)
-             text_index = None
-        if image_index is None and text_index is None:
-             print("Warning: Both Faiss indices failed to load. Vector search will not function.", file=sys.stderr)
+        phase_start = time.time()
+        DEVICE = encoder_config.get("device") or text_encoder.default_device()
+        print(f"Loading query encoder: {embedding_model_name} "
+              f"({encoder_config.get('backend', text_encoder.DEFAULT_BACKEND)} backend) on {DEVICE}")
+        embedding_model = text_encoder.load_text_encoder(embedding_model_name, encoder_config, DEVICE)
+        timings["encoder_load_s"] = time.time() - phase_start
+        encode_batch_size = config["search_params"].get("encode_batch_size", DEFAULT_ENCODE_BATCH_SIZE)
+        if encoder_config.get("warmup", False):
+            phase_start = time.time()
+            text_encoder.warm_up(embedding_model, encode_batch_size)
+            timings["warmup_s"] = time.time() - phase_start
+        # Cached embeddings belong to the previous model
+        query_embedding_cache = QueryEmbeddingCache(
+            max_size=config["search_params"].get("query_cache_size", DEFAULT_QUERY_CACHE_SIZE),
+            ttl=config["search_params"].get("query_cache_ttl", DEFAULT_QUERY_CACHE_TTL))
+        query_encoder = QueryEncoder(
+            embedding_model,
+            max_batch_size=encode_batch_size,
+            max_wait_ms=config["search_params"].get("encode_max_wait_ms", DEFAULT_ENCODE_MAX_WAIT_MS))
+        print("Query encoder loaded.")
+        phase_start = time.time()
+        swap_indices(*load_indices())
+        timings["indices_s"] = time.time() - phase_start
+        # Faiss parallelizes each search with OpenMP; split the cores between the
+        # concurrent retrieval threads instead of letting every search claim all of them.
+        retrieval_threads = config["search_params"].get("retrieval_threads", DEFAULT_RETRIEVAL_THREADS)
+        omp_threads = config["search_params"].get(
+            "faiss_omp_threads", max(1, (os.cpu_count() or 1) // retrieval_threads))
+        faiss.omp_set_num_threads(omp_threads)
+        if retrieval_pool is None:
+            retrieval_pool = ThreadPoolExecutor(max_workers=retrieval_threads, thread_name_prefix="retrieval")
+        print(f"Retrieval pool: {retrieval_threads} threads, Faiss OpenMP threads: {omp_threads}")
+        search_result_cache = result_cache.create_result_cache(config.get("result_cache", {}))
+        result_cache_fingerprint = result_cache.settings_fingerprint({
+            "embedding_model": embedding_model_name, "text_encoder": encoder_config,
+            "metadata_store": config.get("metadata_store", {})})
+        print(f"Result cache: {search_result_cache.stats()['backend'] if search_result_cache else 'disabled'}")
+        memory = process_memory()
+        timings["total_s"] = time.time() - start_time
+        startup_report = dict(timings, rss_mb=memory.get("rss_mb", memory.get("max_rss_mb")))
+        print(f"Resources loaded in {timings['total_s']:.2f} seconds "
+              f"({', '.join(f'{name[:-2]}: {seconds:.2f}s' for name, seconds in timings.items() if name != 'total_s')}; "
+              f"index load mode: {config.get('index_load_mode', 'memory')}, "
+              f"RSS: {memory.get('rss_mb', 0):.0f} MB, of which file-backed: {memory.get('rss_file_mb', 0):.0f} MB)")
         return True
     except Exception as e:
         print(f"FATAL ERROR loading resources: {e}", file=sys.stderr)
         return False
 
 # --- Database Connection Handling ---
-# (get_db and close_db remain the same)
+# Each thread keeps one read-only connection for its whole life instead of connecting per
+# request, so its page cache stays warm and its prepared statements are reused
+# (sqlite3 caches statements per connection by SQL text).
+db_local = threading.local()
+
+def open_read_connection(db_path):
+    """Opens a read-only connection tuned for the search read path ("sqlite" config section)."""
+    sqlite_config = config.get("sqlite", {})
+    conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(db_path))}?mode=ro", uri=True,
+                           detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=SQLITE_CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA cache_size = -{int(sqlite_config.get('cache_size_mb', DEFAULT_SQLITE_CACHE_MB) * 1024)}")
+    conn.execute(f"PRAGMA mmap_size = {int(sqlite_config.get('mmap_size_mb', DEFAULT_SQLITE_MMAP_MB) * 2**20)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
 def get_db():
     if 'db' not in g:
         db_path = config.get("database_file")
         if not db_path:
             app.logger.error("Database file path not found in configuration.")
             return None
-        try:
-            g.db = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
-            g.db.row_factory = sqlite3.Row
-        except sqlite3.Error as e:
-            app.logger.error(f"Error connecting to database {db_path}: {e}")
-            return None
+        conn = getattr(db_local, "conn", None)
+        # Connections must not cross a fork, and the configured path can change with the config
+        if conn is None or db_local.key != (os.getpid(), db_path):
+            try:
+                conn = open_read_connection(db_path)
+            except sqlite3.Error as e:
+                app.logger.error(f"Error connecting to database {db_path}: {e}")
+                return None
+            db_local.conn, db_local.key = conn, (os.getpid(), db_path)
+        g.db = conn
     return g.db
 
 @app.teardown_appcontext
 def close_db(e=None):
+    # The connection stays open for the thread's next request
     db = g.pop('db', None)
-    if db is not None:
-        db.close()
+    if db is not None and db.in_transaction:
+        db.rollback()
 
 # --- Search Functions ---
 # (keyword_search_fts, vector_search_faiss, reciprocal_rank_fusion remain the same)
+# Constant SQL text, so each connection prepares these once and reuses the statement
+FTS_SQL = "SELECT rowid as id, rank FROM memes_fts WHERE memes_fts MATCH ? ORDER BY rank LIMIT ?"
+METADATA_SQL = ("SELECT id, image_path, ocr_text, content_hash FROM memes "
+                "WHERE id IN (SELECT value FROM json_each(?))")
+GROUP_SQL = "SELECT id, canonical_id FROM memes WHERE id IN (SELECT value FROM json_each(?))"
+# Terms are compared as UTF-8 bytes, so [prefix, prefix + U+10FFFF) holds exactly the terms starting with prefix
+VOCAB_SQL = "SELECT term FROM memes_vocab WHERE term >= ? AND term < ? ORDER BY docs DESC LIMIT ?"
+PREFIX_FTS_SQL = "SELECT rowid AS id FROM memes_fts WHERE memes_fts MATCH ? LIMIT ?"
+MATCH_EXISTS_SQL = "SELECT 1 FROM memes_fts WHERE memes_fts MATCH ? LIMIT 1"
+COMPLETION_CANDIDATES = 4 # With earlier terms, completions are picked from limit * this many of the most common terms
+FTS_TOKEN = re.compile(r"[^\W_]+") # Runs of letters and digits, like FTS5's unicode61 tokenizer
+LAST_FTS_TOKEN = re.compile(r"[^\W_]+$")
+
 def keyword_search_fts(query_text):
     db = get_db()
     if not db: return []
@@ -117,10 +531,7 @@ def keyword_search_fts(query_text):
     start_time = time.time()
     results = []
     try:
-        cursor = db.execute(
-            "SELECT rowid as id, rank FROM memes_fts WHERE memes_fts MATCH ? ORDER BY rank LIMIT ?",
-            (query_text, k)
-        )
+        cursor = db.execute(FTS_SQL, (query_text, k))
         results = [(row['id'], 1.0 / (row['rank'] + 1e-6)) for row in cursor.fetchall()]
         app.logger.debug(f"FTS search found {len(results)} results.")
     except sqlite3.Error as e:
@@ -129,6 +540,38 @@ def keyword_search_fts(query_text):
     app.logger.info(f"Keyword search took {duration:.4f} seconds.")
     return results
 
+def fts_tokens(text):
+    """Terms of text as memes_fts stores them: split on non-alphanumerics, lowercased, without diacritics."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return FTS_TOKEN.findall("".join(char for char in decomposed if not unicodedata.combining(char)))
+
+def complete_term(db, prefix, limit, terms=()):
+    """The terms starting with prefix, most common (in the most memes) first.
+
+    Given the earlier terms of the query, only terms some meme contains along with all of
+    them are kept, so a completion never leads to an empty result.
+    """
+    cursor = db.execute(VOCAB_SQL, (prefix, prefix + "\U0010ffff", limit * (COMPLETION_CANDIDATES if terms else 1)))
+    candidates = [row['term'] for row in cursor.fetchall()]
+    if not terms:
+        return candidates
+    quoted = " ".join(f'"{term}"' for term in terms)
+    completions = []
+    for term in candidates:
+        if db.execute(MATCH_EXISTS_SQL, (f'{quoted} "{term}"',)).fetchone() is not None:
+            completions.append(term)
+            if len(completions) == limit:
+                break
+    return completions
+
+def prefix_search_fts(db, terms, prefix, limit):
+    """Ids of memes containing all terms and a term starting with prefix (if any), in rowid order.
+
+    Ranking by bm25 would score every match, and short prefixes match much of the corpus.
+    """
+    match = " ".join([f'"{term}"' for term in terms] + ([f'"{prefix}"*'] if prefix else []))
+    return [row['id'] for row in db.execute(PREFIX_FTS_SQL, (match, limit)).fetchall()]
+
 def vector_search_faiss(query_embedding, index):
     if index is None or query_embedding is None:
         app.logger.warning("Vector search skipped: Index or query embedding unavailable.")
@@ -137,11 +580,7 @@ def vector_search_faiss(query_embedding, index):
     start_time = time.time()
     try:
         distances, ids = index.search(np.array([query_embedding]).astype(np.float32), k)
-        valid_indices = ids[0] != -1
-        ids = ids[0][valid_indices]
-        distances = distances[0][valid_indices]
-        scores = 1.0 / (1.0 + distances + 1e-6)
-        results = list(zip(ids.tolist(), scores.tolist()))
+        results = _vector_results(distances[0], ids[0])
         app.logger.debug(f"Vector search found {len(results)} results.")
     except Exception as e:
         app.logger.error(f"Faiss Vector search error: {e}")
@@ -150,6 +589,100 @@ def vector_search_faiss(query_embedding, index):
     app.logger.info(f"Vector search took {duration:.4f} seconds.")
     return results
 
+def _vector_results(distances_row, ids_row):
+    """Turns one row of Faiss output into [(id, score), ...], dropping empty (-1) slots."""
+    valid_indices = ids_row != -1
+    scores = 1.0 / (1.0 + distances_row[valid_indices] + 1e-6)
+    return list(zip(ids_row[valid_indices].tolist(), scores.tolist()))
+
+def vector_search_faiss_batch(query_embeddings, index):
+    """Searches all queries with a single index.search call; returns one result list per query."""
+    if index is None or len(query_embeddings) == 0:
+        return [[] for _ in range(len(query_embeddings))]
+    k = config["search_params"]["k_vector"]
+    start_time = time.time()
+    distances, ids = index.search(np.ascontiguousarray(query_embeddings, dtype=np.float32), k)
+    app.logger.info(f"Batched vector search of {len(query_embeddings)} queries took {time.time() - start_time:.4f} seconds.")
+    return [_vector_results(distances[row], ids[row]) for row in range(len(query_embeddings))]
+
+def fetch_metadata(db, ids):
+    """Returns {id: {"id", "image_path", "ocr_text", "content_hash"}} for the given ids."""
+    if not ids:
+        return {}
+    # One JSON array parameter instead of a placeholder per id keeps the SQL text constant
+    cursor = db.execute(METADATA_SQL, (json.dumps([int(doc_id) for doc_id in ids]),))
+    return {row['id']: dict(row) for row in cursor.fetchall()}
+
+def lookup_metadata(ids):
+    """fetch_metadata through the in-memory store; only ids it lacks go to SQLite.
+
+    Raises sqlite3.Error if SQLite is needed but unavailable.
+    """
+    store = current_metadata()
+    rows_dict = store.fetch(ids) if store is not None else {}
+    missing = [doc_id for doc_id in ids if doc_id not in rows_dict]
+    if missing:
+        db = get_db()
+        if not db:
+            raise sqlite3.Error("Database connection failed")
+        rows_dict.update(fetch_metadata(db, missing))
+    return rows_dict
+
+def lookup_row(image_id):
+    """The metadata row of one meme (see fetch_metadata), or None if the id is unknown."""
+    return lookup_metadata([image_id]).get(image_id)
+
+def lookup_groups(ids):
+    """{id: group id}: a near-duplicate's canonical id, else the id itself.
+
+    Raises sqlite3.Error if SQLite is needed but unavailable (or predates near-duplicates).
+    """
+    store = current_metadata()
+    groups = store.groups(ids) if store is not None else {}
+    missing = [doc_id for doc_id in ids if doc_id not in groups]
+    if missing:
+        db = get_db()
+        if not db:
+            raise sqlite3.Error("Database connection failed")
+        cursor = db.execute(GROUP_SQL, (json.dumps([int(doc_id) for doc_id in missing]),))
+        canonical_ids = {row['id']: row['canonical_id'] for row in cursor.fetchall()}
+        groups.update((doc_id, canonical_ids.get(doc_id) or doc_id) for doc_id in missing)
+    return groups
+
+def collapse_duplicates(fused_results):
+    """Keeps only the best-ranked result of each group of near-duplicates."""
+    if not fused_results:
+        return fused_results
+    try:
+        groups = lookup_groups([doc_id for doc_id, _ in fused_results])
+    except sqlite3.Error as e:
+        app.logger.warning(f"Not collapsing near-duplicates: {e}")
+        return fused_results
+    seen, collapsed = set(), []
+    for doc_id, score in fused_results:
+        group = groups.get(doc_id, doc_id)
+        if group not in seen:
+            seen.add(group)
+            collapsed.append((doc_id, score))
+    return collapsed
+
+def wants_collapse():
+    """?collapse=0/1 overrides search_params.collapse_duplicates for one request."""
+    value = request.args.get('collapse')
+    if value is None:
+        return bool(config["search_params"].get("collapse_duplicates", False))
+    return value.lower() not in ("0", "false", "no", "off")
+
+def build_results(fused_results, rows_dict, max_results):
+    """Joins the top fused (id, score) pairs with their metadata, keeping fusion order."""
+    final_results = []
+    for doc_id, score in fused_results[:max_results]:
+        if doc_id in rows_dict:
+            result_item = dict(rows_dict[doc_id])
+            result_item['score'] = score
+            final_results.append(result_item)
+    return final_results
+
 def reciprocal_rank_fusion(*results_lists):
     fused_scores = {}
     rrf_k = config["search_params"]["rrf_k"]
@@ -165,6 +698,43 @@ def reciprocal_rank_fusion(*results_lists):
     return reranked_results
 
 
+def _in_app_context(func, *args):
+    """Runs func inside an app context so pool threads get their own `g` (and DB connection)."""
+    with app.app_context():
+        return func(*args)
+
+def run_retrieval_legs(query, query_embedding, image_idx, text_idx):
+    """Runs keyword, image-vector and text-vector retrieval concurrently.
+
+    Each leg gets leg_timeout_ms; legs that time out or fail contribute no results.
+    Returns (keyword_results, image_vector_results, text_vector_results, failed_legs).
+    """
+    legs = {
+        "keyword": retrieval_pool.submit(_timed, "fts", _in_app_context, keyword_search_fts, query),
+        "image_vector": retrieval_pool.submit(_timed, "image_ann", vector_search_faiss, query_embedding, image_idx),
+        "text_vector": retrieval_pool.submit(_timed, "text_ann", vector_search_faiss, query_embedding, text_idx),
+    }
+    timeout = config["search_params"].get("leg_timeout_ms", DEFAULT_LEG_TIMEOUT_MS) / 1000.0
+    done, _ = wait(legs.values(), timeout=timeout)
+    results = {}
+    failed_legs = []
+    for name, future in legs.items():
+        if future in done and future.exception() is None:
+            results[name], seconds = future.result()
+            add_server_timing(SEARCH_STAGES[name], seconds) # Already observed by _timed
+            continue
+        if future in done:
+            app.logger.error(f"Retrieval leg '{name}' failed: {future.exception()}")
+            leg_failures_total.inc(SEARCH_STAGES[name], "error")
+        else:
+            future.cancel() # Still running legs finish in the background; their results are dropped
+            app.logger.warning(f"Retrieval leg '{name}' timed out after {timeout:.3f} seconds.")
+            leg_failures_total.inc(SEARCH_STAGES[name], "timeout")
+        failed_legs.append(name)
+        results[name] = []
+    return results["keyword"], results["image_vector"], results["text_vector"], failed_legs
+
+
 # --- Flask Routes ---
 @app.route('/search', methods=['GET'])
 # (Search route remains the same)
@@ -175,73 +745,287 @@ def search():
         return jsonify({"error": "Query parameter 'q' is required"}), 400
     if not embedding_model:
          return jsonify({"error": "Search resources not loaded properly (model missing)"}), 500
-    if image_index is None and text_index is None:
+    image_idx, text_idx, generation = current_indices() # Stable for the whole request
+    if image_idx is None and text_idx is None:
          app.logger.warning("Both Faiss indices are unavailable.")
     app.logger.info(f"Received search query: '{query}'")
-    try:
-        query_embedding = embedding_model.encode(query).astype(np.float32)
-    except Exception as e:
-        app.logger.error(f"Failed to encode query '{query}': {e}")
-        return jsonify({"error": "Failed to process query embedding"}), 500
-    keyword_results = keyword_search_fts(query)
-    image_vector_results = vector_search_faiss(query_embedding, image_index)
-    text_vector_results = vector_search_faiss(query_embedding, text_index)
+    collapse = wants_collapse()
+    cache_key = None
+    if search_result_cache is not None:
+        stage_start = time.perf_counter()
+        cache_key = result_cache.make_key(query, dict(config["search_params"], collapse_duplicates=collapse), generation,
+                                          result_cache_fingerprint)
+        cached_results = search_result_cache.get(cache_key)
+        record_stage("result_cache", time.perf_counter() - stage_start, "hit" if cached_results is not None else "miss")
+        if cached_results is not None:
+            app.logger.info(f"Served '{query}' from result cache in {time.time() - start_time_total:.4f} seconds.")
+            searches_total.inc("cached")
+            return _timed_json({
+                "query": query,
+                "results_count": len(cached_results),
+                "results": cached_results
+                })
+    stage_start = time.perf_counter()
+    query_embedding = query_embedding_cache.get(query)
+    if query_embedding is None:
+        try:
+            query_embedding = query_encoder.encode(query)
+        except Exception as e:
+            app.logger.error(f"Failed to encode query '{query}': {e}")
+            searches_total.inc("error")
+            return jsonify({"error": "Failed to process query embedding"}), 500
+        query_embedding_cache.put(query, query_embedding)
+        record_stage("encode", time.perf_counter() - stage_start)
+    else:
+        app.logger.debug("Query embedding served from cache.")
+        # Header only: cache lookups would drag down the encode latency histogram
+        add_server_timing("encode", time.perf_counter() - stage_start, "cached")
+    keyword_results, image_vector_results, text_vector_results, failed_legs = run_retrieval_legs(
+        query, query_embedding, image_idx, text_idx)
+    stage_start = time.perf_counter()
     fused_results = reciprocal_rank_fusion(
         keyword_results,
         image_vector_results,
         text_vector_results
     )
+    record_stage("rrf", time.perf_counter() - stage_start)
+    if collapse:
+        stage_start = time.perf_counter()
+        fused_results = collapse_duplicates(fused_results)
+        record_stage("collapse", time.perf_counter() - stage_start)
     max_results = config["search_params"]["max_results"]
     top_ids = [doc_id for doc_id, score in fused_results[:max_results]]
     final_results = []
     if top_ids:
-        db = get_db()
-        if db:
-            try:
-                placeholders = ','.join('?' * len(top_ids))
-                query_sql = f"SELECT id, image_path, ocr_text FROM memes WHERE id IN ({placeholders})"
-                cursor = db.execute(query_sql, top_ids)
-                rows_dict = {row['id']: dict(row) for row in cursor.fetchall()}
-                for doc_id, score in fused_results[:max_results]:
-                    if doc_id in rows_dict:
-                        result_item = rows_dict[doc_id]
-                        result_item['score'] = score
-                        final_results.append(result_item)
-            except sqlite3.Error as e:
-                app.logger.error(f"Error retrieving metadata from DB: {e}")
-                return jsonify({"error": "Failed to retrieve result metadata"}), 500
-        else:
-             return jsonify({"error": "Database connection failed"}), 500
+        stage_start = time.perf_counter()
+        try:
+            final_results = build_results(fused_results, lookup_metadata(top_ids), max_results)
+        except sqlite3.Error as e:
+            app.logger.error(f"Error retrieving metadata from DB: {e}")
+            searches_total.inc("error")
+            return jsonify({"error": "Failed to retrieve result metadata"}), 500
+        record_stage("hydrate", time.perf_counter() - stage_start)
+    if cache_key is not None and not failed_legs: # Never cache degraded results
+        search_result_cache.put(cache_key, final_results)
     duration_total = time.time() - start_time_total
     app.logger.info(f"Total search request took {duration_total:.4f} seconds.")
-    return jsonify({
+    response = {
         "query": query,
         "results_count": len(final_results),
         "results": final_results
+        }
+    if failed_legs:
+        response["degraded"] = True
+        response["failed_legs"] = failed_legs
+    searches_total.inc("degraded" if failed_legs else "ok")
+    return _timed_json(response)
+
+def encode_queries(queries):
+    """Embeds a list of queries in one encode() call, reusing cached embeddings."""
+    embeddings = [query_embedding_cache.get(query) for query in queries]
+    missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+    if missing:
+        encoded = np.asarray(embedding_model.encode(missing, batch_size=len(missing), show_progress_bar=False),
+                             dtype=np.float32)
+        by_query = dict(zip(missing, encoded))
+        for query, embedding in by_query.items():
+            query_embedding_cache.put(query, embedding)
+        embeddings = [by_query[query] if embedding is None else embedding
+                      for query, embedding in zip(queries, embeddings)]
+    return np.vstack(embeddings)
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """Runs many queries in one request: {"queries": ["...", ...]}.
+
+    Queries are processed in chunks: one encode() call and one index.search() per index
+    per chunk, FTS on a single connection, one metadata query per chunk. Results stream
+    back as NDJSON, one {"query", "results_count", "results"} object per line in request
+    order, so memory stays bounded by the chunk size rather than the batch size.
+    """
+    payload = request.get_json(silent=True) or {}
+    queries = payload.get("queries")
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return jsonify({"error": "Body must be JSON with a 'queries' list of strings"}), 400
+    max_queries = config["search_params"].get("batch_max_queries", DEFAULT_BATCH_MAX_QUERIES)
+    if len(queries) > max_queries:
+        return jsonify({"error": f"At most {max_queries} queries per batch"}), 400
+    if not embedding_model:
+         return jsonify({"error": "Search resources not loaded properly (model missing)"}), 500
+    image_idx, text_idx, _ = current_indices() # One generation for the whole batch
+    chunk_size = config["search_params"].get("batch_chunk_size", DEFAULT_BATCH_CHUNK_SIZE)
+    max_results = config["search_params"]["max_results"]
+    collapse = wants_collapse()
+
+    def generate():
+        start_time_total = time.time()
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+            valid = [query for query in chunk if query.strip()]
+            try:
+                embeddings = encode_queries(valid) if valid else np.zeros((0, 0), dtype=np.float32)
+                image_results = dict(zip(valid, vector_search_faiss_batch(embeddings, image_idx)))
+                text_results = dict(zip(valid, vector_search_faiss_batch(embeddings, text_idx)))
+                fused = {query: reciprocal_rank_fusion(keyword_search_fts(query), image_results[query],
+                                                       text_results[query])
+                         for query in valid}
+                if collapse:
+                    fused = {query: collapse_duplicates(fused_results) for query, fused_results in fused.items()}
+                top_ids = list({doc_id for fused_results in fused.values() for doc_id, _ in fused_results[:max_results]})
+                rows_dict = lookup_metadata(top_ids)
+            except Exception as e:
+                app.logger.error(f"Batch search failed for queries {start}-{start + len(chunk) - 1}: {e}")
+                for query in chunk:
+                    yield json.dumps({"query": query, "error": "Search failed"}) + "\n"
+                continue
+            for query in chunk:
+                if query not in fused:
+                    yield json.dumps({"query": query, "error": "Query must not be empty"}) + "\n"
+                    continue
+                final_results = build_results(fused[query], rows_dict, max_results)
+                yield json.dumps({"query": query, "results_count": len(final_results),
+                                  "results": final_results}) + "\n"
+        app.logger.info(f"Batch search of {len(queries)} queries took {time.time() - start_time_total:.4f} seconds.")
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics."""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    in_flight_requests.inc()
+
+@app.after_request
+def add_request_metrics(response):
+    """Adds the Server-Timing header and records per-endpoint latency and status.
+
+    For streamed responses (/search/batch) this measures the time to the first byte.
+    """
+    if "request_start" not in g:
+        return response
+    total = time.perf_counter() - g.request_start
+    timings = [f"{stage};dur={seconds * 1000.0:.3f}" + (f';desc="{description}"' if description else "")
+               for stage, seconds, description in g.get("server_timing", [])]
+    timings.append(f"total;dur={total * 1000.0:.3f}")
+    response.headers["Server-Timing"] = ", ".join(timings)
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched" # Bounded label values
+    request_seconds.observe(total, endpoint)
+    requests_total.inc(endpoint, str(response.status_code))
+    return response
+
+@app.teardown_request
+def finish_request(e=None):
+    if g.pop("request_start", None) is not None:
+        in_flight_requests.dec()
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Reports cache statistics."""
+    return jsonify({
+        "index_generation": index_generation,
+        "startup": startup_report,
+        "process": dict(process_memory(), pid=os.getpid()),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "query_encoder": query_encoder.stats() if query_encoder else None,
+        "result_cache": search_result_cache.stats() if search_result_cache else None,
+        "metadata_store": current_metadata().stats() if current_metadata() is not None else None,
+        "neighbor_graph": current_graph()[0].stats() if current_graph()[0] is not None else None,
+        })
+
+@app.route('/similar/<int:image_id>', methods=['GET'])
+def similar(image_id):
+    """Memes most like image_id, read from the neighbor graph: /similar/<id>?n=<count>.
+
+    No query encoding or Faiss search; results carry the (squared L2) "distance" of
+    their vector instead of a score. ?collapse works as in /search.
+    """
+    graph, generation = current_graph()
+    if graph is None:
+        return jsonify({"error": "No neighbor graph is loaded; run the indexer with neighbor_graph enabled"}), 503
+    count = max(1, min(request.args.get('n', type=int) or config["search_params"]["max_results"], graph.k))
+    stage_start = time.perf_counter()
+    similar_results = graph.lookup(image_id)
+    record_stage("neighbors", time.perf_counter() - stage_start)
+    if not similar_results:
+        return jsonify({"error": f"Image ID {image_id} is not in the neighbor graph"}), 404
+    if wants_collapse():
+        stage_start = time.perf_counter()
+        # The query goes first so its own near-duplicates are dropped with it
+        similar_results = collapse_duplicates([(image_id, 0.0)] + similar_results)[1:]
+        record_stage("collapse", time.perf_counter() - stage_start)
+    similar_results = similar_results[:count]
+    stage_start = time.perf_counter()
+    try:
+        rows_dict = lookup_metadata([doc_id for doc_id, _ in similar_results])
+    except sqlite3.Error as e:
+        app.logger.error(f"Error retrieving metadata from DB: {e}")
+        return jsonify({"error": "Failed to retrieve result metadata"}), 500
+    final_results = [dict(rows_dict[doc_id], distance=distance) for doc_id, distance in similar_results
+                     if doc_id in rows_dict]
+    record_stage("hydrate", time.perf_counter() - stage_start)
+    return _timed_json({
+        "id": image_id,
+        "generation": generation,
+        "results_count": len(final_results),
+        "results": final_results
         })
 
+@app.route('/suggest', methods=['GET'])
+def suggest():
+    """Typeahead for the search box: /suggest?q=<text typed so far>.
+
+    Only SQLite is involved, so it's cheap enough to call on every keystroke. Returns
+    completions of the word being typed (q's last word, unless q ends in a space) from
+    memes_vocab, and ids of memes whose text matches q with that word as a prefix.
+    """
+    text = request.args.get('q', '')
+    suggest_config = config.get("suggest", {})
+    min_chars = suggest_config.get("min_chars", DEFAULT_SUGGEST_MIN_CHARS)
+    terms = fts_tokens(text)
+    last_word = LAST_FTS_TOKEN.search(text) # None when q ends in a space or punctuation
+    prefix = terms.pop() if last_word and terms else ""
+    if len(prefix) < min_chars:
+        prefix = "" # Too short to narrow anything down
+    completions, ids = [], []
+    if terms or prefix:
+        db = get_db()
+        if not db:
+            return jsonify({"error": "Database connection failed"}), 500
+        try:
+            if prefix:
+                stage_start = time.perf_counter()
+                completions = [text[:last_word.start()] + term for term in complete_term(
+                    db, prefix, suggest_config.get("completions", DEFAULT_SUGGEST_COMPLETIONS), terms)]
+                record_stage("vocab", time.perf_counter() - stage_start)
+            stage_start = time.perf_counter()
+            ids = prefix_search_fts(db, terms, prefix, suggest_config.get("ids", DEFAULT_SUGGEST_IDS))
+            record_stage("prefix_fts", time.perf_counter() - stage_start)
+        except sqlite3.Error as e:
+            app.logger.error(f"Suggest query error for '{text}': {e}") # E.g. a database indexed before memes_vocab
+            return jsonify({"error": "Failed to query the full-text index"}), 500
+    return _timed_json({"query": text, "completions": completions, "ids": ids})
+
 
 # --- Image Serving Route ---
 # (serve_image route remains the same)
 @app.route('/images/<int:image_id>')
 def serve_image(image_id):
-    db = get_db()
     image_path = None
-    if db:
-        try:
-            cursor = db.execute("SELECT image_path FROM memes WHERE id = ?", (image_id,))
-            row = cursor.fetchone()
-            if row:
-                image_path = row['image_path']
-            else:
-                app.logger.warning(f"Image ID {image_id} not found in database.")
-                abort(404)
-        except sqlite3.Error as e:
-            app.logger.error(f"Database error retrieving path for image ID {image_id}: {e}")
-            abort(500)
-    else:
-        app.logger.error("Database connection unavailable for image serving.")
+    try:
+        row = lookup_row(image_id)
+    except sqlite3.Error as e:
+        app.logger.error(f"Database error retrieving path for image ID {image_id}: {e}")
         abort(500)
+    if row:
+        image_path = row['image_path']
+    else:
+        app.logger.warning(f"Image ID {image_id} not found in database.")
+        abort(404)
     if image_path and os.path.exists(image_path):
         try:
             directory = os.path.dirname(image_path)
@@ -259,6 +1043,55 @@ def serve_image(image_id):
         abort(404)
 
 
+# --- Thumbnail Serving Route ---
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+THUMBNAIL_VERSION_CHARS = 16 # Content hash prefix the frontend puts in ?v=; shorter ones aren't trusted
+
+@app.route('/thumbs/<int:image_id>')
+def serve_thumbnail(image_id):
+    """Serves a thumbnail written by the indexer: /thumbs/<id>?size=<px>&v=<content hash>.
+
+    The ETag is the content hash plus size, so conditional requests are answered with
+    304 without touching the file. Thumbnails are content-addressed and never change;
+    when `v` is the current content hash (or at least its first THUMBNAIL_VERSION_CHARS
+    characters) the response is cacheable forever (immutable),
+    otherwise clients revalidate since a re-indexed file keeps its id. Images without a
+    thumbnail yet redirect to the original.
+    """
+    sizes = config.get("thumbnail_sizes", thumbnails.DEFAULT_THUMBNAIL_SIZES)
+    size = request.args.get('size', type=int) or min(sizes)
+    if size not in sizes:
+        abort(404)
+    try:
+        row = lookup_row(image_id)
+    except sqlite3.Error as e:
+        app.logger.error(f"Database error retrieving content hash for image ID {image_id}: {e}")
+        abort(500)
+    if row is None:
+        abort(404)
+    content_hash = row['content_hash']
+    if not content_hash:
+        return redirect(f"/images/{image_id}")
+    etag = f"{content_hash}-{size}"
+    version = request.args.get('v', '')
+    if len(version) >= THUMBNAIL_VERSION_CHARS and content_hash.startswith(version):
+        cache_control = f"public, max-age={THUMBNAIL_MAX_AGE}, immutable"
+    else:
+        cache_control = "public, no-cache" # Cache, but revalidate (cheap 304)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        path, mimetype = thumbnails.find_thumbnail(
+            config.get("thumbnail_dir", thumbnails.DEFAULT_THUMBNAIL_DIR), content_hash, size)
+        if path is None:
+            return redirect(f"/images/{image_id}")
+        # send_file hands the open file to the server's wsgi.file_wrapper (sendfile under gunicorn)
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=False)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
 # --- Simple HTML Frontend Route (Updated JS for Clickable Images) ---
 @app.route('/', methods=['GET'])
 def index():
@@ -303,6 +1136,7 @@ def index():
                 color: inherit; /* Inherit text color */
             }
             .result-item p { margin: 2px 0; }
+            .result-item .similar-link { color: #3498db; text-decoration: underline; }
             input[type=text] { padding: 10px; width: 300px; margin-right: 5px; }
             button { padding: 10px; }
             .loader { display: none; }
@@ -313,28 +1147,72 @@ def index():
     <body>
         <h1>Meme Search</h1>
         <form id="search-form">
-            <input type="text" id="query" name="q" placeholder="Enter search terms...">
+            <input type="text" id="query" name="q" placeholder="Enter search terms..." list="suggestions" autocomplete="off">
+            <datalist id="suggestions"></datalist>
             <button type="submit">Search</button>
             <div class="loader"></div>
         </form>
         <div id="results"></div>
 
         <script>
+            const THUMB_SIZES = __THUMB_SIZES__;
             const form = document.getElementById('search-form');
             const resultsDiv = document.getElementById('results');
             const loader = form.querySelector('.loader');
+            const SUGGEST_DELAY_MS = 150;
+            const SMALL_THUMB = THUMB_SIZES[0], LARGE_THUMB = THUMB_SIZES[THUMB_SIZES.length - 1];
+            // The content hash makes the thumbnail URL immutable (cached forever by the browser)
+            const thumbUrl = (item, size) => `/thumbs/${item.id}?size=${size}&v=${(item.content_hash || '').substring(0, __THUMB_VERSION_CHARS__)}`;
 
-            form.addEventListener('submit', async (event) => {
+            form.addEventListener('submit', (event) => {
                 event.preventDefault();
                 const query = document.getElementById('query').value;
                 if (!query) return;
+                showResults(`/search?q=${encodeURIComponent(query)}`);
+            });
+
+            // Typeahead: ask /suggest once typing pauses; only the newest request updates the list
+            const queryInput = document.getElementById('query');
+            const suggestionList = document.getElementById('suggestions');
+            let suggestTimer = null, suggestController = null;
+            queryInput.addEventListener('input', (event) => {
+                clearTimeout(suggestTimer);
+                // Picking a suggestion fires 'input' too; don't look up completions of a completion
+                if (event.inputType === 'insertReplacementText' || event.inputType === undefined) return;
+                suggestTimer = setTimeout(async () => {
+                    if (suggestController) suggestController.abort();
+                    suggestController = new AbortController();
+                    try {
+                        const response = await fetch(`/suggest?q=${encodeURIComponent(queryInput.value)}`,
+                                                     { signal: suggestController.signal });
+                        if (!response.ok) return;
+                        const data = await response.json();
+                        suggestionList.replaceChildren(...data.completions.map(completion => {
+                            const option = document.createElement('option');
+                            option.value = completion;
+                            return option;
+                        }));
+                    } catch (error) {
+                        if (error.name !== 'AbortError') console.error('Suggest failed:', error);
+                    }
+                }, SUGGEST_DELAY_MS);
+            });
 
+            // "More like this": neighbors precomputed by the indexer, no query encoding
+            resultsDiv.addEventListener('click', (event) => {
+                const link = event.target.closest('.similar-link');
+                if (!link) return;
+                event.preventDefault();
+                showResults(`/similar/${link.dataset.id}`);
+            });
+
+            async function showResults(url) {
                 resultsDiv.innerHTML = '';
                 loader.style.display = 'inline-block';
                 form.classList.add('loading');
 
                 try {
-                    const response = await fetch(`/search?q=${encodeURIComponent(query)}`);
+                    const response = await fetch(url);
                     if (!response.ok) {
                         let errorMsg = `HTTP error! status: ${response.status}`;
                         try {
@@ -354,12 +1232,13 @@ def index():
                             // *** WRAP IMAGE IN ANCHOR TAG ***
                             div.innerHTML = `
                                 <a href="/images/${item.id}" target="_blank" title="Click to open image in new tab">
-                                    <img src="/images/${item.id}" alt="Meme ${item.id}" loading="lazy">
+                                    <img src="${thumbUrl(item, SMALL_THUMB)}" srcset="${thumbUrl(item, SMALL_THUMB)} 1x, ${thumbUrl(item, LARGE_THUMB)} 2x" alt="Meme ${item.id}" loading="lazy">
                                 </a>
                                 <div>
                                     <p>ID: ${item.id}</p>
-                                    <p>Score: ${item.score.toFixed(4)}</p>
+                                    <p>${item.distance !== undefined ? `Distance: ${item.distance.toFixed(4)}` : `Score: ${item.score.toFixed(4)}`}</p>
                                     <p title="${item.ocr_text || ''}">OCR: ${(item.ocr_text || 'N/A').substring(0, 50)}${ (item.ocr_text && item.ocr_text.length > 50) ? '...' : ''}</p>
+                                    <p><a href="/similar/${item.id}" class="similar-link" data-id="${item.id}">More like this</a></p>
                                 </div>
                             `;
                             // Add error handling for image loading (applies to the img tag inside the link)
@@ -387,11 +1266,12 @@ def index():
                      loader.style.display = 'none';
                      form.classList.remove('loading');
                 }
-            });
+            }
         </script>
     </body>
     </html>
-    """
+    """.replace("__THUMB_SIZES__", json.dumps(sorted(config.get("thumbnail_sizes", thumbnails.DEFAULT_THUMBNAIL_SIZES)))
+                ).replace("__THUMB_VERSION_CHARS__", str(THUMBNAIL_VERSION_CHARS))
 
 # --- Main Execution ---
 # (Main block remains the same)
@@ -404,6 +1284,7 @@ if __name__ == '__main__':
         sys.exit(1)
     if not load_resources():
          sys.exit(1)
+    start_index_watcher()
     server_host = config.get("server", {}).get("host", "127.0.0.1")
     server_port = config.get("server", {}).get("port", 5000)
     debug_mode = args.debug
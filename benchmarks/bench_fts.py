@@ -0,0 +1,88 @@
+"""SQLite read-path latency under concurrent load: FTS keyword search plus metadata hydration.
+
+    python benchmarks/bench_fts.py --size 100000 --concurrency 1 4 16 --output fts.json
+
+Each simulated request runs in its own Flask app context, exactly like /search does:
+get_db(), the FTS query, a metadata query for the top hits, then app-context teardown.
+Nothing else (no model, no Faiss) is involved, so the numbers isolate connection
+handling, pragmas and statement preparation.
+
+The same queries are also sent through a baseline path that reproduces the read path
+before connections were reused: a fresh, untuned connection per request and a metadata
+query with one placeholder per id. Both run against the same corpus, and the p50
+speedup of the current path over the baseline is printed per concurrency level.
+"""
+import os
+import json
+import sqlite3
+import argparse
+import tempfile
+
+import common # noqa: F401 (puts the repo on sys.path)
+from common import write_results
+from bench_search import make_queries, run_load
+from synthetic_corpus import build_search_corpus
+
+def fts_sender(app_module, max_results):
+    def send(query):
+        with app_module.app.app_context():
+            hits = app_module.keyword_search_fts(query)
+            app_module.fetch_metadata(app_module.get_db(), [doc_id for doc_id, _ in hits[:max_results]])
+        return True
+    return send
+
+def baseline_sender(app_module, db_path, max_results):
+    """The read path as it was: connect per request, SQL text varying with the number of ids."""
+    def send(query):
+        with app_module.app.app_context():
+            db = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+            db.row_factory = sqlite3.Row
+            try:
+                cursor = db.execute("SELECT rowid as id, rank FROM memes_fts WHERE memes_fts MATCH ? ORDER BY rank LIMIT ?",
+                                    (query, app_module.config["search_params"]["k_keyword"]))
+                ids = [row['id'] for row in cursor.fetchall()][:max_results]
+                if ids:
+                    placeholders = ','.join('?' * len(ids))
+                    db.execute(f"SELECT id, image_path, ocr_text, content_hash FROM memes WHERE id IN ({placeholders})",
+                               ids).fetchall()
+            finally:
+                db.close()
+        return True
+    return send
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FTS + hydration latency against SQLite.")
+    parser.add_argument("--size", type=int, default=100000, help="Corpus size in memes (default: 100000)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per concurrent worker (default: 500)")
+    parser.add_argument("--queries", type=int, default=1000, help="Distinct queries to cycle through")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    import app as app_module
+    app_module.app.logger.disabled = True # Per-query info logging would dominate the timings
+    queries = make_queries(args.queries)
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"Building synthetic corpus with {args.size} memes...")
+        corpus_config = build_search_corpus(os.path.join(work_dir, "corpus"), args.size, dim=8)
+        with open(os.path.join(common.REPO_DIR, "config.json")) as f:
+            config = json.load(f)
+        config.update(corpus_config)
+        config_path = os.path.join(work_dir, "config.json")
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+        if not app_module.load_config(config_path):
+            raise SystemExit("Failed to load the benchmark config")
+        max_results = config["search_params"]["max_results"]
+        senders = {"baseline": baseline_sender(app_module, config["database_file"], max_results),
+                   "current": fts_sender(app_module, max_results)}
+        runs = {}
+        for name, send in senders.items():
+            print(f"{name}:")
+            send(queries[0]) # Warm up
+            runs[name] = [run_load(send, queries, c, args.requests) for c in args.concurrency]
+    print("baseline -> current:")
+    for before, after in zip(runs["baseline"], runs["current"]):
+        print(f"  concurrency {after['concurrency']:>3}: p50 {before['p50_ms']:.2f} -> {after['p50_ms']:.2f} ms "
+              f"({before['p50_ms'] / after['p50_ms']:.2f}x), QPS {before['qps']:.1f} -> {after['qps']:.1f}")
+    write_results(args.output, "fts", vars(args), runs)
@@ -0,0 +1,106 @@
+"""Startup time and per-worker memory of Faiss index loading, in-memory vs. mmap.
+
+Mimics the prefork server: the parent loads the indices, forks N workers, and each
+worker runs searches that touch the whole index. A second scenario loads the index in
+each worker after the fork, which is what a hot reload (new index generation) does.
+Reports load time and per-worker RSS/PSS (PSS divides shared pages between the
+processes that map them).
+
+    python benchmarks/bench_index_loading.py --vectors 200000 --workers 4 --output load.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import index_store
+from app import process_memory
+
+def build_synthetic_index(path, n_vectors, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+    for start in range(0, n_vectors, 100000):
+        count = min(100000, n_vectors - start)
+        index.add_with_ids(rng.standard_normal((count, dim), dtype=np.float32),
+                           np.arange(start, start + count, dtype=np.int64))
+    faiss.write_index(index, path)
+
+def measure(index_path, load_mode, n_workers, n_queries, dim, load_in_worker=False):
+    start = time.time()
+    index = None if load_in_worker else index_store.read_index(index_path, load_mode)
+    load_seconds = time.time() - start
+    parent_memory = process_memory()
+
+    # Workers report memory only once all of them have touched the index, so shared
+    # pages are split across every worker in the PSS figures.
+    ready_read, ready_write = os.pipe()
+    go_read, go_write = os.pipe()
+    result_read, result_write = os.pipe()
+    children = []
+    for _ in range(n_workers):
+        pid = os.fork()
+        if pid == 0:
+            worker_load_seconds = 0.0
+            if load_in_worker:
+                worker_start = time.time()
+                index = index_store.read_index(index_path, load_mode)
+                worker_load_seconds = time.time() - worker_start
+            queries = np.random.default_rng(os.getpid()).standard_normal((n_queries, dim), dtype=np.float32)
+            index.search(queries, 10) # Brute force touches every page of the index
+            os.write(ready_write, b"r")
+            os.read(go_read, 1)
+            os.write(result_write, (json.dumps(dict(process_memory(), load_seconds=worker_load_seconds)) + "\n").encode())
+            os._exit(0)
+        children.append(pid)
+    for _ in range(n_workers):
+        os.read(ready_read, 1)
+    os.write(go_write, b"g" * n_workers)
+    for fd in (ready_read, ready_write, go_read, go_write, result_write):
+        os.close(fd)
+    with os.fdopen(result_read) as pipe:
+        worker_memory = [json.loads(line) for line in pipe]
+    for pid in children:
+        os.waitpid(pid, 0)
+    return {
+        "load_mode": load_mode,
+        "scenario": "reload_in_worker" if load_in_worker else "preload_then_fork",
+        "load_seconds": max([load_seconds] + [m["load_seconds"] for m in worker_memory]),
+        "parent": parent_memory,
+        "workers": worker_memory,
+        "mean_worker_pss_mb": float(np.mean([m.get("pss_mb", 0) for m in worker_memory])),
+        "mean_worker_rss_anon_mb": float(np.mean([m.get("rss_anon_mb", 0) for m in worker_memory])),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", help="Existing index file to load (default: build a synthetic flat index)")
+    parser.add_argument("--vectors", type=int, default=200000, help="Synthetic index size (default: 200000)")
+    parser.add_argument("--dim", type=int, default=512, help="Synthetic vector dimension (default: 512)")
+    parser.add_argument("--workers", type=int, default=4, help="Forked workers (default: 4)")
+    parser.add_argument("--queries", type=int, default=8, help="Searches per worker (default: 8)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index_path = args.index
+        if not index_path:
+            index_path = os.path.join(temp_dir, "synthetic.faiss")
+            print(f"Building synthetic index with {args.vectors} x {args.dim} vectors...")
+            build_synthetic_index(index_path, args.vectors, args.dim)
+        dim = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY).d
+        results = {"index_bytes": os.path.getsize(index_path), "workers": args.workers,
+                   "vectors": faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY).ntotal,
+                   "runs": [measure(index_path, mode, args.workers, args.queries, dim, load_in_worker)
+                            for load_in_worker in (False, True) for mode in ("memory", "mmap")]}
+
+    for run in results["runs"]:
+        print(f"{run['scenario']:>17} {run['load_mode']:>6}: load {run['load_seconds']:.3f}s, "
+              f"worker PSS {run['mean_worker_pss_mb']:.0f} MB, worker private (anon) {run['mean_worker_rss_anon_mb']:.0f} MB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,88 @@
+"""Indexer throughput (images/sec) per stage and end to end, with fake models.
+
+    python benchmarks/bench_indexer.py --count 2000 --batch-size 32 --output indexer.json
+
+Stages are timed in isolation over the same synthetic corpus: fingerprinting (stat +
+SHA-256), decoding, thumbnailing, OCR and batched embedding, followed by a full
+index_directory run (which also writes thumbnails) and a --rebuild of the same directory,
+where every file is served from the embedding cache.
+--ocr-ms/--embed-ms add a fixed per-item delay to approximate real model cost.
+"""
+import os
+import time
+import argparse
+import tempfile
+
+import common # noqa: F401 (puts the repo on sys.path)
+from common import write_results
+from fakes import FakeEmbedder, FakeOCRReader, install_indexer_fakes
+from synthetic_corpus import generate_images
+import index_memes
+import thumbnails
+
+def decode(path):
+    img = index_memes.load_image(path)
+    if img is not None:
+        img.load() # PIL decodes lazily; force the pixel data like the embedder would
+
+def time_stage(name, func, items, batch_size=1):
+    start = time.perf_counter()
+    for offset in range(0, len(items), batch_size):
+        func(items[offset:offset + batch_size] if batch_size > 1 else items[offset])
+    seconds = time.perf_counter() - start
+    print(f"{name:>12}: {len(items) / seconds:10.1f} images/sec")
+    return {"stage": name, "seconds": seconds, "images_per_sec": len(items) / seconds}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark indexing throughput with deterministic fake models.")
+    parser.add_argument("--count", type=int, default=1000, help="Synthetic images to generate (default: 1000)")
+    parser.add_argument("--image-dir", help="Use an existing directory of images instead")
+    parser.add_argument("--size", type=int, default=512, help="Synthetic image side in pixels (default: 512)")
+    parser.add_argument("--batch-size", type=int, default=index_memes.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--embed-workers", type=int, default=1)
+    parser.add_argument("--ocr-ms", type=float, default=0.0, help="Simulated OCR cost per image")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="Simulated embedding cost per item")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    embedder = FakeEmbedder(seconds_per_item=args.embed_ms / 1000.0)
+    reader = FakeOCRReader(seconds_per_image=args.ocr_ms / 1000.0)
+    install_indexer_fakes(index_memes, embedder, reader)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        image_dir = args.image_dir
+        if not image_dir:
+            image_dir = os.path.join(work_dir, "memes")
+            print(f"Generating {args.count} synthetic images...")
+            generate_images(image_dir, args.count, (args.size, args.size))
+        paths = sorted(os.path.join(image_dir, f) for f in os.listdir(image_dir)
+                       if f.lower().endswith(index_memes.SUPPORTED_EXTENSIONS))
+        reader.learn(paths)
+        ocr_texts = [index_memes.extract_ocr_text(path, reader) for path in paths]
+        content_hashes = {path: index_memes.file_fingerprint(path)[2] for path in paths}
+        thumb_dir = os.path.join(work_dir, "thumbs-stage")
+
+        stages = [
+            time_stage("fingerprint", index_memes.file_fingerprint, paths),
+            time_stage("decode", decode, paths),
+            time_stage("thumbnail", lambda path: thumbnails.make_thumbnails(path, content_hashes[path], thumb_dir),
+                       paths),
+            time_stage("ocr", lambda path: index_memes.extract_ocr_text(path, reader), paths),
+            time_stage("embed", lambda batch: index_memes.generate_embeddings(
+                batch, ocr_texts[:len(batch)], embedder, args.batch_size), paths, args.batch_size),
+        ]
+
+        output_dir = os.path.join(work_dir, "index")
+        os.makedirs(output_dir)
+        for stage, rebuild in (("end_to_end", False), ("cached_rebuild", True)):
+            start = time.perf_counter()
+            index_memes.index_directory(image_dir, os.path.join(output_dir, "memes.db"),
+                                        os.path.join(output_dir, "images.faiss"), os.path.join(output_dir, "text.faiss"),
+                                        batch_size=args.batch_size, ocr_workers=0, embed_workers=args.embed_workers,
+                                        rebuild=rebuild, thumb_dir=os.path.join(output_dir, "thumbs"),
+                                        cache_dir=os.path.join(output_dir, "cache"))
+            seconds = time.perf_counter() - start
+            stages.append({"stage": stage, "seconds": seconds, "images_per_sec": len(paths) / seconds})
+            print(f"{stage:>14}: {len(paths) / seconds:10.1f} images/sec")
+
+    write_results(args.output, "indexer", dict(vars(args), images=len(paths)), stages)
@@ -0,0 +1,99 @@
+"""Neighbor graph: build and incremental-update time, update quality and lookup latency.
+
+    python benchmarks/bench_neighbors.py --vectors 100000 --added 1000 --output neighbors.json
+
+Builds the graph of a synthetic clustered corpus (memes in a cluster are variants of one
+picture), adds --added vectors and removes --removed, then reports:
+  - build and update seconds, and the graph's size on disk,
+  - agreement: the share of neighbor list entries the updated graph has in common with a
+    full rebuild (1.0 means the update is exact),
+  - lookup latency of a row of the memory-mapped graph, against the Faiss search /similar
+    would otherwise run for the same meme.
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+
+import common # noqa: F401 (puts the repo on sys.path)
+from common import percentiles, write_results
+import index_store
+import neighbor_graph
+
+def clustered_vectors(count, dim, clusters, rng):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.3 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def timed_lookups(func, ids):
+    samples = []
+    for node_id in ids.tolist():
+        start = time.perf_counter()
+        func(node_id)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark neighbor graph builds, updates and lookups.")
+    parser.add_argument("--vectors", type=int, default=100000, help="Vectors in the initial index (default: 100000)")
+    parser.add_argument("--added", type=int, default=1000, help="Vectors added before the update (default: 1000)")
+    parser.add_argument("--removed", type=int, default=200, help="Vectors removed before the update (default: 200)")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--k", type=int, default=neighbor_graph.DEFAULT_K)
+    parser.add_argument("--index-factory", default="Flat")
+    parser.add_argument("--lookups", type=int, default=2000, help="Timed lookups (default: 2000)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(args.vectors + args.added, args.dim, max(1, args.vectors // 20), rng)
+    ids = np.arange(1, len(vectors) + 1, dtype=np.int64)
+    index = index_store.create_index(args.index_factory, args.dim)
+    index_store.train_index(index, vectors[:args.vectors])
+    index.add_with_ids(vectors[:args.vectors], ids[:args.vectors])
+
+    start = time.perf_counter()
+    graph = neighbor_graph.build(index, args.k)
+    build_seconds = time.perf_counter() - start
+    print(f"Built graph of {args.vectors} vectors (k={args.k}) in {build_seconds:.2f}s "
+          f"({args.vectors / build_seconds:.0f} vectors/sec)")
+
+    removed = rng.choice(ids[:args.vectors], args.removed, replace=False)
+    index_store.remove_ids(index, removed)
+    index.add_with_ids(vectors[args.vectors:], ids[args.vectors:])
+    start = time.perf_counter()
+    updated = neighbor_graph.update(graph, index, ids[args.vectors:], removed, args.k)
+    update_seconds = time.perf_counter() - start
+    print(f"Updated it for {args.added} added and {args.removed} removed vectors in {update_seconds:.2f}s")
+    full = neighbor_graph.build(index, args.k)
+    present = index_store.index_ids(index)
+    agreement = float(np.mean([len(set(a) & set(b)) for a, b in zip(updated.neighbors[present].tolist(),
+                                                                       full.neighbors[present].tolist())]) / args.k)
+    print(f"Agreement with a full rebuild: {agreement:.4f}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = {}
+        for name, write_func in updated.write_funcs().items():
+            paths[name] = os.path.join(work_dir, f"{name}.npy")
+            write_func(paths[name])
+        disk_mb = sum(os.path.getsize(path) for path in paths.values()) / 2**20
+        mapped = neighbor_graph.NeighborGraph(np.load(paths["neighbor_ids"], mmap_mode='r'),
+                                              np.load(paths["neighbor_distances"], mmap_mode='r'), updated.info)
+        query_ids = rng.choice(present, args.lookups)
+        query_vectors = index_store.reconstruct_ids(index, query_ids)
+        lookup = timed_lookups(mapped.lookup, query_ids)
+        positions = {int(node_id): row for row, node_id in enumerate(query_ids.tolist())}
+        search = timed_lookups(lambda node_id: index.search(query_vectors[positions[node_id]:positions[node_id] + 1],
+                                                            args.k + 1), query_ids)
+    print(f"Graph: {disk_mb:.1f} MB on disk. Lookup p50 {lookup['p50_ms']:.4f} ms, p99 {lookup['p99_ms']:.4f} ms; "
+          f"Faiss search p50 {search['p50_ms']:.3f} ms, p99 {search['p99_ms']:.3f} ms")
+
+    write_results(args.output, "neighbor_graph", vars(args), {
+        "build_seconds": build_seconds,
+        "update_seconds": update_seconds,
+        "agreement": agreement,
+        "disk_mb": disk_mb,
+        "lookup": lookup,
+        "faiss_search": search,
+    })
@@ -0,0 +1,117 @@
+"""OCR preprocessing: images/sec and OCR-text agreement with reading the files directly.
+
+    python benchmarks/bench_ocr.py --count 300 --size 2048
+    python benchmarks/bench_ocr.py --real-ocr --image-dir memes/ --output ocr.json
+
+Every image goes through the reader twice: the old way (reader.readtext on the file
+path) and through ocr_preprocess.read_text with the given settings. The script reports
+images/sec for both and how many images the text gate skipped. It also reports how well
+the texts agree:
+  - mean similarity: difflib ratio of the normalized texts, 1.0 when both are empty,
+  - identical: the share of images whose two texts are the same,
+  - lost: images that had text before and have none now,
+  - extra: images with words the old way missed (usually later frames of animations).
+The default corpus mixes captioned images, text-free images and animated GIFs, and is
+read by FakeOCRReader, whose cost grows with pixel count (--ocr-ms-per-mpx). Agreement
+numbers that matter come from --real-ocr (EasyOCR) on a directory of real memes.
+"""
+import os
+import time
+import argparse
+import tempfile
+import difflib
+from PIL import Image
+
+import common # noqa: F401 (puts the repo on sys.path)
+from common import write_results
+from fakes import FakeOCRReader
+from synthetic_corpus import generate_images, generate_textless_images, generate_animations
+import ocr_preprocess
+import index_memes
+
+def normalized(text):
+    return " ".join(text.split()).casefold()
+
+def similarity(a, b):
+    return 1.0 if not a and not b else difflib.SequenceMatcher(None, a, b).ratio()
+
+def read_all(name, func, paths):
+    """Runs func on every path; returns (normalized texts, stage result)."""
+    texts = []
+    start = time.perf_counter()
+    for path in paths:
+        texts.append(normalized(func(path)))
+    seconds = time.perf_counter() - start
+    print(f"{name:>12}: {len(paths) / seconds:10.1f} images/sec")
+    return texts, {"stage": name, "seconds": seconds, "images_per_sec": len(paths) / seconds}
+
+def gated(path, settings):
+    """Whether the text gate skips every sampled frame of an image."""
+    with Image.open(path) as img:
+        frames = ocr_preprocess.sample_frames(img, settings.max_frames)
+    return all(ocr_preprocess.edge_density(frame) < settings.min_edge_density for frame in frames)
+
+if __name__ == "__main__":
+    defaults = ocr_preprocess.DEFAULT_SETTINGS
+    parser = argparse.ArgumentParser(description="Compare preprocessed OCR with reading image files directly.")
+    parser.add_argument("--image-dir", help="Use an existing directory of images instead of a synthetic corpus")
+    parser.add_argument("--count", type=int, default=200, help="Synthetic captioned images (default: 200)")
+    parser.add_argument("--textless", type=int, default=50, help="Synthetic text-free images (default: 50)")
+    parser.add_argument("--animations", type=int, default=20, help="Synthetic animated GIFs (default: 20)")
+    parser.add_argument("--size", type=int, default=2048, help="Synthetic image side in pixels (default: 2048)")
+    parser.add_argument("--ocr-ms-per-mpx", type=float, default=300.0,
+                        help="Simulated OCR cost per megapixel for the fake reader (default: 300, a rough CPU "
+                             "figure for EasyOCR; measure the real one with --real-ocr)")
+    parser.add_argument("--real-ocr", action="store_true", help="Use EasyOCR instead of the fake reader")
+    parser.add_argument("--languages", default=",".join(index_memes.OCR_LANGUAGES),
+                        help="EasyOCR languages with --real-ocr (comma-separated)")
+    parser.add_argument("--max-side", type=int, default=defaults.max_side)
+    parser.add_argument("--min-edge-density", type=float, default=defaults.min_edge_density)
+    parser.add_argument("--max-frames", type=int, default=defaults.max_frames)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    settings = ocr_preprocess.OCRSettings(args.max_side, args.min_edge_density, args.max_frames)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.real_ocr:
+            import easyocr
+            reader = easyocr.Reader(args.languages.split(","), verbose=False)
+        else:
+            reader = FakeOCRReader(seconds_per_megapixel=args.ocr_ms_per_mpx / 1000.0)
+        if args.image_dir:
+            paths = sorted(os.path.join(args.image_dir, f) for f in os.listdir(args.image_dir)
+                           if f.lower().endswith(index_memes.SUPPORTED_EXTENSIONS))
+        else:
+            image_dir = os.path.join(work_dir, "memes")
+            print(f"Generating {args.count} captioned, {args.textless} text-free and "
+                  f"{args.animations} animated images ({args.size}px)...")
+            captioned = generate_images(image_dir, args.count, (args.size, args.size))
+            frames = generate_images(os.path.join(work_dir, "frames"), args.animations * 3, (args.size // 4, args.size // 4),
+                                     seed=1)
+            paths = (captioned + generate_textless_images(image_dir, args.textless, (args.size, args.size))
+                     + generate_animations(image_dir, frames))
+            if not args.real_ocr:
+                reader.learn(captioned + frames)
+        if args.real_ocr:
+            index_memes.extract_ocr_text(paths[0], reader, settings) # Warm up before timing
+
+        before, before_stage = read_all("file_path", lambda path: " ".join(
+            reader.readtext(path, detail=0, paragraph=True)), paths)
+        after, after_stage = read_all("preprocessed", lambda path: index_memes.extract_ocr_text(path, reader, settings), paths)
+        skipped = sum(gated(path, settings) for path in paths)
+
+    similarities = [similarity(old, new) for old, new in zip(before, after)]
+    results = {
+        "images": len(paths),
+        "stages": [before_stage, after_stage],
+        "speedup": before_stage["seconds"] / after_stage["seconds"],
+        "gated": skipped,
+        "similarity_mean": sum(similarities) / len(similarities),
+        "identical": sum(old == new for old, new in zip(before, after)) / len(paths),
+        "lost": sum(bool(old) and not new for old, new in zip(before, after)),
+        "extra": sum(bool(set(new.split()) - set(old.split())) for old, new in zip(before, after)),
+    }
+    print(f"Speedup {results['speedup']:.2f}x; text gate skipped {results['gated']} of {len(paths)} images")
+    print(f"Agreement: mean similarity {results['similarity_mean']:.3f}, {results['identical']:.1%} identical, "
+          f"{results['lost']} lost their text, {results['extra']} gained words")
+    write_results(args.output, "ocr_preprocessing", dict(vars(args), images=len(paths)), results)
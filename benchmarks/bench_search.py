@@ -0,0 +1,132 @@
+"""Search latency (p50/p95/p99) and throughput at several concurrency levels and corpus sizes.
+
+    python benchmarks/bench_search.py --sizes 10000 100000 1000000 --concurrency 1 4 16 --output search.json
+    python benchmarks/bench_search.py --url http://127.0.0.1:5000 --concurrency 1 8 32
+
+Without --url, a synthetic corpus is built for each size and /search is driven through
+Flask's test client with the fake embedder (no network, no model download). With --url,
+a running server is load-tested over HTTP instead. The result cache is disabled unless
+--result-cache is given, so repeated queries still measure the full search path.
+--no-metadata-store hydrates results from SQLite instead of the in-memory store; the
+store's memory per million memes is recorded with each corpus size.
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+import numpy as np
+
+import common # noqa: F401 (puts the repo on sys.path)
+from common import percentiles, write_results
+from fakes import FakeEmbedder, install_app_fakes, DEFAULT_DIM
+from synthetic_corpus import build_search_corpus, random_caption
+
+def make_queries(count, seed=1):
+    rng = np.random.default_rng(seed)
+    return [random_caption(rng, 1, 4) for _ in range(count)]
+
+def run_load(send, queries, concurrency, requests_per_worker):
+    """Runs `concurrency` threads issuing requests back to back. Returns latency stats."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        local, failed = [], 0
+        for i in range(requests_per_worker):
+            query = queries[(worker_id * requests_per_worker + i) % len(queries)]
+            start = time.perf_counter()
+            ok = send(query)
+            local.append(time.perf_counter() - start)
+            failed += 0 if ok else 1
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    stats = {"concurrency": concurrency, "requests": len(latencies), "errors": sum(errors),
+             "qps": len(latencies) / wall, "mean_ms": 1000.0 * sum(latencies) / len(latencies)}
+    stats.update(percentiles(latencies))
+    print(f"  concurrency {concurrency:>3}: {stats['qps']:8.1f} QPS, p50 {stats['p50_ms']:.2f} ms, "
+          f"p95 {stats['p95_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms, errors {stats['errors']}")
+    return stats
+
+def flask_sender(app_module):
+    client_local = threading.local()
+
+    def send(query):
+        client = getattr(client_local, "client", None)
+        if client is None:
+            client = client_local.client = app_module.app.test_client()
+        return client.get("/search", query_string={"q": query}).status_code == 200
+    return send
+
+def http_sender(base_url):
+    def send(query):
+        url = f"{base_url.rstrip('/')}/search?{urllib.parse.urlencode({'q': query})}"
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+                return response.status == 200
+        except OSError:
+            return False
+    return send
+
+def bench_corpus_size(size, args, queries, work_dir):
+    import app as app_module
+    print(f"Building synthetic corpus with {size} vectors ({args.index_factory})...")
+    corpus_config = build_search_corpus(os.path.join(work_dir, f"corpus_{size}"), size, args.dim,
+                                        args.index_factory)
+    with open(os.path.join(os.path.dirname(common.__file__), "..", "config.json")) as f:
+        config = json.load(f)
+    config.update(corpus_config)
+    config["result_cache"] = {"backend": "memory" if args.result_cache else "none"}
+    config["server"]["reload_interval"] = 0
+    config["metadata_store"] = dict(config.get("metadata_store", {}), enabled=not args.no_metadata_store)
+    config_path = os.path.join(work_dir, f"config_{size}.json")
+    with open(config_path, 'w') as f:
+        json.dump(config, f)
+    install_app_fakes(app_module, FakeEmbedder(args.dim, seconds_per_item=args.encode_ms / 1000.0))
+    app_module.app.logger.disabled = True # Per-request info logging would dominate the timings
+    if not (app_module.load_config(config_path) and app_module.load_resources()):
+        raise SystemExit("Failed to load the synthetic corpus")
+    send = flask_sender(app_module)
+    send(queries[0]) # Warm up
+    store = app_module.current_metadata()
+    return {"corpus_size": size, "metadata_store": store.stats() if store is not None else None,
+            "runs": [run_load(send, queries, c, args.requests) for c in args.concurrency]}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /search latency and throughput.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                        help="Corpus sizes in vectors (default: 10000 100000; 1000000 needs ~4 GB)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrent worker (default: 200)")
+    parser.add_argument("--queries", type=int, default=1000, help="Distinct queries to cycle through")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--index-factory", default="Flat")
+    parser.add_argument("--encode-ms", type=float, default=0.0, help="Simulated query encoding cost")
+    parser.add_argument("--result-cache", action="store_true", help="Keep the result cache enabled")
+    parser.add_argument("--no-metadata-store", action="store_true", help="Hydrate results from SQLite")
+    parser.add_argument("--url", help="Load-test a running server instead of an in-process synthetic corpus")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    queries = make_queries(args.queries)
+    if args.url:
+        print(f"Load testing {args.url}...")
+        results = [{"url": args.url,
+                    "runs": [run_load(http_sender(args.url), queries, c, args.requests) for c in args.concurrency]}]
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = [bench_corpus_size(size, args, queries, work_dir) for size in args.sizes]
+    write_results(args.output, "search", vars(args), results)
@@ -0,0 +1,115 @@
+"""Accuracy check for approximate query encoders: top-k overlap against the reference model.
+
+    python benchmarks/check_encoder.py --config config.json --backend clip_text_int8
+    python benchmarks/check_encoder.py --backend onnx --queries queries.txt --min-overlap 0.95
+
+Both encoders embed the same sample queries (one per line from --queries, else short
+snippets of OCR text sampled from the database) and search the published indices. For
+each index it reports the mean and worst overlap of the two top-k id sets, the cosine
+similarity of the embeddings and per-query encode latency. Exits with status 1 if the
+mean overlap or cosine similarity fall below their thresholds.
+"""
+import os
+import sys
+import time
+import sqlite3
+import urllib.parse
+import argparse
+import numpy as np
+
+import common # noqa: F401 (puts the repo on sys.path)
+from common import percentiles, write_results
+
+def sample_queries(db_file, count, words=6):
+    """The first few words of randomly chosen OCR texts: realistic, in-corpus queries."""
+    conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(db_file))}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT ocr_text FROM memes WHERE ocr_text != '' ORDER BY random() LIMIT ?", (count,)).fetchall()
+    finally:
+        conn.close()
+    return [" ".join(text.split()[:words]) for text, in rows]
+
+def encode_each(encoder, queries):
+    """Encodes one query at a time, like the server; returns (embeddings, per-query seconds)."""
+    embeddings, seconds = [], []
+    for query in queries:
+        start = time.perf_counter()
+        embeddings.append(encoder.encode(query))
+        seconds.append(time.perf_counter() - start)
+    return np.vstack(embeddings).astype(np.float32), seconds
+
+def topk_overlap(index, reference, candidate, k):
+    """Per-query |top-k(reference) & top-k(candidate)| / k on one Faiss index."""
+    _, reference_ids = index.search(reference, k)
+    _, candidate_ids = index.search(candidate, k)
+    overlaps = []
+    for expected, actual in zip(reference_ids, candidate_ids):
+        expected = set(expected[expected != -1].tolist())
+        if expected:
+            overlaps.append(len(expected & set(actual[actual != -1].tolist())) / len(expected))
+    return overlaps
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a query encoder backend with the reference model.")
+    parser.add_argument("--config", default="config.json", help="Server config (indices, database, encoder)")
+    parser.add_argument("--backend", help="Backend to check (default: the configured one)")
+    parser.add_argument("--reference-backend", default="sentence_transformers",
+                        help="Backend the indices were built with (default: sentence_transformers)")
+    parser.add_argument("--queries", help="File with one query per line (default: sampled from the database)")
+    parser.add_argument("--sample", type=int, default=200, help="Queries to sample from the database (default: 200)")
+    parser.add_argument("--k", type=int, default=10, help="Top-k to compare (default: 10)")
+    parser.add_argument("--min-overlap", type=float, default=0.9, help="Minimum mean top-k overlap (default: 0.9)")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Minimum mean cosine similarity (default: 0.99)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    import app as app_module
+    import text_encoder
+    if not app_module.load_config(args.config):
+        sys.exit(1)
+    config = app_module.config
+    config["metadata_store"] = {"enabled": False} # Only the indices are needed
+    image_index, text_index, generation, _, _ = app_module.load_indices()
+
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = sample_queries(config["database_file"], args.sample) + text_encoder.WARMUP_QUERIES
+    encoder_config = dict(config.get("text_encoder", {}), warmup=False)
+    candidate_backend = args.backend or encoder_config.get("backend", text_encoder.DEFAULT_BACKEND)
+    print(f"Comparing {candidate_backend} with {args.reference_backend} on {len(queries)} queries "
+          f"(index generation {generation}, k={args.k})")
+
+    encoded = {}
+    latency = {}
+    for role, backend in (("reference", args.reference_backend), ("candidate", candidate_backend)):
+        encoder = text_encoder.load_text_encoder(config["embedding_model"], dict(encoder_config, backend=backend), "cpu")
+        text_encoder.warm_up(encoder)
+        encoded[role], seconds = encode_each(encoder, queries)
+        latency[role] = percentiles(seconds)
+        print(f"{role:>10} ({backend}): encode p50 {latency[role]['p50_ms']:.1f} ms, p95 {latency[role]['p95_ms']:.1f} ms")
+        del encoder
+
+    reference, candidate = encoded["reference"], encoded["candidate"]
+    cosine = np.sum(reference * candidate, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1) + 1e-12)
+    results = {"queries": len(queries), "generation": generation, "latency": latency,
+               "cosine_mean": float(cosine.mean()), "cosine_min": float(cosine.min()), "indices": {}}
+    ok = results["cosine_mean"] >= args.min_cosine
+    print(f"{'cosine':>10}: mean {results['cosine_mean']:.4f}, min {results['cosine_min']:.4f}")
+    for name, index in (("image", image_index), ("text", text_index)):
+        if index is None:
+            continue
+        overlaps = topk_overlap(index, reference, candidate, args.k)
+        mean_overlap = float(np.mean(overlaps)) if overlaps else 1.0
+        results["indices"][name] = {"overlap_mean": mean_overlap, "overlap_min": min(overlaps, default=1.0)}
+        ok = ok and mean_overlap >= args.min_overlap
+        print(f"{name:>10}: top-{args.k} overlap mean {mean_overlap:.3f}, min {min(overlaps, default=1.0):.3f}")
+    results["ok"] = ok
+
+    write_results(args.output, "encoder_overlap", vars(args), results)
+    if not ok:
+        print(f"FAILED: {candidate_backend} drifts too far from {args.reference_backend} "
+              f"(thresholds: overlap {args.min_overlap}, cosine {args.min_cosine})")
+        sys.exit(1)
@@ -0,0 +1,125 @@
+"""Startup regression check: import time, cold start and RSS of both entry points against budgets.
+
+    python benchmarks/check_startup.py                       # configured encoder, default budgets
+    python benchmarks/check_startup.py --fake                # no model: only this project's own startup
+
+Every measurement runs in a fresh interpreter:
+  - indexer_help: wall time of `index_memes.py --help` (must not load or import models),
+  - app_import: `import app` (must not import torch),
+  - server_cold_start: import + load_config + load_resources on a small synthetic corpus,
+    and the server's RSS once it is ready.
+By default the server loads the encoder configured in config.json, so the model must be
+downloaded already (the first run fetches it, which the budget doesn't allow for). --fake
+swaps in a FakeEmbedder for machines without the models: that checks what this project
+adds to startup (imports, index loading), but its cold start and RSS leave out the model,
+so they are much lower than in production and get tighter default budgets.
+Exits with status 1 if any budget is exceeded, so it can gate CI.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import common
+from common import write_results
+from synthetic_corpus import build_search_corpus
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+# Default cold start (s) and RSS (MB) budgets with the real and the fake encoder
+DEFAULT_BUDGETS = {"real": (20.0, 1200.0), "fake": (5.0, 300.0)}
+
+CHILD_IMPORT = """
+import sys, time, json
+start = time.perf_counter()
+import app
+print(json.dumps({"seconds": time.perf_counter() - start, "torch_imported": "torch" in sys.modules}))
+"""
+
+CHILD_SERVER = """
+import sys, time, json
+start = time.perf_counter()
+import app
+import_seconds = time.perf_counter() - start
+if not {real_encoder}:
+    from fakes import FakeEmbedder, install_app_fakes
+    install_app_fakes(app, FakeEmbedder())
+if not (app.load_config({config_path!r}) and app.load_resources()):
+    sys.exit(1)
+print(json.dumps({{"import_s": import_seconds, "seconds": time.perf_counter() - start,
+                  "rss_mb": app.process_memory().get("rss_mb"), "startup": app.startup_report}}))
+"""
+
+def run_child(args, label):
+    """Runs a child interpreter and returns (wall seconds, JSON it printed last or None)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([common.REPO_DIR, BENCH_DIR, os.environ.get("PYTHONPATH", "")]))
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable] + args, cwd=common.REPO_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise SystemExit(f"{label} failed:\n{completed.stdout}\n{completed.stderr}")
+    lines = completed.stdout.strip().splitlines()
+    try:
+        return wall, json.loads(lines[-1]) if lines else None
+    except ValueError:
+        return wall, None
+
+def check(results, name, value, budget, unit):
+    ok = value <= budget
+    results.append({"check": name, "value": value, "budget": budget, "unit": unit, "ok": ok})
+    print(f"{name:>24}: {value:8.2f} {unit:<2} (budget {budget:.2f}) {'ok' if ok else 'OVER BUDGET'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if startup time or memory exceed their budgets.")
+    parser.add_argument("--fake", action="store_true",
+                        help="Use a fake encoder instead of the one configured in config.json (not representative)")
+    parser.add_argument("--corpus-size", type=int, default=10000)
+    parser.add_argument("--max-help-s", type=float, default=2.0, help="Budget for index_memes.py --help")
+    parser.add_argument("--max-import-s", type=float, default=2.0, help="Budget for `import app`")
+    parser.add_argument("--max-cold-start-s", type=float,
+                        help="Budget for import + load_resources (default: 20, or 5 with --fake)")
+    parser.add_argument("--max-rss-mb", type=float,
+                        help="Budget for server RSS when ready (default: 1200, or 300 with --fake)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    encoder = "fake" if args.fake else "real"
+    default_cold_start, default_rss = DEFAULT_BUDGETS[encoder]
+    args.max_cold_start_s = default_cold_start if args.max_cold_start_s is None else args.max_cold_start_s
+    args.max_rss_mb = default_rss if args.max_rss_mb is None else args.max_rss_mb
+    if args.fake:
+        print("Using a fake encoder: cold start and RSS leave out the model and are not representative of production.")
+
+    results = []
+    help_seconds, _ = run_child([os.path.join(common.REPO_DIR, "index_memes.py"), "--help"], "index_memes.py --help")
+    check(results, "indexer_help", help_seconds, args.max_help_s, "s")
+
+    _, imported = run_child(["-c", CHILD_IMPORT], "import app")
+    check(results, "app_import", imported["seconds"], args.max_import_s, "s")
+    if imported["torch_imported"]:
+        results.append({"check": "app_import_without_torch", "ok": False})
+        print(f"{'app_import_without_torch':>24}: importing app imported torch")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_config = build_search_corpus(os.path.join(work_dir, "corpus"), args.corpus_size)
+        with open(os.path.join(common.REPO_DIR, "config.json")) as f:
+            config = json.load(f)
+        configured_model = config["embedding_model"]
+        config.update(corpus_config)
+        if not args.fake:
+            config["embedding_model"] = configured_model # The corpus config names the fake one
+        config["server"]["reload_interval"] = 0
+        config_path = os.path.join(work_dir, "config.json")
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+        _, server = run_child(["-c", CHILD_SERVER.format(real_encoder=not args.fake, config_path=config_path)],
+                              "server cold start")
+    check(results, "server_cold_start", server["seconds"], args.max_cold_start_s, "s")
+    check(results, "server_rss", server["rss_mb"], args.max_rss_mb, "MB")
+    print(f"Startup phases ({encoder} encoder): {server['startup']}")
+
+    write_results(args.output, "startup", vars(args), {"encoder": encoder, "representative": not args.fake,
+                                                         "checks": results, "server_startup": server["startup"]})
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
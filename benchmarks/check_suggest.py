@@ -0,0 +1,73 @@
+"""Typeahead latency check: /suggest p50/p95/p99 against budgets, keystroke by keystroke.
+
+    python benchmarks/check_suggest.py                        # 100k memes, default budgets
+    python benchmarks/check_suggest.py --size 1000000 --max-p99-ms 20 --output suggest.json
+
+Builds a synthetic corpus, then replays typing: every prefix of each query ("d", "di",
+..., "distracted bo", ...) is sent to /suggest through Flask's test client, one request
+at a time like a single user typing. Only load_config runs, no load_resources, so the
+endpoint is also checked not to need the encoder or the Faiss indices. Exits with
+status 1 if a latency percentile exceeds its budget or a request fails.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import common
+from common import percentiles, write_results
+from bench_search import make_queries
+from synthetic_corpus import build_search_corpus
+
+def keystrokes(queries):
+    """Every non-empty prefix of every query, in typing order."""
+    return [query[:end] for query in queries for end in range(1, len(query) + 1)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if /suggest latency exceeds its budgets.")
+    parser.add_argument("--size", type=int, default=100000, help="Corpus size in memes (default: 100000)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries typed out character by character")
+    parser.add_argument("--max-p50-ms", type=float, default=2.0)
+    parser.add_argument("--max-p95-ms", type=float, default=5.0)
+    parser.add_argument("--max-p99-ms", type=float, default=10.0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    import app as app_module
+    app_module.app.logger.disabled = True
+    requests = keystrokes(make_queries(args.queries))
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"Building synthetic corpus with {args.size} memes...")
+        corpus_config = build_search_corpus(os.path.join(work_dir, "corpus"), args.size, dim=8)
+        with open(os.path.join(common.REPO_DIR, "config.json")) as f:
+            config = json.load(f)
+        config.update(corpus_config)
+        config_path = os.path.join(work_dir, "config.json")
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+        if not app_module.load_config(config_path):
+            raise SystemExit("Failed to load the benchmark config")
+        client = app_module.app.test_client()
+        client.get("/suggest", query_string={"q": requests[0]}) # Warm up the connection and statements
+        latencies, errors, completed = [], 0, 0
+        for text in requests:
+            start = time.perf_counter()
+            response = client.get("/suggest", query_string={"q": text})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+            elif response.get_json()["completions"]:
+                completed += 1
+
+    stats = dict(percentiles(latencies), requests=len(requests), errors=errors, with_completions=completed)
+    print(f"{len(requests)} keystrokes: {completed} got completions, {errors} failed")
+    checks = []
+    for point in (50, 95, 99):
+        value, budget = stats[f"p{point}_ms"], getattr(args, f"max_p{point}_ms")
+        checks.append({"check": f"p{point}_ms", "value": value, "budget": budget, "ok": value <= budget})
+        print(f"{f'p{point}':>4}: {value:7.3f} ms (budget {budget:.2f}) {'ok' if value <= budget else 'OVER BUDGET'}")
+    write_results(args.output, "suggest", vars(args), {"latency": stats, "checks": checks})
+    if errors or not all(check["ok"] for check in checks):
+        sys.exit(1)
@@ -0,0 +1,44 @@
+"""Shared helpers for the benchmark scripts: result files, percentiles, environment info."""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Nearest-rank percentiles in milliseconds of a list of durations in seconds."""
+    if not samples:
+        return {f"p{p}_ms": None for p in points}
+    ordered = sorted(samples)
+    return {f"p{p}_ms": ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))] * 1000.0
+            for p in points}
+
+def environment():
+    """Describes the machine and code version, so result files can be compared."""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                  capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    info = {"git_revision": revision, "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "timestamp": time.time()}
+    try:
+        import faiss
+        info["faiss"] = faiss.__version__
+    except ImportError:
+        pass
+    return info
+
+def write_results(path, benchmark, params, results):
+    """Writes {"benchmark", "environment", "params", "results"} as JSON (and echoes the path)."""
+    document = {"benchmark": benchmark, "environment": environment(), "params": params, "results": results}
+    if path:
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {path}")
+    return document
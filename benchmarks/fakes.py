@@ -0,0 +1,95 @@
+"""Deterministic stand-ins for the CLIP embedder and the EasyOCR reader.
+
+They let the benchmarks run offline on any CPU and give identical results on every run,
+so timings measure this project's code (decoding, batching, SQLite, Faiss, Flask) rather
+than model weights. Real model cost can be simulated with a fixed per-item delay.
+"""
+import time
+import hashlib
+import numpy as np
+from PIL import Image
+
+import common # noqa: F401 (puts the repo on sys.path)
+import perceptual_hash
+
+DEFAULT_DIM = 512
+CAPTION_KEY = "caption" # PNG text chunk written by synthetic_corpus.py
+RECOGNISE_DISTANCE = 4 # dHash bits within which FakeOCRReader takes an image for a learned one
+
+def _seed(data):
+    return int.from_bytes(hashlib.sha256(data).digest()[:8], "little")
+
+class FakeEmbedder:
+    """Mimics SentenceTransformer.encode for texts and PIL images: unit vectors seeded by content."""
+
+    def __init__(self, dim=DEFAULT_DIM, seconds_per_item=0.0):
+        self.dim = dim
+        self.seconds_per_item = seconds_per_item
+        self.calls = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def _embed(self, item):
+        if isinstance(item, Image.Image):
+            data = item.convert("RGB").resize((16, 16)).tobytes()
+        else:
+            data = " ".join(str(item).split()).lower().encode("utf-8")
+        vector = np.random.default_rng(_seed(data)).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, items, batch_size=32, show_progress_bar=False, **kwargs):
+        self.calls += 1
+        single = not isinstance(items, (list, tuple))
+        batch = [items] if single else list(items)
+        if self.seconds_per_item:
+            time.sleep(self.seconds_per_item * len(batch))
+        embeddings = np.stack([self._embed(item) for item in batch]) if batch else np.zeros((0, self.dim), np.float32)
+        return embeddings[0] if single else embeddings
+
+class FakeOCRReader:
+    """Mimics easyocr.Reader.readtext: returns the caption stored in the image's PNG metadata.
+
+    Arrays (what ocr_preprocess passes) and files without a caption have no metadata; they
+    get the caption of the learn()ed image within RECOGNISE_DISTANCE dHash bits, which recognises
+    resized copies and animation frames. seconds_per_megapixel models the detector's cost
+    growing with image size.
+    """
+
+    def __init__(self, seconds_per_image=0.0, seconds_per_megapixel=0.0):
+        self.seconds_per_image = seconds_per_image
+        self.seconds_per_megapixel = seconds_per_megapixel
+        self.captions = perceptual_hash.BKTree()
+
+    def learn(self, paths):
+        """Remembers the captions of these files by their dHash."""
+        for path in paths:
+            with Image.open(path) as img:
+                value = perceptual_hash.dhash(img)
+                if img.info.get(CAPTION_KEY) and perceptual_hash.hamming(value, 0) > RECOGNISE_DISTANCE: # Not plain
+                    self.captions.add(value, img.info[CAPTION_KEY])
+
+    def readtext(self, image, detail=0, paragraph=True, **kwargs):
+        img = Image.fromarray(image) if isinstance(image, np.ndarray) else (
+            image if isinstance(image, Image.Image) else Image.open(image))
+        img.load() # A real reader decodes the pixels
+        if self.seconds_per_image or self.seconds_per_megapixel:
+            time.sleep(self.seconds_per_image + self.seconds_per_megapixel * img.width * img.height / 1e6)
+        caption = img.info.get(CAPTION_KEY, "")
+        if not caption and len(self.captions):
+            match = self.captions.nearest(perceptual_hash.dhash(img), RECOGNISE_DISTANCE)
+            caption = match[1] if match else ""
+        return [caption] if caption else []
+
+def install_indexer_fakes(index_memes, embedder=None, reader=None):
+    """Points index_memes at the fakes instead of calling load_models()."""
+    index_memes.embedding_model = embedder or FakeEmbedder()
+    index_memes.ocr_reader = reader or FakeOCRReader()
+    index_memes.EMBEDDING_DIM = index_memes.embedding_model.get_sentence_embedding_dimension()
+
+def install_app_fakes(app_module, embedder=None):
+    """Makes app.load_resources() use a FakeEmbedder instead of downloading CLIP."""
+    embedder = embedder or FakeEmbedder()
+    app_module.text_encoder.load_text_encoder = lambda *args, **kwargs: embedder
+    app_module.text_encoder.default_device = lambda: "cpu" # Don't import torch either
+    return embedder
@@ -0,0 +1,150 @@
+"""Synthetic meme corpora for the benchmarks.
+
+Two flavours:
+  - generate_images: real image files with random captions rendered by PIL (for the indexer).
+    The caption is also stored as PNG metadata, where FakeOCRReader reads it back.
+    generate_textless_images and generate_animations add text-free images and animated
+    GIFs for the OCR benchmark.
+  - build_search_corpus: SQLite metadata + published Faiss indices with N random vectors
+    (for search benchmarks at 10k-1M scale without generating N images).
+
+    python benchmarks/synthetic_corpus.py images out/memes --count 1000
+"""
+import os
+import hashlib
+import argparse
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, PngImagePlugin
+
+import common # noqa: F401 (puts the repo on sys.path)
+from fakes import CAPTION_KEY, DEFAULT_DIM
+import index_store
+
+WORDS = ("when", "you", "me", "the", "cat", "dog", "doge", "boyfriend", "distracted", "monday", "coffee",
+         "code", "works", "production", "friday", "deploy", "much", "wow", "such", "bug", "feature",
+         "nobody", "literally", "everyone", "meeting", "email", "this", "fine", "brain", "galaxy", "stonks",
+         "expectation", "reality", "surprised", "pikachu", "drake", "approves", "change", "my", "mind")
+
+def random_caption(rng, min_words=3, max_words=10):
+    return " ".join(rng.choice(WORDS, size=rng.integers(min_words, max_words + 1)))
+
+def generate_images(output_dir, count, size=(512, 512), seed=0, image_format="png"):
+    """Writes `count` images with random backgrounds, shapes and captions. Returns their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        background = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        img = Image.new("RGB", size, background)
+        draw = ImageDraw.Draw(img)
+        for _ in range(int(rng.integers(2, 8))):
+            x0, y0 = int(rng.integers(0, size[0])), int(rng.integers(0, size[1]))
+            x1, y1 = x0 + int(rng.integers(10, size[0] // 2)), y0 + int(rng.integers(10, size[1] // 2))
+            draw.rectangle([x0, y0, x1, y1], fill=tuple(int(c) for c in rng.integers(0, 256, size=3)))
+        caption = random_caption(rng)
+        draw.text((10, 10), caption.upper(), fill=(255, 255, 255))
+        draw.text((10, size[1] - 20), caption, fill=(0, 0, 0))
+        path = os.path.join(output_dir, f"meme_{i:07d}.{image_format}")
+        if image_format == "png":
+            info = PngImagePlugin.PngInfo()
+            info.add_text(CAPTION_KEY, caption)
+            img.save(path, pnginfo=info)
+        else:
+            img.save(path, quality=85)
+        paths.append(path)
+    return paths
+
+def generate_textless_images(output_dir, count, size=(512, 512), seed=0):
+    """Writes `count` images without any text: flat colours, gradients and blurred blobs."""
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            img = Image.new("RGB", size, tuple(int(c) for c in rng.integers(0, 256, size=3)))
+        elif kind == 1:
+            ramp = np.linspace(0, 1, size[0], dtype=np.float32)[None, :, None]
+            start, end = rng.integers(0, 256, size=(2, 3))
+            pixels = np.broadcast_to(start + (end - start) * ramp, (size[1], size[0], 3))
+            img = Image.fromarray(pixels.astype(np.uint8))
+        else:
+            blobs = Image.fromarray(rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8))
+            img = blobs.resize(size, Image.BICUBIC).filter(ImageFilter.GaussianBlur(size[0] / 32))
+        path = os.path.join(output_dir, f"plain_{i:07d}.png")
+        img.save(path)
+        paths.append(path)
+    return paths
+
+def generate_animations(output_dir, frame_paths, frames_per_animation=3, repeats=4):
+    """Writes animated GIFs cycling through groups of frame_paths, each shown for `repeats` frames."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i in range(0, len(frame_paths) - frames_per_animation + 1, frames_per_animation):
+        frames = [Image.open(path).convert("RGB") for path in frame_paths[i:i + frames_per_animation]]
+        frames = [frame for frame in frames for _ in range(repeats)]
+        path = os.path.join(output_dir, f"anim_{i // frames_per_animation:07d}.gif")
+        frames[0].save(path, save_all=True, append_images=frames[1:], duration=100, loop=0)
+        paths.append(path)
+    return paths
+
+def build_search_corpus(output_dir, count, dim=DEFAULT_DIM, index_factory="Flat", seed=0, chunk=100000):
+    """Creates memes.db and published image/text indices with `count` random entries.
+
+    Returns a config dict (same shape as config.json) pointing at the generated files.
+    """
+    import index_memes # Imported lazily: only this flavour needs the schema
+    os.makedirs(output_dir, exist_ok=True)
+    db_file = os.path.join(output_dir, "memes.db")
+    image_index_file = os.path.join(output_dir, "images.faiss")
+    text_index_file = os.path.join(output_dir, "text.faiss")
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    rng = np.random.default_rng(seed)
+    conn, cursor = index_memes.setup_database(db_file)
+    index_memes.drop_fts_triggers(cursor)
+    indices = [index_store.create_index(index_factory, dim) for _ in range(2)]
+    for start in range(0, count, chunk):
+        n = min(chunk, count - start)
+        ids = np.arange(start + 1, start + n + 1, dtype=np.int64)
+        cursor.executemany("INSERT INTO memes (id, image_path, ocr_text, content_hash) VALUES (?, ?, ?, ?)",
+                           ((int(i), f"/synthetic/meme_{i:07d}.png", random_caption(rng),
+                             hashlib.sha256(str(i).encode()).hexdigest()) for i in ids))
+        for index in indices:
+            vectors = rng.standard_normal((n, dim), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            if not index.is_trained:
+                index_store.train_index(index, vectors)
+            index.add_with_ids(vectors, ids)
+    conn.commit()
+    index_memes.finish_fts(conn, rebuild_fts=True)
+    conn.close()
+    index_store.publish_indices(indices[0], indices[1], image_index_file, text_index_file)
+    return {
+        "database_file": db_file,
+        "image_index_file": image_index_file,
+        "text_index_file": text_index_file,
+        "index_manifest_file": index_store.default_manifest_file(image_index_file),
+        "embedding_model": "fake",
+        "index_factory": index_factory,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic meme corpus.")
+    subparsers = parser.add_subparsers(dest="kind", required=True)
+    images_parser = subparsers.add_parser("images", help="Image files with rendered captions")
+    images_parser.add_argument("output_dir")
+    images_parser.add_argument("--count", type=int, default=1000)
+    images_parser.add_argument("--size", type=int, default=512, help="Square image side in pixels")
+    images_parser.add_argument("--format", choices=("png", "jpg"), default="png")
+    search_parser = subparsers.add_parser("search", help="Metadata DB + Faiss indices with random vectors")
+    search_parser.add_argument("output_dir")
+    search_parser.add_argument("--count", type=int, default=10000)
+    search_parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    search_parser.add_argument("--index-factory", default="Flat")
+    args = parser.parse_args()
+    if args.kind == "images":
+        print(f"Wrote {len(generate_images(args.output_dir, args.count, (args.size, args.size), image_format=args.format))} images.")
+    else:
+        build_search_corpus(args.output_dir, args.count, args.dim, args.index_factory)
+        print(f"Wrote search corpus with {args.count} entries to {args.output_dir}.")
@@ -0,0 +1,122 @@
+"""Content-addressed cache of OCR text and embeddings for the indexer.
+
+Results are keyed by the SHA-256 of the image bytes, inside a namespace named after the
+embedding model and OCR settings (the cache key), so renamed, moved or re-added files and
+full rebuilds never run the models on content they have already processed. Each key gets
+its own directory holding:
+  - vectors.f32: an append-only float32 file of (image vector, text vector) rows, read
+    back through a NumPy memmap,
+  - entries.db: SQLite mapping content_hash -> (ocr_text, row in vectors.f32, perceptual
+    hash), plus the vector dimension.
+Vectors are fsynced before their entries are committed, so an interrupted run leaves at
+most some unreferenced rows at the end of the file, never an entry without its vectors.
+"""
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+
+VECTOR_FILENAME = "vectors.f32"
+ENTRIES_FILENAME = "entries.db"
+CACHE_FORMAT = 1 # Bump to invalidate every cache when what gets stored changes
+
+def cache_key(model_name, ocr_languages, ocr_options=None):
+    """Names the model/OCR configuration whose results a cache holds (ocr_options: preprocessing tag)."""
+    key = f"v{CACHE_FORMAT}-{model_name}-ocr-{'+'.join(ocr_languages)}"
+    return f"{key}-{ocr_options}" if ocr_options else key
+
+class EmbeddingCache:
+    """content_hash -> (ocr_text, image vector, text vector) for one cache key. Thread-safe."""
+
+    def __init__(self, cache_dir, key):
+        self.directory = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.+-]+', '_', key))
+        os.makedirs(self.directory, exist_ok=True)
+        self.vector_file = os.path.join(self.directory, VECTOR_FILENAME)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.directory, ENTRIES_FILENAME), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS entries (content_hash TEXT PRIMARY KEY, ocr_text TEXT, row INTEGER NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)")
+        if "dhash" not in {row[1] for row in self.conn.execute("PRAGMA table_info(entries)")}:
+            self.conn.execute("ALTER TABLE entries ADD COLUMN dhash TEXT")
+        self.conn.commit()
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+        self.rows = 0
+        self._mapped = None
+        if self.dim is not None and os.path.exists(self.vector_file):
+            size = os.path.getsize(self.vector_file)
+            self.rows = size // self._row_bytes()
+            if size % self._row_bytes():
+                # A torn append from an interrupted run; no entry can point at it
+                with open(self.vector_file, 'r+b') as f:
+                    f.truncate(self.rows * self._row_bytes())
+
+    def _row_bytes(self):
+        return 2 * self.dim * 4
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def lookup(self, content_hash):
+        """Returns (ocr_text, row, dhash hex or None) for known content, else None."""
+        with self.lock:
+            return self.conn.execute("SELECT ocr_text, row, dhash FROM entries WHERE content_hash = ?",
+                                     (content_hash,)).fetchone()
+
+    def append(self, content_hashes, ocr_texts, image_embeddings, text_embeddings, dhashes=None):
+        """Stores results for new content. Returns each hash's row (existing rows win for duplicates)."""
+        dhashes = dhashes or [None] * len(content_hashes)
+        vectors = np.stack([np.asarray(image_embeddings, dtype=np.float32),
+                            np.asarray(text_embeddings, dtype=np.float32)], axis=1)
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[2]
+                self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (self.dim,))
+            elif vectors.shape[2] != self.dim:
+                raise ValueError(f"Embedding cache {self.directory} holds {self.dim}-d vectors, got {vectors.shape[2]}-d")
+            first_row = self.rows
+            with open(self.vector_file, 'ab') as f:
+                f.write(np.ascontiguousarray(vectors).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.rows += len(vectors)
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO entries (content_hash, ocr_text, row, dhash) VALUES (?, ?, ?, ?)",
+                [(content_hash, ocr_text, first_row + i, dhash)
+                 for i, (content_hash, ocr_text, dhash) in enumerate(zip(content_hashes, ocr_texts, dhashes))])
+            self.conn.commit()
+            placeholders = ",".join("?" * len(content_hashes))
+            rows = dict(self.conn.execute(
+                f"SELECT content_hash, row FROM entries WHERE content_hash IN ({placeholders})", list(content_hashes)))
+        return [rows[content_hash] for content_hash in content_hashes]
+
+    def _vectors(self):
+        """Memmap over all rows written so far; remapped when the file has grown."""
+        if self._mapped is None or len(self._mapped) != self.rows:
+            self._mapped = np.memmap(self.vector_file, dtype=np.float32, mode='r', shape=(self.rows, 2, self.dim))
+        return self._mapped
+
+    def read(self, rows):
+        """Returns (image_embeddings, text_embeddings) for the given rows as contiguous float32 arrays."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0 or self.dim is None:
+            empty = np.zeros((0, self.dim or 0), dtype=np.float32)
+            return empty, empty.copy()
+        with self.lock:
+            vectors = self._vectors()[rows] # Fancy indexing copies the rows out of the map
+        return np.ascontiguousarray(vectors[:, 0]), np.ascontiguousarray(vectors[:, 1])
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": entries, "rows": self.rows, "dim": self.dim,
+                "vector_mb": os.path.getsize(self.vector_file) / 2**20 if os.path.exists(self.vector_file) else 0.0}
+
+    def close(self):
+        with self.lock:
+            self._mapped = None
+            self.conn.close()
@@ -0,0 +1,14 @@
+"""Gunicorn settings for prefork serving (see wsgi.py)."""
+import os
+
+bind = os.environ.get("MEME_SEARCH_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("MEME_SEARCH_WORKERS", "4"))
+threads = int(os.environ.get("MEME_SEARCH_THREADS", "4"))
+preload_app = True # Load model and indices once, before forking
+
+def post_fork(server, worker):
+    # Threads don't survive fork, so each worker starts its own index watcher
+    import app as meme_search
+    meme_search.start_index_watcher()
+    # Likewise torch's intra-op pool; size it per worker (text_encoder.torch_threads ~ cores / workers)
+    meme_search.configure_worker_threads()
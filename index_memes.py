@@ -1,88 +1,144 @@
 import os
 import sqlite3
 import argparse
+import time
+import hashlib
+import json
+import queue
+import threading
+import multiprocessing
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PIL import Image
-import easyocr
-from sentence_transformers import SentenceTransformer
-import torch
 import numpy as np
 import faiss
 from tqdm import tqdm # Optional: for a progress bar
 import sys
+import index_store
+import thumbnails
+import embedding_cache
+import perceptual_hash
+import ocr_preprocess
+import neighbor_graph
 
 # --- Configuration ---
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+DEVICE = "cpu" # Set by load_models(); torch, easyocr and sentence_transformers are imported there, not here
 EMBEDDING_MODEL = 'clip-ViT-B-32'
 OCR_LANGUAGES = ['en']
 SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp')
+DEFAULT_BATCH_SIZE = 32 # Images/texts per encode() call
+DEFAULT_OCR_WORKERS = max(1, (os.cpu_count() or 2) // 2) # EasyOCR processes
+DEFAULT_EMBED_WORKERS = 1 # Threads feeding the embedding model
+OCR_PREFETCH = 4 # OCR jobs kept in flight per OCR worker
+DEFAULT_COMMIT_EVERY = 1000 # Metadata rows written per SQLite transaction
 
 # --- File/DB Names ---
 DEFAULT_DB_FILE = 'meme_metadata.db'
 DEFAULT_IMAGE_INDEX_FILE = 'image_embeddings.index'
 DEFAULT_TEXT_INDEX_FILE = 'text_embeddings.index' # If storing text embeddings separately
+DEFAULT_CACHE_DIR = 'embedding_cache'
+DEFAULT_RECALL_K = 10
+INDEX_ADD_CHUNK_SIZE = 50000 # Vectors read from the embedding cache per Faiss add
+RECALL_MAX_VECTORS = 250000 # Recall of approximate indices is measured only up to this size (needs an exact copy)
 
 # --- Model Initialization ---
-try:
-    print(f"Initializing models on device: {DEVICE}")
-    print("Loading OCR model...")
-    ocr_reader = easyocr.Reader(OCR_LANGUAGES, gpu=(DEVICE == "cuda"))
-    print(f"Loading embedding model: {EMBEDDING_MODEL}...")
-    embedding_model = SentenceTransformer(EMBEDDING_MODEL, device=DEVICE)
-    EMBEDDING_DIM = None # Initialize to None
+ocr_reader = None
+embedding_model = None
+thumbnail_dir = None # Set by index_directory; None disables thumbnails
+thumbnail_sizes = thumbnails.DEFAULT_THUMBNAIL_SIZES
+ocr_settings = ocr_preprocess.DEFAULT_SETTINGS # Set by index_directory
+content_cache = None # EmbeddingCache for the current run, set by index_directory
+duplicate_index = None # BKTree of dHash -> content hash of the items near-duplicates map to; None disables
+near_duplicate_distance = perceptual_hash.DEFAULT_MAX_DISTANCE
+_in_pipeline = {} # content hash -> Event set once that file has been through the embed stage
+EMBEDDING_DIM = None
+_models_lock = threading.Lock()
 
+class ModelLoadError(RuntimeError):
+    """The OCR or embedding model could not be loaded; the run can't continue."""
+
+def detect_device():
+    """"cuda" if torch sees a GPU, else "cpu". Imports torch but loads no model."""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def load_models(load_ocr=True):
+    """Loads the OCR reader (unless OCR runs in worker processes) and the embedding model into the module globals."""
+    global ocr_reader, embedding_model, EMBEDDING_DIM, DEVICE
     try:
-        # Attempt 1: Try the dedicated method first
-        EMBEDDING_DIM = embedding_model.get_sentence_embedding_dimension()
+        from sentence_transformers import SentenceTransformer
+        DEVICE = detect_device()
+        print(f"Initializing models on device: {DEVICE}")
+        if load_ocr:
+            import easyocr
+            print("Loading OCR model...")
+            ocr_reader = easyocr.Reader(OCR_LANGUAGES, gpu=(DEVICE == "cuda"))
+        print(f"Loading embedding model: {EMBEDDING_MODEL}...")
+        embedding_model = SentenceTransformer(EMBEDDING_MODEL, device=DEVICE)
 
-        if EMBEDDING_DIM is not None:
-            print(f"Embedding dimension obtained directly from model: {EMBEDDING_DIM}")
+        try:
+            # Attempt 1: Try the dedicated method first
+            EMBEDDING_DIM = embedding_model.get_sentence_embedding_dimension()
 
-        # Attempt 2: If the first attempt returned None (or failed), try the manual calculation
-        if EMBEDDING_DIM is None:
-            print("get_sentence_embedding_dimension() returned None. Calculating manually...")
-            sample_sentence = "Determine embedding dimension" # Use a simple, representative sentence
-            try:
-                # Generate an embedding for the sample sentence
-                # Make sure the encode method returns a list, numpy array, or similar iterable
-                sample_embedding = embedding_model.encode(sample_sentence)
-
-                # Check if the result is usable (e.g., list, numpy array) and get its length
-                if hasattr(sample_embedding, '__len__') and len(sample_embedding) > 0:
-                    EMBEDDING_DIM = len(sample_embedding)
-                    print(f"Embedding dimension calculated manually: {EMBEDDING_DIM}")
-                elif hasattr(sample_embedding, 'shape') and len(sample_embedding.shape) > 0: # Handle tensors/arrays
-                    # Assuming the dimension is the size of the last axis for multi-dim tensors,
-                    # or the only axis for 1D tensors/arrays. Adjust if needed.
-                    EMBEDDING_DIM = sample_embedding.shape[-1]
-                    print(f"Embedding dimension calculated manually from shape: {EMBEDDING_DIM}")
-                else:
-                    print("Error: Manual embedding calculation returned an invalid or empty result.")
+            if EMBEDDING_DIM is not None:
+                print(f"Embedding dimension obtained directly from model: {EMBEDDING_DIM}")
+
+            # Attempt 2: If the first attempt returned None (or failed), try the manual calculation
+            if EMBEDDING_DIM is None:
+                print("get_sentence_embedding_dimension() returned None. Calculating manually...")
+                sample_sentence = "Determine embedding dimension" # Use a simple, representative sentence
+                try:
+                    # Generate an embedding for the sample sentence
+                    # Make sure the encode method returns a list, numpy array, or similar iterable
+                    sample_embedding = embedding_model.encode(sample_sentence)
+
+                    # Check if the result is usable (e.g., list, numpy array) and get its length
+                    if hasattr(sample_embedding, '__len__') and len(sample_embedding) > 0:
+                        EMBEDDING_DIM = len(sample_embedding)
+                        print(f"Embedding dimension calculated manually: {EMBEDDING_DIM}")
+                    elif hasattr(sample_embedding, 'shape') and len(sample_embedding.shape) > 0: # Handle tensors/arrays
+                        # Assuming the dimension is the size of the last axis for multi-dim tensors,
+                        # or the only axis for 1D tensors/arrays. Adjust if needed.
+                        EMBEDDING_DIM = sample_embedding.shape[-1]
+                        print(f"Embedding dimension calculated manually from shape: {EMBEDDING_DIM}")
+                    else:
+                        print("Error: Manual embedding calculation returned an invalid or empty result.")
+                        # EMBEDDING_DIM remains None
+
+                except Exception as e:
+                    print(f"Error during manual embedding calculation: {e}")
                     # EMBEDDING_DIM remains None
 
-            except Exception as e:
-                print(f"Error during manual embedding calculation: {e}")
-                # EMBEDDING_DIM remains None
+        except AttributeError as e:
+            print(f"Error: The embedding model might be missing a required method: {e}")
+            # EMBEDDING_DIM remains None
+        except Exception as e:
+            print(f"An unexpected error occurred while getting embedding dimension: {e}")
+            # EMBEDDING_DIM remains None
 
-    except AttributeError as e:
-        print(f"Error: The embedding model might be missing a required method: {e}")
-        # EMBEDDING_DIM remains None
-    except Exception as e:
-        print(f"An unexpected error occurred while getting embedding dimension: {e}")
-        # EMBEDDING_DIM remains None
 
+        # --- Post-determination check ---
+        if EMBEDDING_DIM is None:
+            print("WARNING: Could not determine embedding dimension using either method.")
+            raise ValueError("Failed to determine embedding dimension.")
 
-    # --- Post-determination check ---
-    if EMBEDDING_DIM is None:
-        print("WARNING: Could not determine embedding dimension using either method.")
-        raise ValueError("Failed to determine embedding dimension.")
+        else:
+            print(f"Final Embedding Dimension set to: {EMBEDDING_DIM}")
 
-    else:
-        print(f"Final Embedding Dimension set to: {EMBEDDING_DIM}")
+        print("Models loaded successfully.")
+    except Exception as e:
+        # Raised rather than sys.exit(): this runs in pipeline threads, where SystemExit ends only the thread
+        raise ModelLoadError(f"Error loading models: {e}") from e
 
-    print("Models loaded successfully.")
-except Exception as e:
-    print(f"Error loading models: {e}")
-    sys.exit(1)
+def ensure_models(load_ocr=True):
+    """Loads the models on first use, so runs with nothing new to process never pay for them."""
+    with _models_lock:
+        if embedding_model is None or (load_ocr and ocr_reader is None):
+            start_time = time.time()
+            load_models(load_ocr)
+            print(f"Models loaded in {time.time() - start_time:.2f} seconds.")
 
 # --- Database Setup ---
 def setup_database(db_file):
@@ -100,199 +156,957 @@ def setup_database(db_file):
         )
     ''')
 
+    # Columns used by incremental indexing to detect changed files
+    # (added with ALTER TABLE so databases created by older versions keep working)
+    existing_columns = {row[1] for row in cursor.execute("PRAGMA table_info(memes)")}
+    for column, column_type in (("mtime", "REAL"), ("file_size", "INTEGER"), ("content_hash", "TEXT"),
+                                ("dhash", "TEXT"), ("canonical_id", "INTEGER")):
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE memes ADD COLUMN {column} {column_type}")
+    # Near-duplicate bookkeeping: canonical rows are found by content, duplicates by canonical
+    cursor.execute("CREATE INDEX IF NOT EXISTS memes_content_hash ON memes (content_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS memes_canonical_id ON memes (canonical_id)")
+
     # Create FTS5 table for efficient text search on ocr_text
     # Note: content='' makes it an external content FTS table referencing 'memes'
+    # The prefix indexes answer the typeahead's 2- and 3-character prefix queries ("bo"*)
+    # directly instead of merging the doclists of every matching term. Tables created
+    # without them are recreated (external content, so nothing is lost).
+    fts_sql = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'memes_fts'").fetchone()
+    migrate_fts = fts_sql is not None and "prefix" not in fts_sql[0]
+    if migrate_fts:
+        print("Recreating the full-text index with prefix indexes...")
+        cursor.execute("DROP TABLE memes_fts")
     cursor.execute('''
         CREATE VIRTUAL TABLE IF NOT EXISTS memes_fts USING fts5(
             ocr_text,
             content='memes',
-            content_rowid='id'
+            content_rowid='id',
+            prefix='2 3'
         )
     ''')
+    # Terms of memes_fts with the number of memes (docs) and occurrences (hits) of each,
+    # for /suggest's completions. fts5vocab computes these by scanning the whole index, so
+    # they are copied into memes_vocab, whose primary key serves prefix range queries.
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS memes_fts_vocab USING fts5vocab(memes_fts, 'row')")
+    has_vocabulary = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memes_vocab'").fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS memes_vocab (
+            term TEXT PRIMARY KEY,
+            docs INTEGER NOT NULL,
+            hits INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    # A missing insert trigger means a --bulk-fts run died before rebuilding the FTS index
+    has_triggers = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'memes_ai'").fetchone() is not None
+    create_fts_triggers(cursor)
+    has_rows = cursor.execute("SELECT 1 FROM memes LIMIT 1").fetchone() is not None
+    if (migrate_fts or not has_triggers) and has_rows:
+        if not migrate_fts:
+            print("FTS triggers were missing (interrupted bulk run?). Rebuilding full-text index...")
+        cursor.execute("INSERT INTO memes_fts (memes_fts) VALUES ('rebuild')")
+    if (migrate_fts or not has_vocabulary) and has_rows:
+        refresh_vocabulary(cursor)
 
-    # Triggers to keep FTS table synchronized with the main memes table
+    conn.commit()
+    print("Database setup complete.")
+    return conn, cursor
+
+def create_fts_triggers(cursor):
+    """(Re)creates the triggers that keep memes_fts synchronized with the memes table."""
     cursor.execute('''
         CREATE TRIGGER IF NOT EXISTS memes_ai AFTER INSERT ON memes BEGIN
             INSERT INTO memes_fts (rowid, ocr_text) VALUES (new.id, new.ocr_text);
         END;
     ''')
+    # External content FTS5 tables must be told the old values when a row goes away,
+    # so deletes/updates use the special 'delete' command. Older databases were created
+    # with plain DELETE/UPDATE triggers, which is why these are always recreated.
+    cursor.execute("DROP TRIGGER IF EXISTS memes_ad")
     cursor.execute('''
-        CREATE TRIGGER IF NOT EXISTS memes_ad AFTER DELETE ON memes BEGIN
-            DELETE FROM memes_fts WHERE rowid=old.id;
+        CREATE TRIGGER memes_ad AFTER DELETE ON memes BEGIN
+            INSERT INTO memes_fts (memes_fts, rowid, ocr_text) VALUES ('delete', old.id, old.ocr_text);
         END;
     ''')
+    cursor.execute("DROP TRIGGER IF EXISTS memes_au")
     cursor.execute('''
-        CREATE TRIGGER IF NOT EXISTS memes_au AFTER UPDATE ON memes BEGIN
-            UPDATE memes_fts SET ocr_text=new.ocr_text WHERE rowid=old.id;
+        CREATE TRIGGER memes_au AFTER UPDATE OF ocr_text ON memes BEGIN
+            INSERT INTO memes_fts (memes_fts, rowid, ocr_text) VALUES ('delete', old.id, old.ocr_text);
+            INSERT INTO memes_fts (rowid, ocr_text) VALUES (new.id, new.ocr_text);
         END;
     ''')
 
+def drop_fts_triggers(cursor):
+    """Drops the FTS sync triggers; memes_fts must be rebuilt before they are recreated."""
+    for trigger in ("memes_ai", "memes_ad", "memes_au"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+def refresh_vocabulary(cursor):
+    """Recomputes memes_vocab from the full-text index."""
+    cursor.execute("DELETE FROM memes_vocab")
+    cursor.execute("INSERT INTO memes_vocab (term, docs, hits) SELECT term, doc, cnt FROM memes_fts_vocab")
+
+def tune_for_bulk_writes(conn):
+    """WAL + synchronous=NORMAL: commits append to the log instead of fsyncing the database.
+
+    journal_mode=WAL is persistent, which also lets the search server keep reading while
+    the indexer writes.
+    """
+    journal_mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    conn.execute("PRAGMA synchronous=NORMAL")
+    print(f"SQLite journal mode: {journal_mode}, synchronous=NORMAL")
+
+def finish_fts(conn, rebuild_fts, rows_changed=True):
+    """Rebuilds memes_fts from the content table if requested and refreshes memes_vocab if anything changed.
+
+    Both the b-tree merge ('optimize') and the vocabulary refresh read the whole index, so a
+    merge only follows a rebuild (FTS5's automerge keeps up with incremental writes) and
+    runs that changed no rows skip both.
+    """
+    if rebuild_fts:
+        print("Rebuilding full-text index...")
+        conn.execute("INSERT INTO memes_fts (memes_fts) VALUES ('rebuild')")
+        create_fts_triggers(conn.cursor())
+        print("Optimizing full-text index...")
+        conn.execute("INSERT INTO memes_fts (memes_fts) VALUES ('optimize')")
+    if rebuild_fts or rows_changed:
+        refresh_vocabulary(conn.cursor())
     conn.commit()
-    print("Database setup complete.")
-    return conn, cursor
 
 # --- Core Functions ---
-def extract_ocr_text(image_path, reader):
-    """Extracts text from an image using easyocr."""
+def extract_ocr_text(image_path, reader, settings=None):
+    """Extracts text from an image using easyocr, preprocessed as described by settings (default: ocr_settings)."""
     try:
-        result = reader.readtext(image_path, detail=0, paragraph=True)
-        return " ".join(result)
+        return ocr_preprocess.read_text(image_path, reader, settings or ocr_settings)
     except Exception as e:
         print(f"Warning: OCR failed for {os.path.basename(image_path)}: {e}", file=sys.stderr)
         return ""
 
-def generate_embeddings(image_path, ocr_text, model):
-    """Generates image and text embeddings as float32 NumPy arrays."""
-    image_embedding_np = None
-    text_embedding_np = None
+def file_fingerprint(image_path):
+    """Returns (mtime, size, sha256 hex digest) used to detect changed files."""
+    stat = os.stat(image_path)
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return stat.st_mtime, stat.st_size, digest.hexdigest()
+
+# --- OCR Worker Processes ---
+# EasyOCR is CPU-bound and its Reader is not thread-safe, so OCR runs in a pool of
+# processes that each own a private Reader.
+def _init_ocr_worker(languages, use_gpu, torch_threads, thumb_dir, thumb_sizes, settings):
+    """Process pool initializer: builds this worker's OCR reader."""
+    global ocr_reader, thumbnail_dir, thumbnail_sizes, ocr_settings
+    import torch
+    import easyocr
+    torch.set_num_threads(torch_threads) # Avoid oversubscribing cores across workers
+    ocr_reader = easyocr.Reader(languages, gpu=use_gpu, verbose=False)
+    thumbnail_dir, thumbnail_sizes = thumb_dir, thumb_sizes
+    ocr_settings = settings
+
+def _ocr_file(image_path, reader, content_hash):
+    """OCR and thumbnails for one file. Returns the OCR text."""
+    ocr_text = extract_ocr_text(image_path, reader)
+    if thumbnail_dir:
+        thumbnails.make_thumbnails(image_path, content_hash, thumbnail_dir, thumbnail_sizes)
+    return ocr_text
 
-    # Generate image embedding
+def _ocr_worker_task(image_path, content_hash):
+    """Runs OCR for one file inside a pool worker."""
+    return _ocr_file(image_path, ocr_reader, content_hash)
+
+def load_image(image_path):
+    """Opens an image and converts it to RGB. Returns None if it cannot be decoded."""
     try:
         img = Image.open(image_path)
         if img.mode != 'RGB':
             img = img.convert('RGB')
-        # Encode returns a NumPy array. Ensure it's float32 for Faiss.
-        image_embedding_np = model.encode(img).astype(np.float32)
+        return img
     except FileNotFoundError:
         print(f"Error: Image file not found at {image_path}", file=sys.stderr)
-        return None, None
     except Exception as e:
-        print(f"Warning: Image embedding failed for {os.path.basename(image_path)}: {e}", file=sys.stderr)
-        # Proceed to text embedding
+        print(f"Warning: Could not open image {os.path.basename(image_path)}: {e}", file=sys.stderr)
+    return None
+
+def generate_embeddings(image_paths, ocr_texts, model, batch_size=DEFAULT_BATCH_SIZE):
+    """Generates image and text embeddings for a batch of files as float32 NumPy arrays.
+
+    Returns (kept, image_embeddings, text_embeddings) where `kept` holds the positions
+    (into image_paths) of the files that produced an image embedding. Row i of both
+    embedding arrays belongs to image_paths[kept[i]], so ids stay aligned when some
+    files in the batch fail.
+    """
+    kept = []
+    images = []
+    for pos, image_path in enumerate(image_paths):
+        img = load_image(image_path)
+        if img is not None:
+            kept.append(pos)
+            images.append(img)
+
+    if not images:
+        return [], None, None
+
+    # Generate image embeddings: one forward pass per batch
+    try:
+        image_embeddings_np = np.asarray(
+            model.encode(images, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
+    except Exception as e:
+        print(f"Warning: Batched image embedding failed ({e}). Retrying files one by one.", file=sys.stderr)
+        # Fall back to per-image encoding so a single bad file doesn't sink the whole batch
+        single_kept, single_embeddings = [], []
+        for pos, img in zip(kept, images):
+            try:
+                single_embeddings.append(np.asarray(model.encode(img), dtype=np.float32))
+                single_kept.append(pos)
+            except Exception as e:
+                print(f"Warning: Image embedding failed for {os.path.basename(image_paths[pos])}: {e}", file=sys.stderr)
+        if not single_kept:
+            return [], None, None
+        kept = single_kept
+        image_embeddings_np = np.vstack(single_embeddings)
 
-    # Generate text embedding
+    # Generate text embeddings for the files that are still in the batch
+    texts = [ocr_texts[pos] or "" for pos in kept] # Embed empty string if no OCR text
     try:
-        text_to_embed = ocr_text if ocr_text else "" # Embed empty string if no OCR text
-        # Ensure it's float32 for Faiss
-        text_embedding_np = model.encode(text_to_embed).astype(np.float32)
+        text_embeddings_np = np.asarray(
+            model.encode(texts, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
     except Exception as e:
-        print(f"Warning: Text embedding failed for {os.path.basename(image_path)}: {e}", file=sys.stderr)
-        # Keep image embedding if it succeeded
+        print(f"Warning: Batched text embedding failed ({e}). Retrying texts one by one.", file=sys.stderr)
+        text_embeddings_np = np.zeros((len(kept), image_embeddings_np.shape[1]), dtype=np.float32)
+        for row, (pos, text) in enumerate(zip(kept, texts)):
+            try:
+                text_embeddings_np[row] = model.encode(text)
+            except Exception as e:
+                # Keep the zero vector so the image embedding is not lost
+                print(f"Warning: Text embedding failed for {os.path.basename(image_paths[pos])}: {e}", file=sys.stderr)
+
+    return kept, image_embeddings_np, text_embeddings_np
+
+# Rows written by the indexer; a re-processed row is canonical again until its duplicate links are resolved
+INSERT_SQL = ("INSERT INTO memes (id, image_path, ocr_text, mtime, file_size, content_hash, dhash) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?)")
+UPDATE_SQL = ("UPDATE memes SET ocr_text = ?, mtime = ?, file_size = ?, content_hash = ?, dhash = ?, "
+              "canonical_id = NULL WHERE id = ?")
+# Points a near-duplicate at the canonical row holding the content it was matched to
+LINK_SQL = ("UPDATE memes SET canonical_id = (SELECT c.id FROM memes AS c WHERE c.content_hash = ? "
+            "AND c.canonical_id IS NULL AND c.id != memes.id ORDER BY c.id LIMIT 1) WHERE id = ?")
+
+# --- Indexing Pipeline ---
+# decode/OCR (process pool) -> bounded queue -> batching embedders (threads) -> bounded queue -> writer (caller's thread)
+_STAGE_DONE = object() # Sentinel marking the end of a stage's output
+QUEUE_POLL_SECONDS = 0.5 # How often a blocked stage checks whether the run was aborted
+_pipeline_abort = threading.Event() # Set when a stage (or the writer) fails; every stage then stops
+_pipeline_errors = [] # The first stage error, re-raised in the caller's thread
+
+class PipelineAborted(Exception):
+    """Raised inside a stage that was blocked or about to block when the run was aborted."""
+
+def _fail_pipeline(stage, error):
+    print(f"Error: {stage} stage failed: {error}", file=sys.stderr)
+    if not _pipeline_errors:
+        _pipeline_errors.append(error)
+    _pipeline_abort.set()
+
+def _put(q, item):
+    """Queue.put that gives up with PipelineAborted once the run is aborted."""
+    while not _pipeline_abort.is_set():
+        try:
+            q.put(item, timeout=QUEUE_POLL_SECONDS)
+            return
+        except queue.Full:
+            pass
+    raise PipelineAborted()
+
+def _get(q):
+    """Queue.get that gives up with PipelineAborted once the run is aborted."""
+    while not _pipeline_abort.is_set():
+        try:
+            return q.get(timeout=QUEUE_POLL_SECONDS)
+        except queue.Empty:
+            pass
+    raise PipelineAborted()
+
+def _wait(event):
+    """Event.wait that gives up with PipelineAborted once the run is aborted."""
+    while not event.wait(QUEUE_POLL_SECONDS):
+        if _pipeline_abort.is_set():
+            raise PipelineAborted()
+
+# One file moving through the pipeline. ocr_text is None if the file failed; cache_row is
+# set once its OCR text and vectors are in the embedding cache. duplicate_of is the content
+# hash of the near-duplicate it was matched to; reused_duplicate means it took that item's
+# OCR text and vectors, and waiting that they are still being computed in this run.
+FileRecord = namedtuple("FileRecord", "image_path ocr_text fingerprint cache_row dhash duplicate_of reused_duplicate waiting")
+
+def _ocr_stage(image_paths, out_queue, ocr_workers, n_consumers):
+    """Produces FileRecords in input order (except for cache hits, which are emitted at once).
+
+    Files are fingerprinted and perceptually hashed first. Content already in the
+    embedding cache skips OCR, and so does a near-duplicate of an item whose results are
+    cached or still in the pipeline. OCR workers (or the in-process reader) start on the
+    first file that needs OCR.
+    """
+    pool = None
+    try:
+        in_flight = deque() # (FileRecord, future of its OCR text, or None when waiting on a duplicate)
+        max_in_flight = max(1, ocr_workers * OCR_PREFETCH)
+
+        def emit_oldest():
+            record, future = in_flight.popleft()
+            if future is not None:
+                try:
+                    record = record._replace(ocr_text=future.result())
+                except BrokenProcessPool:
+                    raise # The workers died, e.g. because the OCR model failed to load in them
+                except Exception as e:
+                    print(f"Error: OCR failed for {os.path.basename(record.image_path)}: {e}", file=sys.stderr)
+            _put(out_queue, record) # Blocks while the embedders are behind
+
+        for image_path in image_paths:
+            try:
+                fingerprint = file_fingerprint(image_path)
+            except OSError as e:
+                print(f"Error: Could not read {os.path.basename(image_path)}: {e}", file=sys.stderr)
+                _put(out_queue, FileRecord(image_path, None, None, None, None, None, False, False))
+                continue
+            content_hash = fingerprint[2]
+            cached = content_cache.lookup(content_hash)
+            dhash, duplicate_of = None, None
+            if duplicate_index is not None:
+                # Known content needn't be decoded again
+                dhash = perceptual_hash.from_hex(cached[2]) if cached and cached[2] else perceptual_hash.dhash_file(image_path)
+                match = duplicate_index.nearest(dhash, near_duplicate_distance) if dhash is not None else None
+                if match is not None:
+                    duplicate_of = match[1]
+                elif dhash is not None:
+                    duplicate_index.add(dhash, content_hash)
+            record = FileRecord(image_path, None, fingerprint, None, dhash, duplicate_of, False, False)
+
+            if cached is None and duplicate_of is not None:
+                cached = content_cache.lookup(duplicate_of)
+                record = record._replace(reused_duplicate=cached is not None)
+            if cached is not None:
+                if thumbnail_dir and thumbnails.missing_sizes(thumbnail_dir, content_hash, thumbnail_sizes):
+                    thumbnails.make_thumbnails(image_path, content_hash, thumbnail_dir, thumbnail_sizes)
+                _put(out_queue, record._replace(ocr_text=cached[0], cache_row=cached[1]))
+                continue
+
+            if duplicate_of is not None and duplicate_of in _in_pipeline:
+                # The embed stage picks up the results once that item is through
+                if thumbnail_dir:
+                    thumbnails.make_thumbnails(image_path, content_hash, thumbnail_dir, thumbnail_sizes)
+                in_flight.append((record._replace(reused_duplicate=True, waiting=True), None))
+            else:
+                if duplicate_of is None:
+                    _in_pipeline.setdefault(content_hash, threading.Event())
+                if ocr_workers <= 0:
+                    # In-process OCR with the shared reader
+                    ensure_models(load_ocr=True)
+                    future = Future()
+                    try:
+                        future.set_result(_ocr_file(image_path, ocr_reader, content_hash))
+                    except OSError as e:
+                        future.set_exception(e)
+                else:
+                    if pool is None:
+                        torch_threads = max(1, (os.cpu_count() or 1) // ocr_workers)
+                        mp_context = multiprocessing.get_context("spawn") # Torch and fork don't mix
+                        # DEVICE is only set once load_models() runs, which may not have happened yet
+                        ocr_device = detect_device()
+                        print(f"Starting {ocr_workers} OCR worker processes on device: {ocr_device}")
+                        pool = ProcessPoolExecutor(max_workers=ocr_workers, mp_context=mp_context,
+                                                   initializer=_init_ocr_worker,
+                                                   initargs=(OCR_LANGUAGES, ocr_device == "cuda", torch_threads,
+                                                             thumbnail_dir, thumbnail_sizes, ocr_settings))
+                    future = pool.submit(_ocr_worker_task, image_path, content_hash)
+                in_flight.append((record, future))
+            if len(in_flight) >= max_in_flight:
+                emit_oldest()
+        while in_flight:
+            emit_oldest()
+        for _ in range(n_consumers):
+            _put(out_queue, _STAGE_DONE)
+    except PipelineAborted:
+        pass
+    except Exception as e:
+        _fail_pipeline("OCR", e)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
 
-    return image_embedding_np, text_embedding_np
+def _embed_stage(in_queue, out_queue, batch_size):
+    """Collects OCR records into batches, embeds the ones the cache doesn't know and caches them.
 
-def index_directory(image_dir, db_file, image_index_file, text_index_file):
-    """Indexes images: metadata to SQLite, embeddings to Faiss."""
+    Emits each batch as a list of FileRecords whose cache_row is set, or None if the file failed.
+    Near-duplicates waiting on another item take its results once that item is through.
+    """
+    try:
+        done = False
+        while not done:
+            records, failed_records = [], []
+            while len(records) < batch_size:
+                record = _get(in_queue)
+                if record is _STAGE_DONE:
+                    done = True
+                    break
+                if record.ocr_text is None and not record.waiting:
+                    failed_records.append(record)
+                else:
+                    records.append(record)
+
+            misses = [pos for pos, record in enumerate(records) if record.cache_row is None and not record.waiting]
+            if misses:
+                ensure_models(load_ocr=False) # A model that fails to load stops the run, not just this batch
+            try:
+                if misses:
+                    kept, image_embeddings, text_embeddings = generate_embeddings(
+                        [records[pos].image_path for pos in misses], [records[pos].ocr_text for pos in misses],
+                        embedding_model, batch_size)
+                    if kept:
+                        kept_records = [records[misses[i]] for i in kept]
+                        new_rows = content_cache.append(
+                            [record.fingerprint[2] for record in kept_records], [record.ocr_text for record in kept_records],
+                            image_embeddings, text_embeddings,
+                            [perceptual_hash.to_hex(record.dhash) if record.dhash is not None else None
+                             for record in kept_records])
+                        for i, row in zip(kept, new_rows):
+                            records[misses[i]] = records[misses[i]]._replace(cache_row=row)
+            except Exception as e:
+                print(f"Unexpected error embedding batch of {len(misses)} images: {e}", file=sys.stderr)
+            finally:
+                # Release near-duplicates waiting on these files, whether or not they made it
+                for record in records + failed_records:
+                    if record.fingerprint and record.fingerprint[2] in _in_pipeline:
+                        _in_pipeline[record.fingerprint[2]].set()
+
+            for pos, record in enumerate(records):
+                if record.waiting:
+                    # Emitted before this record, so another embedder already has it
+                    _wait(_in_pipeline[record.duplicate_of])
+                    cached = content_cache.lookup(record.duplicate_of)
+                    if cached is not None:
+                        records[pos] = record._replace(ocr_text=cached[0], cache_row=cached[1])
+            # Failed files are passed along (with no row) so the writer can count them
+            _put(out_queue, records + failed_records)
+        _put(out_queue, _STAGE_DONE)
+    except PipelineAborted:
+        pass
+    except Exception as e:
+        _fail_pipeline("Embedding", e)
+
+def scan_directory(image_dir, cursor):
+    """Compares the files in image_dir with the memes table.
+
+    Returns (to_index, changed_ids, deleted_ids, unchanged_count): paths to run through the
+    pipeline, {path: id} for files whose content changed, ids of rows whose file is gone,
+    and the number of files that need no work. Files are only hashed when their mtime or
+    size differ from the stored values; a touched file with identical bytes just gets its
+    stored mtime refreshed.
+    """
+    image_files = sorted(
+        f for f in os.listdir(image_dir)
+        if os.path.isfile(os.path.join(image_dir, f)) and f.lower().endswith(SUPPORTED_EXTENSIONS)
+    )
+    on_disk = {os.path.join(image_dir, f) for f in image_files}
+
+    indexed = {}
+    deleted_ids = []
+    for row_id, image_path, mtime, file_size, content_hash in cursor.execute(
+            "SELECT id, image_path, mtime, file_size, content_hash FROM memes"):
+        if image_path in on_disk:
+            indexed[image_path] = (row_id, mtime, file_size, content_hash)
+        elif os.path.dirname(image_path) == image_dir:
+            deleted_ids.append(row_id) # Only rows belonging to the scanned directory
+
+    to_index, changed_ids, touched = [], {}, []
+    unchanged_count = 0
+    for image_path in sorted(on_disk):
+        if image_path not in indexed:
+            to_index.append(image_path)
+            continue
+        row_id, mtime, file_size, content_hash = indexed[image_path]
+        stat = os.stat(image_path)
+        if stat.st_mtime == mtime and stat.st_size == file_size:
+            unchanged_count += 1
+            continue
+        new_mtime, new_size, new_hash = file_fingerprint(image_path)
+        if new_hash == content_hash:
+            touched.append((new_mtime, new_size, row_id))
+            unchanged_count += 1
+        else:
+            to_index.append(image_path)
+            changed_ids[image_path] = row_id
+
+    if touched:
+        cursor.executemany("UPDATE memes SET mtime = ?, file_size = ? WHERE id = ?", touched)
+    return to_index, changed_ids, deleted_ids, unchanged_count
+
+def backfill_thumbnails(cursor, skip_paths, workers):
+    """Creates missing thumbnails for already indexed files (e.g. indexed before thumbnails existed)."""
+    rows = [(image_path, content_hash) for image_path, content_hash in
+            cursor.execute("SELECT image_path, content_hash FROM memes WHERE content_hash IS NOT NULL")
+            if image_path not in skip_paths and thumbnails.missing_sizes(thumbnail_dir, content_hash, thumbnail_sizes)]
+    if not rows:
+        return
+    # Decoding and resizing release the GIL, so threads scale here
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        written = sum(tqdm(pool.map(lambda row: thumbnails.make_thumbnails(row[0], row[1], thumbnail_dir, thumbnail_sizes),
+                                    rows), total=len(rows), desc="Backfilling thumbnails"))
+    print(f"Backfilled {written} thumbnails for {len(rows)} previously indexed images.")
+
+def build_duplicate_index(cursor, skip_paths):
+    """BK-tree of the dHashes of canonical rows (those that aren't near-duplicates), mapping to content hashes."""
+    tree = perceptual_hash.BKTree()
+    for image_path, dhash, content_hash in cursor.execute(
+            "SELECT image_path, dhash, content_hash FROM memes "
+            "WHERE canonical_id IS NULL AND dhash IS NOT NULL AND content_hash IS NOT NULL").fetchall():
+        if image_path not in skip_paths:
+            tree.add(perceptual_hash.from_hex(dhash), content_hash)
+    return tree
+
+def backfill_dhashes(cursor, workers):
+    """Computes dHashes for rows indexed before near-duplicate detection, so new reposts can match them."""
+    rows = cursor.execute("SELECT id, image_path FROM memes WHERE dhash IS NULL").fetchall()
+    if not rows:
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes = list(tqdm(pool.map(lambda row: perceptual_hash.dhash_file(row[1]), rows),
+                           total=len(rows), desc="Backfilling perceptual hashes"))
+    updates = [(perceptual_hash.to_hex(dhash), row[0]) for row, dhash in zip(rows, hashes) if dhash is not None]
+    cursor.executemany("UPDATE memes SET dhash = ? WHERE id = ?", updates)
+    print(f"Backfilled perceptual hashes for {len(updates)} of {len(rows)} previously indexed images.")
+
+def reconcile_indices(cursor, indices, skip_paths):
+    """Compares the Faiss indices with the memes table.
+
+    Returns (orphaned_ids, restored, reprocess): ids of vectors whose row is gone,
+    [(id, cache_row)] for rows lacking vectors whose content is in the embedding cache,
+    and {image_path: id} for rows lacking vectors that must go through the pipeline again
+    (e.g. rows committed by an interrupted run after the cache was deleted).
+    """
+    id_sets = [set(index_store.index_ids(index).tolist()) if index is not None else set() for index in indices]
+    indexed, any_indexed = set.intersection(*id_sets), set.union(*id_sets)
+    restored, reprocess, db_ids = [], {}, set()
+    for row_id, image_path, content_hash in cursor.execute("SELECT id, image_path, content_hash FROM memes").fetchall():
+        db_ids.add(row_id)
+        if row_id in indexed or image_path in skip_paths:
+            continue
+        cached = content_cache.lookup(content_hash) if content_hash else None
+        if cached is not None:
+            restored.append((row_id, cached[1]))
+        elif os.path.isfile(image_path):
+            reprocess[image_path] = row_id
+        else:
+            print(f"Warning: {image_path} has no vectors and no longer exists.", file=sys.stderr)
+    return np.array(sorted(any_indexed - db_ids), dtype=np.int64), restored, reprocess
+
+def load_existing_index(index_file):
+    """Loads an existing Faiss index for incremental updates, or returns None."""
+    if not os.path.exists(index_file):
+        return None
+    index = faiss.read_index(index_file)
+    if EMBEDDING_DIM is not None and index.d != EMBEDDING_DIM:
+        raise ValueError(f"{index_file} has dimension {index.d}, model produces {EMBEDDING_DIM}. "
+                         "Run with --rebuild.")
+    print(f"Loaded existing index {index_file}: {index_store.describe_index(index)}")
+    return index
+
+def build_new_index(index_factory, embeddings_np, train_sample_size):
+    """Creates (and trains, if needed) an empty index of the configured type."""
+    try:
+        index = index_store.create_index(index_factory, EMBEDDING_DIM)
+        index_store.train_index(index, embeddings_np, train_sample_size)
+        return index
+    except RuntimeError as e:
+        # Typically too few vectors to train IVF centroids or PQ codebooks
+        print(f"Warning: Could not build '{index_factory}' index ({e}). Falling back to Flat.", file=sys.stderr)
+        return index_store.create_index("Flat", EMBEDDING_DIM)
+
+def index_directory(image_dir, db_file, image_index_file, text_index_file, batch_size=DEFAULT_BATCH_SIZE,
+                    ocr_workers=DEFAULT_OCR_WORKERS, embed_workers=DEFAULT_EMBED_WORKERS, rebuild=False,
+                    commit_every=DEFAULT_COMMIT_EVERY, wal=False, bulk_fts=False,
+                    index_factory=index_store.DEFAULT_INDEX_FACTORY,
+                    train_sample_size=index_store.DEFAULT_TRAIN_SAMPLE_SIZE,
+                    search_params=None, recall_k=DEFAULT_RECALL_K, manifest_file=None,
+                    thumb_dir=None, thumb_sizes=thumbnails.DEFAULT_THUMBNAIL_SIZES, backfill_thumbs=False,
+                    cache_dir=DEFAULT_CACHE_DIR, resume=False,
+                    dedup_distance=perceptual_hash.DEFAULT_MAX_DISTANCE, backfill_hashes=False,
+                    ocr_options=ocr_preprocess.DEFAULT_SETTINGS, neighbor_k=neighbor_graph.DEFAULT_K,
+                    neighbor_source=neighbor_graph.DEFAULT_SOURCE):
+    """Indexes images: metadata to SQLite, embeddings to Faiss.
+
+    Runs incrementally by default: existing indices are loaded and only new, changed or
+    deleted files are processed. With rebuild=True all rows and vectors are recreated.
+    Metadata is written in transactions of commit_every rows. bulk_fts drops the FTS
+    triggers for the run and rebuilds memes_fts once at the end (best for big backfills).
+    Newly created indices use index_factory; when it is approximate, recall@recall_k
+    against exact search is reported using search_params' query-time knobs. Indices are
+    published atomically under manifest_file (default: manifest.json next to the image index).
+    With thumb_dir set, thumbnails of thumb_sizes are written for each processed file, and
+    backfill_thumbs also creates the missing ones of files indexed earlier. OCR text and
+    vectors come from the content-addressed embedding cache in cache_dir whenever it has
+    seen a file's bytes before; models only run (and are only loaded) for new content.
+
+    Runs are crash-safe: vectors are in the cache before their rows commit, and a checkpoint
+    file next to the manifest records the run until its indices are published. After an
+    interruption the next run reconciles the indices with the memes table, restoring the
+    vectors of committed rows from the cache; an interrupted rebuild has to be continued
+    with resume=True (or restarted with rebuild=True). An error in any pipeline stage stops
+    every stage and is raised here, leaving the checkpoint behind like an interruption.
+
+    Files within dedup_distance bits (dHash) of an already indexed image are recorded as
+    its near-duplicates (memes.canonical_id) and reuse its OCR text and vectors instead of
+    running the models; dedup_distance=None turns this off. backfill_hashes computes the
+    missing dHashes of rows indexed before.
+
+    ocr_options (an ocr_preprocess.OCRSettings) sets the longest side images are shrunk to
+    before OCR, the edge density below which OCR is skipped and how many frames of
+    animations are read. They are part of the embedding cache key.
+
+    Each published generation includes the neighbor_k nearest neighbors of every meme in
+    the neighbor_source ("image" or "text") index, for /similar; incremental runs update
+    the previous generation's graph. neighbor_k=None (or 0) publishes no graph.
+    """
+    global thumbnail_dir, thumbnail_sizes, content_cache, EMBEDDING_DIM
+    global duplicate_index, near_duplicate_distance, _in_pipeline, ocr_settings, _pipeline_abort, _pipeline_errors
+    thumbnail_dir, thumbnail_sizes = thumb_dir, tuple(thumb_sizes)
+    ocr_settings = ocr_options
+    image_dir = os.path.normpath(image_dir)
+    manifest_file = manifest_file or index_store.default_manifest_file(image_index_file)
+    checkpoint_file = index_store.checkpoint_file(manifest_file)
+    interrupted = index_store.read_checkpoint(checkpoint_file)
+    if interrupted is not None:
+        print(f"Found the checkpoint of an interrupted {'rebuild' if interrupted.get('rebuild') else 'run'} "
+              f"({interrupted.get('processed', 0)} files written).")
+        if interrupted.get("rebuild") and not (resume or rebuild):
+            print("Error: The indices are missing everything that interrupted rebuild wrote. "
+                  "Pass --resume to continue it or --rebuild to start over.", file=sys.stderr)
+            sys.exit(1)
+    elif resume:
+        print("No interrupted run to resume; running a normal incremental update.")
+    fresh_indices = rebuild or bool(resume and interrupted and interrupted.get("rebuild"))
+    checkpoint = {"image_dir": image_dir, "rebuild": fresh_indices, "started": time.time(), "processed": 0}
     conn, cursor = None, None
     try:
         conn, cursor = setup_database(db_file)
+        if wal:
+            tune_for_bulk_writes(conn)
+        if bulk_fts:
+            drop_fts_triggers(cursor)
+            conn.commit()
+        if rebuild:
+            index_store.write_checkpoint(checkpoint_file, checkpoint) # Before the rows it refers to are gone
+            print("Rebuild requested: clearing existing metadata.")
+            cursor.execute("DELETE FROM memes")
+            if bulk_fts:
+                cursor.execute("INSERT INTO memes_fts (memes_fts) VALUES ('delete-all')")
+            conn.commit()
     except sqlite3.Error as e:
         print(f"Database error during setup: {e}", file=sys.stderr)
         sys.exit(1)
 
     print(f"Scanning directory: {image_dir}")
-    image_files = [
-        f for f in os.listdir(image_dir)
-        if os.path.isfile(os.path.join(image_dir, f)) and f.lower().endswith(SUPPORTED_EXTENSIONS)
-    ]
+    image_paths, changed_ids, deleted_ids, unchanged_count = scan_directory(image_dir, cursor)
+    row_count = cursor.execute("SELECT COUNT(*) FROM memes").fetchone()[0]
+    if deleted_ids:
+        print(f"Removing {len(deleted_ids)} deleted images from the database.")
+        cursor.executemany("DELETE FROM memes WHERE id = ?", [(row_id,) for row_id in deleted_ids])
+    if deleted_ids or changed_ids:
+        # Near-duplicates of removed or replaced content become canonical themselves
+        cursor.execute("UPDATE memes SET canonical_id = NULL WHERE canonical_id IN (SELECT value FROM json_each(?))",
+                       (json.dumps(deleted_ids + list(changed_ids.values())),))
+    if backfill_hashes and dedup_distance is not None:
+        backfill_dhashes(cursor, max(1, os.cpu_count() or 1))
+    conn.commit()
 
-    if not image_files:
-        print("No supported image files found in the directory.")
+    print(f"New: {len(image_paths) - len(changed_ids)}, changed: {len(changed_ids)}, "
+          f"deleted: {len(deleted_ids)}, unchanged: {unchanged_count}.")
+    if thumbnail_dir and backfill_thumbs:
+        backfill_thumbnails(cursor, set(image_paths), max(1, os.cpu_count() or 1))
+    # Reconcile unless the last published generation provably covers every row
+    manifest = index_store.read_manifest(manifest_file)
+    in_sync = (not fresh_indices and interrupted is None and manifest is not None
+               and manifest.get("ntotal") == {"image_index": row_count, "text_index": row_count})
+    published_graph = (manifest or {}).get("neighbor_graph") or {}
+    graph_stale = bool(neighbor_k) and (published_graph.get("k"), published_graph.get("source")) != (
+        neighbor_k, neighbor_source)
+    if graph_stale and in_sync:
+        print(f"Building the neighbor graph (k={neighbor_k}, {neighbor_source} vectors).")
+    if not image_paths and not deleted_ids and in_sync and not graph_stale:
+        print("Index is up to date.")
+        if bulk_fts:
+            finish_fts(conn, rebuild_fts=True)
         if conn: conn.close()
         return
 
-    print(f"Found {len(image_files)} supported images. Starting indexing...")
-
-    ids_list = []
-    image_embeddings_list = []
-    text_embeddings_list = []
+    content_cache = embedding_cache.EmbeddingCache(cache_dir, embedding_cache.cache_key(
+        EMBEDDING_MODEL, OCR_LANGUAGES, ocr_preprocess.settings_tag(ocr_settings)))
+    print(f"Embedding cache: {content_cache.directory} ({len(content_cache)} entries)")
+    cached_rows_before = content_cache.rows
+    if EMBEDDING_DIM is None:
+        EMBEDDING_DIM = content_cache.dim # Checked against existing indices; the model sets it if it loads
+    image_index, text_index = None, None
+    if not fresh_indices:
+        try:
+            image_index, text_index = load_existing_index(image_index_file), load_existing_index(text_index_file)
+        except (ValueError, RuntimeError) as e:
+            print(f"Error loading existing indices: {e}", file=sys.stderr)
+            content_cache.close()
+            conn.close()
+            sys.exit(1)
 
+    # Ids and embedding cache rows of the files to add; the vectors stay in the cache's file
+    ids_list = array('q')
+    cache_rows_list = array('q')
+    orphaned_ids, restored_ids = np.zeros(0, dtype=np.int64), []
+    if not in_sync:
+        orphaned_ids, restored, reprocess = reconcile_indices(cursor, (image_index, text_index), set(image_paths))
+        for row_id, cache_row in restored:
+            ids_list.append(row_id)
+            cache_rows_list.append(cache_row)
+        restored_ids = [row_id for row_id, _ in restored]
+        for image_path, row_id in reprocess.items():
+            image_paths.append(image_path)
+            changed_ids[image_path] = row_id
+        if restored or reprocess or orphaned_ids.size:
+            print(f"Reconciled indices with the database: {len(restored)} rows restored from the embedding cache, "
+                  f"{len(reprocess)} to re-process, {len(orphaned_ids)} orphaned vectors to remove.")
+    _in_pipeline, _pipeline_abort, _pipeline_errors = {}, threading.Event(), []
+    duplicate_index, near_duplicate_distance = None, dedup_distance
+    if dedup_distance is not None and image_paths:
+        duplicate_index = build_duplicate_index(cursor, set(changed_ids))
+    index_store.write_checkpoint(checkpoint_file, checkpoint)
     processed_count = 0
     skipped_count = 0
 
-    for filename in tqdm(image_files, desc="Indexing Images"):
-        image_path = os.path.join(image_dir, filename)
-        row_id = None
+    print(f"Starting indexing of {len(image_paths)} images "
+          f"(OCR workers: {ocr_workers}, embed workers: {embed_workers}, batch size: {batch_size})...")
 
-        try:
-            # 1. Extract OCR Text
-            ocr_text = extract_ocr_text(image_path, ocr_reader)
+    # Bounded queues provide backpressure: OCR stalls when the embedders fall behind,
+    # and the embedders stall when the writer does, so memory stays flat.
+    ocr_queue = queue.Queue(maxsize=batch_size * embed_workers * 2)
+    write_queue = queue.Queue(maxsize=embed_workers * 2)
+    stages = [threading.Thread(target=_ocr_stage, args=(image_paths, ocr_queue, ocr_workers, embed_workers),
+                               name="ocr-stage", daemon=True)]
+    stages += [threading.Thread(target=_embed_stage, args=(ocr_queue, write_queue, batch_size),
+                                name=f"embed-stage-{i}", daemon=True) for i in range(embed_workers)]
+    for stage in stages:
+        stage.start()
 
-            # 2. Insert metadata and get ID (handle duplicates)
-            try:
-                cursor.execute("INSERT INTO memes (image_path, ocr_text) VALUES (?, ?)", (image_path, ocr_text))
-                row_id = cursor.lastrowid
-                conn.commit() # Commit after each successful insert
-            except sqlite3.IntegrityError: # UNIQUE constraint failed (image_path already exists)
-                print(f"Warning: Image already indexed, skipping: {filename}", file=sys.stderr)
-                # Optionally: Update existing record's OCR text if needed
-                # cursor.execute("UPDATE memes SET ocr_text = ? WHERE image_path = ?", (ocr_text, image_path))
-                # conn.commit()
-                # cursor.execute("SELECT id FROM memes WHERE image_path = ?", (image_path,))
-                # existing_id = cursor.fetchone()
-                # if existing_id: row_id = existing_id[0] ... # More complex update logic needed if re-indexing embeddings
-                skipped_count += 1
-                continue # Skip processing embeddings for duplicates for now
-            except sqlite3.Error as e:
-                 print(f"Error inserting metadata for {filename}: {e}", file=sys.stderr)
-                 skipped_count += 1
-                 continue # Skip this file
-
-            # 3. Generate Embeddings (only if metadata insert was successful)
-            if row_id is not None:
-                image_embedding, text_embedding = generate_embeddings(image_path, ocr_text, embedding_model)
-
-                # Store embeddings only if image embedding succeeded
-                if image_embedding is not None:
-                    ids_list.append(row_id)
-                    image_embeddings_list.append(image_embedding)
-                    # Store text embedding if it also succeeded, otherwise maybe a zero vector or skip?
-                    # Storing a corresponding entry is needed to keep lists aligned.
-                    if text_embedding is not None:
-                        text_embeddings_list.append(text_embedding)
+    # Writer stage: the only place that touches the memes table and the id/row lists.
+    # New rows get ids assigned here so a whole transaction can go through executemany.
+    next_id = cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM memes").fetchone()[0]
+    pending_inserts, pending_updates, pending_rows = [], [], []
+    duplicate_links, reused_duplicates = [], 0
+
+    def flush_writes():
+        """Writes the pending rows in one transaction, records their ids and cache rows, and checkpoints."""
+        nonlocal processed_count, skipped_count
+        if not pending_rows:
+            return
+        try:
+            cursor.executemany(
+                INSERT_SQL,
+                pending_inserts)
+            cursor.executemany(
+                UPDATE_SQL,
+                pending_updates)
+            conn.commit()
+            written = pending_rows
+        except sqlite3.Error as e:
+            # Retry row by row so one bad row doesn't discard the whole transaction
+            print(f"Warning: Bulk metadata write failed ({e}). Retrying rows individually.", file=sys.stderr)
+            conn.rollback()
+            written = []
+            insert_params = {params[0]: params for params in pending_inserts}
+            update_params = {params[-1]: params for params in pending_updates}
+            for entry in pending_rows:
+                row_id = entry[0]
+                try:
+                    if row_id in insert_params:
+                        cursor.execute(
+                            INSERT_SQL,
+                            insert_params[row_id])
                     else:
-                        # Append a zero vector of the correct dimension if text embed failed
-                        text_embeddings_list.append(np.zeros(EMBEDDING_DIM, dtype=np.float32))
-                    processed_count += 1
-                else:
-                    print(f"Skipping embeddings for {filename} due to image embedding failure.", file=sys.stderr)
-                    # We might have inserted metadata but won't have embeddings for it.
-                    # Could delete the metadata row here, or just leave it. Leaving it is simpler.
+                        cursor.execute(
+                            UPDATE_SQL,
+                            update_params[row_id])
+                    conn.commit()
+                    written.append(entry)
+                except sqlite3.Error as e:
+                    print(f"Error writing metadata for id {row_id}: {e}", file=sys.stderr)
+                    conn.rollback()
                     skipped_count += 1
+        for row_id, cache_row in written:
+            ids_list.append(row_id)
+            cache_rows_list.append(cache_row)
+        processed_count += len(written)
+        checkpoint["processed"] += len(written)
+        index_store.write_checkpoint(checkpoint_file, checkpoint)
+        pending_inserts.clear()
+        pending_updates.clear()
+        pending_rows.clear()
 
-        except Exception as e:
-            print(f"Unexpected error processing {filename}: {e}", file=sys.stderr)
-            skipped_count += 1
-            if conn: conn.rollback() # Rollback potential failed transaction for this file
+    finished_embedders = 0
+    with tqdm(total=len(image_paths), desc="Indexing Images") as progress:
+        try:
+            while finished_embedders < embed_workers:
+                item = _get(write_queue)
+                if item is _STAGE_DONE:
+                    finished_embedders += 1
+                    continue
+                for record in item:
+                    if record.cache_row is None:
+                        # No metadata row is written, so the file is retried on the next run
+                        print(f"Skipping {os.path.basename(record.image_path)} due to OCR/image embedding failure.",
+                              file=sys.stderr)
+                        skipped_count += 1
+                        continue
+                    image_path, ocr_text, (mtime, file_size, content_hash) = record[:3]
+                    dhash = perceptual_hash.to_hex(record.dhash) if record.dhash is not None else None
+                    if image_path in changed_ids:
+                        row_id = changed_ids[image_path]
+                        pending_updates.append((ocr_text, mtime, file_size, content_hash, dhash, row_id))
+                    else:
+                        row_id = next_id
+                        next_id += 1
+                        pending_inserts.append((row_id, image_path, ocr_text, mtime, file_size, content_hash, dhash))
+                    pending_rows.append((row_id, record.cache_row))
+                    if record.duplicate_of is not None:
+                        duplicate_links.append((record.duplicate_of, row_id))
+                        reused_duplicates += record.reused_duplicate
+                if len(pending_rows) >= commit_every:
+                    flush_writes()
+                progress.update(len(item))
+        except PipelineAborted:
+            pass # A stage failed; rows written so far stay, and the checkpoint marks the run interrupted
+        except BaseException:
+            _pipeline_abort.set() # Unblock the stages before the error leaves this thread
+            raise
+        flush_writes()
+
+    for stage in stages:
+        stage.join()
+    if _pipeline_errors:
+        content_cache.close()
+        conn.close()
+        raise _pipeline_errors[0]
 
-    print(f"\nMetadata processing complete. Processed: {processed_count}, Skipped/Duplicates: {skipped_count}")
+    if duplicate_links:
+        try:
+            cursor.executemany(LINK_SQL, duplicate_links)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error recording near-duplicates: {e}", file=sys.stderr)
+
+    print(f"\nMetadata processing complete. Processed: {processed_count}, Skipped: {skipped_count}")
+    if image_paths:
+        embedded_count = content_cache.rows - cached_rows_before
+        cached_count = max(0, processed_count - embedded_count - reused_duplicates)
+        if duplicate_index is not None:
+            print(f"Near-duplicates: {len(duplicate_links)} files matched an indexed image within "
+                  f"{near_duplicate_distance} bits; {reused_duplicates} of them reused its OCR text and vectors.")
+        print(f"Model calls: {embedded_count} files ran through OCR and the embedding model; "
+              f"{cached_count} reused cached results for identical content and {reused_duplicates} a near-duplicate's, "
+              f"saving {cached_count + reused_duplicates} OCR passes and {2 * (cached_count + reused_duplicates)} encodes.")
+    try:
+        finish_fts(conn, rebuild_fts=bulk_fts, rows_changed=bool(processed_count or deleted_ids))
+    except sqlite3.Error as e:
+        print(f"Error finalizing full-text index: {e}", file=sys.stderr)
 
-    # --- Build and Save Faiss Index ---
-    if not ids_list:
-        print("No new embeddings were generated. Skipping Faiss index creation.")
+    # --- Update and Save Faiss Indices ---
+    # Vectors of changed, deleted and orphaned ids are removed; restored ids may be half present
+    stale_ids = np.concatenate([np.array(list(changed_ids.values()) + deleted_ids + restored_ids, dtype=np.int64),
+                                orphaned_ids])
+    if not ids_list and stale_ids.size == 0 and not graph_stale:
+        print("No embeddings were added or removed. Leaving Faiss indices untouched.")
+        index_store.clear_checkpoint(checkpoint_file)
+        content_cache.close()
+        if conn: conn.close()
+        return
+    if not ids_list and image_index is None and text_index is None:
+        # E.g. a first run over an empty directory: no vectors to size or train new indices with
+        print("No embeddings to index yet. Not creating Faiss indices.")
+        index_store.clear_checkpoint(checkpoint_file)
+        content_cache.close()
         if conn: conn.close()
         return
 
-    print("Building Faiss indices...")
+    print("Updating Faiss indices...")
     try:
-        # Convert lists to NumPy arrays
-        ids_np = np.array(ids_list)
-        image_embeddings_np = np.array(image_embeddings_list).astype(np.float32)
-        text_embeddings_np = np.array(text_embeddings_list).astype(np.float32)
-
-        # --- Image Index ---
-        print(f"Building Image embedding index ({len(ids_list)} vectors)...")
-        # Use IndexFlatL2 for exact search, wrapped in IndexIDMap
-        index_flat_img = faiss.IndexFlatL2(EMBEDDING_DIM)
-        image_index = faiss.IndexIDMap(index_flat_img)
-        image_index.add_with_ids(image_embeddings_np, ids_np)
-        print(f"Saving Image index to {image_index_file}...")
-        faiss.write_index(image_index, image_index_file)
-
-        # --- Text Index ---
-        print(f"Building Text embedding index ({len(ids_list)} vectors)...")
-         # Use IndexFlatL2 for exact search, wrapped in IndexIDMap
-        index_flat_text = faiss.IndexFlatL2(EMBEDDING_DIM)
-        text_index = faiss.IndexIDMap(index_flat_text)
-        text_index.add_with_ids(text_embeddings_np, ids_np)
-        print(f"Saving Text index to {text_index_file}...")
-        faiss.write_index(text_index, text_index_file)
-
-        print("Faiss indices built and saved successfully.")
+        if EMBEDDING_DIM is None:
+            EMBEDDING_DIM = content_cache.dim # Every vector came from the cache, so no model was loaded
+        ids_np = np.frombuffer(ids_list, dtype=np.int64)
+        rows_np = np.frombuffer(cache_rows_list, dtype=np.int64)
+        indices = {"Image": image_index, "Text": text_index}
+        new_labels = [label for label, index in indices.items() if index is None]
+        if new_labels:
+            sample_rows = rows_np
+            if len(rows_np) > train_sample_size:
+                sample_rows = np.sort(np.random.default_rng(0).choice(rows_np, train_sample_size, replace=False))
+            samples = dict(zip(("Image", "Text"), content_cache.read(sample_rows)))
+            for label in new_labels:
+                indices[label] = build_new_index(index_factory, samples[label], train_sample_size)
+                print(f"Created {label} index: {index_store.describe_index(indices[label])}")
+            del samples
+        for label, index in indices.items():
+            if label not in new_labels and stale_ids.size and index.ntotal:
+                removed = index_store.remove_ids(index, stale_ids)
+                print(f"Removed {removed} stale vectors from {label} index.")
 
-    except Exception as e:
-        print(f"Error building or saving Faiss index: {e}", file=sys.stderr)
+        # Stream the vectors from the embedding cache in fixed-size chunks, so memory
+        # doesn't grow with the number of files added
+        if ids_np.size:
+            print(f"Adding {len(ids_np)} vectors to each index (chunks of {INDEX_ADD_CHUNK_SIZE})...")
+        for start in range(0, len(ids_np), INDEX_ADD_CHUNK_SIZE):
+            image_chunk, text_chunk = content_cache.read(rows_np[start:start + INDEX_ADD_CHUNK_SIZE])
+            indices["Image"].add_with_ids(image_chunk, ids_np[start:start + INDEX_ADD_CHUNK_SIZE])
+            indices["Text"].add_with_ids(text_chunk, ids_np[start:start + INDEX_ADD_CHUNK_SIZE])
+
+        if new_labels and ids_np.size and index_factory != "Flat":
+            if len(ids_np) > RECALL_MAX_VECTORS:
+                print(f"Skipping recall measurement: more than {RECALL_MAX_VECTORS} vectors.")
+            else:
+                # Cross-modal queries (text vectors against the image index and vice versa)
+                # resemble real searches better than querying an index with its own vectors.
+                image_embeddings_np, text_embeddings_np = content_cache.read(rows_np)
+                for label, embeddings_np, queries_np in (("Image", image_embeddings_np, text_embeddings_np),
+                                                         ("Text", text_embeddings_np, image_embeddings_np)):
+                    if label in new_labels:
+                        index_store.apply_search_params(indices[label], search_params or {})
+                        recall = index_store.measure_recall(indices[label], embeddings_np, ids_np, queries_np, recall_k)
+                        print(f"{label} index recall@{recall_k} vs. exact search: {recall:.4f}")
+        for label, index in indices.items():
+            print(f"{label} index now holds {index.ntotal} vectors.")
+
+        graph_files, graph_info = {}, {}
+        if neighbor_k:
+            start_time = time.time()
+            previous_graph = None if fresh_indices else neighbor_graph.load_published(manifest, manifest_file)
+            graph = neighbor_graph.update(previous_graph, indices[neighbor_source.capitalize()], ids_np, stale_ids,
+                                          neighbor_k, neighbor_source)
+            paths, write_funcs = neighbor_graph.graph_files(image_index_file), graph.write_funcs()
+            graph_files = {name: (paths[name], write_funcs[name]) for name in neighbor_graph.GRAPH_FILES}
+            graph_info = {"neighbor_graph": graph.info}
+            stats = graph.stats()
+            print(f"Neighbor graph: {stats['nodes']} memes x {stats['k']} neighbors ({stats['mb']:.1f} MB), "
+                  f"{time.time() - start_time:.2f}s.")
+
+        # Write both indices and swap the manifest atomically so a running server
+        # never sees a half-written file or a mismatched image/text pair.
+        generation = index_store.publish_indices(indices["Image"], indices["Text"],
+                                                 image_index_file, text_index_file, manifest_file,
+                                                 extra_files=graph_files, extra=graph_info)
+        index_store.clear_checkpoint(checkpoint_file)
+        print(f"Faiss indices saved and published as generation {generation}.")
+
+    # Errors propagate: the checkpoint is left behind and the next run reconciles
     finally:
+        content_cache.close()
         if conn:
             conn.close()
             print("Database connection closed.")
@@ -302,12 +1116,52 @@ def index_directory(image_dir, db_file, image_index_file, text_index_file):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Index meme images: metadata to SQLite, embeddings to Faiss.")
     parser.add_argument("image_dir", help="Directory containing meme images.")
-    parser.add_argument("--db", default=DEFAULT_DB_FILE,
-                        help=f"SQLite database file (default: {DEFAULT_DB_FILE})")
-    parser.add_argument("--img-idx", default=DEFAULT_IMAGE_INDEX_FILE,
-                        help=f"Output Faiss index file for images (default: {DEFAULT_IMAGE_INDEX_FILE})")
-    parser.add_argument("--txt-idx", default=DEFAULT_TEXT_INDEX_FILE,
-                        help=f"Output Faiss index file for text (default: {DEFAULT_TEXT_INDEX_FILE})")
+    parser.add_argument("--config",
+                        help="JSON config shared with app.py; supplies file paths, index_factory and search_params")
+    parser.add_argument("--db",
+                        help=f"SQLite database file (default: from --config, else {DEFAULT_DB_FILE})")
+    parser.add_argument("--img-idx",
+                        help=f"Output Faiss index file for images (default: from --config, else {DEFAULT_IMAGE_INDEX_FILE})")
+    parser.add_argument("--txt-idx",
+                        help=f"Output Faiss index file for text (default: from --config, else {DEFAULT_TEXT_INDEX_FILE})")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Number of images/texts encoded per model call (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--ocr-workers", type=int, default=DEFAULT_OCR_WORKERS,
+                        help=f"OCR worker processes; 0 runs OCR in-process (default: {DEFAULT_OCR_WORKERS})")
+    parser.add_argument("--embed-workers", type=int, default=DEFAULT_EMBED_WORKERS,
+                        help=f"Threads batching and encoding embeddings (default: {DEFAULT_EMBED_WORKERS})")
+    run_mode = parser.add_mutually_exclusive_group()
+    run_mode.add_argument("--rebuild", action='store_true',
+                          help="Discard existing metadata and indices and index everything from scratch")
+    run_mode.add_argument("--resume", action='store_true',
+                          help="Continue an interrupted run (required after an interrupted --rebuild)")
+    parser.add_argument("--commit-every", type=int, default=DEFAULT_COMMIT_EVERY,
+                        help=f"Metadata rows per SQLite transaction (default: {DEFAULT_COMMIT_EVERY})")
+    parser.add_argument("--wal", action='store_true',
+                        help="Switch the database to WAL journaling with synchronous=NORMAL")
+    parser.add_argument("--bulk-fts", action='store_true',
+                        help="Skip per-row FTS triggers and rebuild the full-text index once at the end")
+    parser.add_argument("--thumb-dir",
+                        help=f"Thumbnail cache directory (default: from --config, else {thumbnails.DEFAULT_THUMBNAIL_DIR})")
+    parser.add_argument("--no-thumbnails", action='store_true', help="Don't create thumbnails")
+    parser.add_argument("--backfill-thumbnails", action='store_true',
+                        help="Also create missing thumbnails for images indexed by earlier runs")
+    parser.add_argument("--dup-distance", type=int,
+                        help="Max dHash bit distance for near-duplicates (default: from --config, "
+                             f"else {perceptual_hash.DEFAULT_MAX_DISTANCE})")
+    parser.add_argument("--no-dedup", action='store_true', help="Don't detect near-duplicate images")
+    parser.add_argument("--backfill-hashes", action='store_true',
+                        help="Compute perceptual hashes for images indexed before near-duplicate detection")
+    parser.add_argument("--ocr-max-side", type=int,
+                        help="Longest side images are shrunk to before OCR, 0 for full size (default: from --config, "
+                             f"else {ocr_preprocess.DEFAULT_SETTINGS.max_side})")
+    parser.add_argument("--neighbor-k", type=int,
+                        help="Neighbors per meme in the /similar graph, 0 for no graph (default: from --config, "
+                             f"else {neighbor_graph.DEFAULT_K})")
+    parser.add_argument("--cache-dir",
+                        help=f"Embedding/OCR cache directory (default: from --config, else {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--recall-k", type=int, default=DEFAULT_RECALL_K,
+                        help=f"k used when reporting recall of approximate indices (default: {DEFAULT_RECALL_K})")
 
     args = parser.parse_args()
 
@@ -315,6 +1169,58 @@ if __name__ == "__main__":
         print(f"Error: Directory not found at {args.image_dir}", file=sys.stderr)
         sys.exit(1)
 
-    index_directory(args.image_dir, args.db, args.img_idx, args.txt_idx)
+    config = {}
+    if args.config:
+        try:
+            with open(args.config, 'r') as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error: Could not read config file {args.config}: {e}", file=sys.stderr)
+            sys.exit(1)
+    db_file = args.db or config.get("database_file", DEFAULT_DB_FILE)
+    image_index_file = args.img_idx or config.get("image_index_file", DEFAULT_IMAGE_INDEX_FILE)
+    text_index_file = args.txt_idx or config.get("text_index_file", DEFAULT_TEXT_INDEX_FILE)
+    thumb_dir = None if args.no_thumbnails else (
+        args.thumb_dir or config.get("thumbnail_dir", thumbnails.DEFAULT_THUMBNAIL_DIR))
+    cache_dir = args.cache_dir or config.get("embedding_cache_dir", DEFAULT_CACHE_DIR)
+    duplicate_config = config.get("near_duplicates", {})
+    dedup_distance = None if args.no_dedup or not duplicate_config.get("enabled", True) else (
+        args.dup_distance if args.dup_distance is not None
+        else duplicate_config.get("max_distance", perceptual_hash.DEFAULT_MAX_DISTANCE))
+    ocr_options = ocr_preprocess.settings_from_config(config.get("ocr", {}))
+    if args.ocr_max_side is not None:
+        ocr_options = ocr_options._replace(max_side=args.ocr_max_side)
+    graph_config = config.get("neighbor_graph", {})
+    neighbor_k = args.neighbor_k if args.neighbor_k is not None else (
+        graph_config.get("k", neighbor_graph.DEFAULT_K) if graph_config.get("enabled", True) else 0)
+    neighbor_source = graph_config.get("source", neighbor_graph.DEFAULT_SOURCE)
+    if neighbor_source not in ("image", "text"):
+        print(f"Error: neighbor_graph source must be \"image\" or \"text\", not {neighbor_source!r}", file=sys.stderr)
+        sys.exit(1)
+    for output_file in (db_file, image_index_file, text_index_file):
+        if os.path.dirname(output_file):
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    if args.batch_size < 1 or args.embed_workers < 1 or args.commit_every < 1 or args.ocr_workers < 0:
+        print("Error: --batch-size, --embed-workers and --commit-every must be at least 1, --ocr-workers at least 0",
+              file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        index_directory(args.image_dir, db_file, image_index_file, text_index_file, batch_size=args.batch_size,
+                        ocr_workers=args.ocr_workers, embed_workers=args.embed_workers, rebuild=args.rebuild,
+                        commit_every=args.commit_every, wal=args.wal, bulk_fts=args.bulk_fts,
+                        index_factory=config.get("index_factory", index_store.DEFAULT_INDEX_FACTORY),
+                        train_sample_size=config.get("index_train_sample_size", index_store.DEFAULT_TRAIN_SAMPLE_SIZE),
+                        search_params=config.get("search_params", {}), recall_k=args.recall_k,
+                        manifest_file=config.get("index_manifest_file"), thumb_dir=thumb_dir,
+                        thumb_sizes=config.get("thumbnail_sizes", thumbnails.DEFAULT_THUMBNAIL_SIZES),
+                        backfill_thumbs=args.backfill_thumbnails, cache_dir=cache_dir, resume=args.resume,
+                        dedup_distance=dedup_distance, backfill_hashes=args.backfill_hashes, ocr_options=ocr_options,
+                        neighbor_k=neighbor_k, neighbor_source=neighbor_source)
+    except Exception as e:
+        # The checkpoint stays, so the next run reconciles whatever this one wrote
+        print(f"Error: Indexing failed: {e}", file=sys.stderr)
+        sys.exit(1)
 
-    print("Indexing process finished.")
\ No newline at end of file
+    print("Indexing process finished.")
@@ -0,0 +1,284 @@
+"""Faiss index helpers shared by the indexer (index_memes.py) and the search server (app.py)."""
+import os
+import sys
+import re
+import json
+import time
+import hashlib
+import numpy as np
+import faiss
+
+DEFAULT_INDEX_FACTORY = "Flat"
+DEFAULT_TRAIN_SAMPLE_SIZE = 100000
+QUERY_TIME_PARAMS = ("nprobe", "efSearch") # search_params keys forwarded to Faiss
+RECALL_QUERY_COUNT = 1000
+MANIFEST_FILENAME = "manifest.json"
+CHECKPOINT_FILENAME = "index_checkpoint.json" # Present while an indexer run hasn't published its indices
+KEEP_GENERATIONS = 3 # Published generations kept on disk (current + in-flight readers)
+
+def create_index(index_factory, dim):
+    """Creates an empty id-mapped index from a Faiss index_factory string.
+
+    Examples: "Flat" (exact), "HNSW32", "IVF1024,Flat", "IVF1024,PQ64", "SQ8".
+    """
+    index = faiss.index_factory(dim, index_factory, faiss.METRIC_L2)
+    if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.IndexIDMap(index)
+    return index
+
+def train_index(index, embeddings, train_sample_size=DEFAULT_TRAIN_SAMPLE_SIZE, seed=0):
+    """Trains the index (IVF centroids, PQ/SQ codebooks) on a random sample of embeddings."""
+    if index.is_trained:
+        return
+    sample = embeddings
+    if len(embeddings) > train_sample_size:
+        rng = np.random.default_rng(seed)
+        sample = embeddings[np.sort(rng.choice(len(embeddings), train_sample_size, replace=False))]
+    print(f"Training index on {len(sample)} sample vectors...")
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+def apply_search_params(index, search_params):
+    """Sets query-time knobs (nprobe for IVF, efSearch for HNSW) found in search_params.
+
+    Knobs that don't apply to the index type are ignored.
+    """
+    if index is None:
+        return
+    parameter_space = faiss.ParameterSpace()
+    for name in QUERY_TIME_PARAMS:
+        if name not in search_params:
+            continue
+        try:
+            parameter_space.set_index_parameter(index, name, search_params[name])
+        except RuntimeError:
+            pass # Not applicable, e.g. nprobe on an HNSW index
+
+def index_ids(index):
+    """The ids stored in an id-mapped index, as an int64 array."""
+    return faiss.vector_to_array(index.id_map).astype(np.int64)
+
+def reconstruct_positions(index, positions):
+    """Stored vectors of an id-mapped index at internal positions (indexes into index_ids())."""
+    inner = faiss.downcast_index(index.index)
+    temporary_map = hasattr(inner, "make_direct_map") and inner.direct_map.type == faiss.DirectMap.NoMap
+    if temporary_map:
+        inner.make_direct_map() # IVF lists can't be addressed by position without one
+    try:
+        return inner.reconstruct_batch(np.ascontiguousarray(positions, dtype=np.int64))
+    finally:
+        if temporary_map:
+            inner.make_direct_map(False) # Don't write the map out with the index
+
+def reconstruct_ids(index, ids):
+    """Stored vectors of the given ids (all of which must be in the index)."""
+    id_map = index_ids(index)
+    order = np.argsort(id_map)
+    return reconstruct_positions(index, order[np.searchsorted(id_map, ids, sorter=order)])
+
+def remove_ids(index, ids):
+    """Removes ids from the index, returning the number of removed vectors.
+
+    Indices that can't delete in place (HNSW graphs) are rebuilt from their stored
+    vectors without the removed ids: O(index size) however few ids go, exact for Flat/SQ
+    storage and lossy for PQ codes. Callers should batch removals into one call per run.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    try:
+        return index.remove_ids(ids)
+    except RuntimeError:
+        pass
+    inner = faiss.downcast_index(index.index)
+    if hasattr(inner, "make_direct_map"):
+        inner.make_direct_map()
+    id_map = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(id_map, ids)
+    removed = int(len(id_map) - keep.sum())
+    if removed == 0:
+        return 0
+    print(f"Warning: {type(inner).__name__} can't remove vectors in place; rebuilding it from {int(keep.sum())} "
+          f"stored vectors to remove {removed}. Every run that changes or deletes files pays for this; "
+          "use a Flat or IVF index_factory for incrementally indexed collections.", file=sys.stderr)
+    vectors = inner.reconstruct_n(0, index.ntotal)
+    index.reset()
+    if keep.any():
+        index.add_with_ids(vectors[keep], id_map[keep])
+    return removed
+
+def measure_recall(index, embeddings, ids, queries, k=10):
+    """Recall@k of `index` against exact (flat) search over the same embeddings."""
+    if len(queries) > RECALL_QUERY_COUNT:
+        queries = queries[np.random.default_rng(0).choice(len(queries), RECALL_QUERY_COUNT, replace=False)]
+    k = min(k, len(ids))
+    exact = faiss.IndexIDMap(faiss.IndexFlatL2(embeddings.shape[1]))
+    exact.add_with_ids(embeddings, ids)
+    _, exact_ids = exact.search(queries, k)
+    _, approx_ids = index.search(queries, k)
+    hits = sum(len(set(e) & set(a)) for e, a in zip(exact_ids.tolist(), approx_ids.tolist()))
+    return hits / float(len(queries) * k)
+
+def read_index(index_path, load_mode="memory"):
+    """Reads an index; load_mode "mmap" maps it read-only instead of copying it into memory.
+
+    Memory-mapped indices are served from the OS page cache, so worker processes reading
+    the same file share one copy, and startup doesn't have to read the whole file first.
+    Published index files are never modified in place, which is what makes mapping them safe.
+    """
+    if load_mode == "mmap":
+        # IO_FLAG_MMAP_IFC (newer Faiss) also maps flat code arrays; IO_FLAG_MMAP alone only
+        # maps IVF inverted lists.
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"Warning: Could not memory-map {index_path} ({e}); loading it into memory.", file=sys.stderr)
+    elif load_mode != "memory":
+        raise ValueError(f"Unknown index_load_mode: {load_mode}")
+    return faiss.read_index(index_path)
+
+def describe_index(index):
+    """Short human-readable description of an (id-mapped) index."""
+    if index is None:
+        return "none"
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    return f"{type(inner).__name__} ({index.ntotal} vectors, trained={index.is_trained})"
+
+def index_generation(index_files):
+    """Identifies the current on-disk version of the index files.
+
+    Derived from file size and mtime, so every process on the host computes the same value.
+    """
+    digest = hashlib.sha1()
+    for index_file in index_files:
+        if index_file and os.path.exists(index_file):
+            stat = os.stat(index_file)
+            digest.update(f"{index_file}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+# --- Atomic Publishing ---
+# The indexer never overwrites a file a server might be reading. Each publish writes
+# versioned index files (images.g000042.faiss) via temp file + fsync + rename, then
+# atomically replaces manifest.json, which names the files of the current generation.
+# The unversioned paths are kept as hard links to the newest files for tools that
+# read them directly.
+def default_manifest_file(image_index_file):
+    return os.path.join(os.path.dirname(os.path.abspath(image_index_file)), MANIFEST_FILENAME)
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return # Not supported on this platform
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write(path, write_func):
+    """Calls write_func(temp_path), fsyncs the result and renames it over path."""
+    directory = os.path.dirname(os.path.abspath(path))
+    temp_path = os.path.join(directory, f".{os.path.basename(path)}.tmp-{os.getpid()}")
+    try:
+        write_func(temp_path)
+        with open(temp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    _fsync_dir(directory)
+
+def versioned_path(path, generation):
+    root, ext = os.path.splitext(path)
+    return f"{root}.g{generation:06d}{ext}"
+
+def read_manifest(manifest_file):
+    """Returns the manifest dict, or None if there is no (readable) manifest."""
+    try:
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def manifest_paths(manifest, manifest_file):
+    """Resolves the manifest's relative file names against the manifest's directory."""
+    directory = os.path.dirname(os.path.abspath(manifest_file))
+    return {name: os.path.join(directory, path) for name, path in manifest["files"].items()}
+
+def publish(files, manifest_file, write_funcs, extra=None):
+    """Publishes a new generation.
+
+    files maps logical names to unversioned paths; write_funcs maps the same names to
+    functions that write the content to a given path. Returns the new generation number.
+    """
+    previous = read_manifest(manifest_file)
+    generation = (previous["generation"] if previous else 0) + 1
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+    published = {}
+    for name, path in files.items():
+        target = versioned_path(path, generation)
+        atomic_write(target, write_funcs[name])
+        # Refresh the unversioned path as a hard link (atomic rename, no second copy)
+        link_temp = f"{path}.link-{os.getpid()}"
+        try:
+            if os.path.exists(link_temp):
+                os.remove(link_temp)
+            os.link(target, link_temp)
+            os.replace(link_temp, path)
+        except OSError:
+            atomic_write(path, write_funcs[name]) # Filesystem without hard links
+        published[name] = os.path.relpath(target, manifest_dir)
+    manifest = {"generation": generation, "created": time.time(), "files": published}
+    manifest.update(extra or {})
+    atomic_write(manifest_file, lambda temp_path: _write_json(temp_path, manifest))
+    for path in files.values():
+        remove_old_generations(path, generation)
+    return generation
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+def remove_old_generations(path, generation, keep=KEEP_GENERATIONS):
+    root, ext = os.path.splitext(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"\.g(\d{6})" + re.escape(ext) + "$")
+    for filename in os.listdir(directory):
+        match = pattern.match(filename)
+        if match and int(match.group(1)) <= generation - keep:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+def checkpoint_file(manifest_file):
+    return os.path.join(os.path.dirname(os.path.abspath(manifest_file)), CHECKPOINT_FILENAME)
+
+def read_checkpoint(path):
+    """Returns the state saved by an indexer run that hasn't finished, or None."""
+    return read_manifest(path)
+
+def write_checkpoint(path, state):
+    state = dict(state, updated=time.time())
+    atomic_write(path, lambda temp_path: _write_json(temp_path, state))
+
+def clear_checkpoint(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def publish_indices(image_index, text_index, image_index_file, text_index_file, manifest_file=None,
+                    extra_files=None, extra=None):
+    """Atomically publishes both Faiss indices as one generation. Returns the generation.
+
+    extra_files maps further logical names to (path, write_func) pairs published in the
+    same generation (the neighbor graph); extra is merged into the manifest.
+    """
+    manifest_file = manifest_file or default_manifest_file(image_index_file)
+    files = {"image_index": image_index_file, "text_index": text_index_file}
+    write_funcs = {"image_index": lambda path: faiss.write_index(image_index, path),
+                   "text_index": lambda path: faiss.write_index(text_index, path)}
+    for name, (path, write_func) in (extra_files or {}).items():
+        files[name], write_funcs[name] = path, write_func
+    return publish(files, manifest_file, write_funcs,
+                   extra=dict(extra or {}, ntotal={"image_index": image_index.ntotal, "text_index": text_index.ntotal}))
@@ -0,0 +1,129 @@
+"""Read-only, array-backed copy of the memes table for hydrating search results in memory.
+
+Instead of a dict per row, all paths and OCR texts are concatenated into two UTF-8
+buffers indexed by NumPy offset arrays, ids are a sorted int64 array (lookups are a
+binary search), content hashes are raw 32-byte rows and near-duplicate links an int64
+array. Strings are decoded only for
+the rows a request returns. A million memes with typical paths cost roughly 100 MB plus
+the stored OCR text, which is truncated to ocr_text_chars characters.
+"""
+import os
+import sys
+import sqlite3
+import urllib.parse
+import time
+from array import array
+import numpy as np
+
+DEFAULT_OCR_TEXT_CHARS = 256
+HASH_BYTES = 32 # sha256
+_EMPTY_HASH = bytes(HASH_BYTES)
+NO_CANONICAL = -1
+
+class MetadataStore:
+    """id -> {"id", "image_path", "ocr_text", "content_hash"} backed by flat arrays."""
+
+    def __init__(self, ids, path_offsets, path_buffer, text_offsets, text_buffer, hashes, ocr_text_chars,
+                 canonical_ids=None):
+        self.ids = ids
+        self.path_offsets = path_offsets
+        self.path_buffer = path_buffer
+        self.text_offsets = text_offsets
+        self.text_buffer = text_buffer
+        self.hashes = hashes
+        self.ocr_text_chars = ocr_text_chars
+        self.canonical_ids = canonical_ids if canonical_ids is not None else np.full(len(ids), NO_CANONICAL, np.int64)
+
+    @classmethod
+    def from_database(cls, db_file, ocr_text_chars=DEFAULT_OCR_TEXT_CHARS):
+        """Reads all rows in one pass; only the flat buffers are kept, never per-row objects."""
+        ids, canonical_ids = array('q'), array('q')
+        path_offsets, text_offsets = array('q', [0]), array('q', [0])
+        paths, texts, hashes = bytearray(), bytearray(), bytearray()
+        conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(db_file))}?mode=ro", uri=True)
+        try:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(memes)")}
+            canonical_column = "canonical_id" if "canonical_id" in columns else "NULL" # Older databases
+            cursor = conn.execute(f"SELECT id, image_path, ocr_text, content_hash, {canonical_column} FROM memes ORDER BY id")
+            for row_id, image_path, ocr_text, content_hash, canonical_id in cursor:
+                ids.append(row_id)
+                canonical_ids.append(NO_CANONICAL if canonical_id is None else canonical_id)
+                paths += image_path.encode('utf-8')
+                path_offsets.append(len(paths))
+                texts += (ocr_text or "")[:ocr_text_chars].encode('utf-8')
+                text_offsets.append(len(texts))
+                hashes += bytes.fromhex(content_hash) if content_hash else _EMPTY_HASH
+        finally:
+            conn.close()
+        return cls(np.frombuffer(ids, dtype=np.int64), np.frombuffer(path_offsets, dtype=np.int64), bytes(paths),
+                   np.frombuffer(text_offsets, dtype=np.int64), bytes(texts),
+                   np.frombuffer(bytes(hashes), dtype=np.uint8).reshape(-1, HASH_BYTES), ocr_text_chars,
+                   np.frombuffer(canonical_ids, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _positions(self, ids):
+        """Positions of the given ids in the arrays; -1 where an id is unknown."""
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, ids)
+        positions[positions >= len(self.ids)] = 0
+        found = (self.ids[positions] == ids) if len(self.ids) else np.zeros(len(ids), dtype=bool)
+        return np.where(found, positions, -1)
+
+    def _row(self, pos):
+        content_hash = self.hashes[pos].tobytes()
+        return {
+            "id": int(self.ids[pos]),
+            "image_path": self.path_buffer[self.path_offsets[pos]:self.path_offsets[pos + 1]].decode('utf-8'),
+            "ocr_text": self.text_buffer[self.text_offsets[pos]:self.text_offsets[pos + 1]].decode('utf-8'),
+            "content_hash": content_hash.hex() if content_hash != _EMPTY_HASH else None,
+        }
+
+    def fetch(self, ids):
+        """Same shape as app.fetch_metadata: {id: row dict} for the ids that are present."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        return {row_id: self._row(pos) for row_id, pos in zip(ids, self._positions(ids).tolist()) if pos >= 0}
+
+    def get(self, row_id):
+        pos = int(self._positions([row_id])[0])
+        return self._row(pos) if pos >= 0 else None
+
+    def groups(self, ids):
+        """{id: canonical id, or the id itself if it isn't a near-duplicate} for the ids that are present."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        groups = {}
+        for row_id, pos in zip(ids, self._positions(ids).tolist()):
+            if pos >= 0:
+                canonical_id = int(self.canonical_ids[pos])
+                groups[row_id] = row_id if canonical_id == NO_CANONICAL else canonical_id
+        return groups
+
+    def memory_bytes(self):
+        return (self.ids.nbytes + self.path_offsets.nbytes + self.text_offsets.nbytes + self.hashes.nbytes
+                + self.canonical_ids.nbytes
+                + len(self.path_buffer) + len(self.text_buffer))
+
+    def stats(self):
+        count = len(self)
+        size = self.memory_bytes()
+        return {"rows": count, "memory_mb": size / 2**20, "ocr_text_chars": self.ocr_text_chars,
+                "bytes_per_meme": size / count if count else 0.0,
+                "mb_per_million_memes": size / count * 1e6 / 2**20 if count else 0.0}
+
+def load_metadata_store(db_file, ocr_text_chars=DEFAULT_OCR_TEXT_CHARS):
+    """Builds a MetadataStore and reports its size. Returns None if the database can't be read."""
+    start_time = time.time()
+    try:
+        store = MetadataStore.from_database(db_file, ocr_text_chars)
+    except sqlite3.Error as e:
+        print(f"Warning: Could not load metadata store from {db_file}: {e}", file=sys.stderr)
+        return None
+    stats = store.stats()
+    print(f"Metadata store: {stats['rows']} memes, {stats['memory_mb']:.1f} MB "
+          f"({stats['mb_per_million_memes']:.0f} MB per million memes), loaded in {time.time() - start_time:.2f} seconds")
+    return store
@@ -0,0 +1,158 @@
+"""k-nearest-neighbor graph over the indexed vectors, for "more like this" lookups.
+
+The indexer finds each meme's k nearest neighbors in one of the Faiss indices with
+batched multi-query searches and publishes them with the index generation as two .npy
+files: an int64 neighbor matrix and a float32 matrix of their (squared L2) distances.
+Row i belongs to meme id i; -1 pads rows of missing ids and short lists. The server
+memory-maps both, so a lookup reads one row: O(k), with no model call or Faiss search,
+and worker processes share the pages.
+
+Incremental runs update the previous graph instead of rebuilding it:
+  - rows of new and changed ids are searched afresh,
+  - rows that pointed at removed or changed ids are searched again,
+  - each new id is offered to the lists of its neighbors and their neighbors, and takes
+    a place in those it is closer than the current k-th entry of.
+Nodes further away can still miss a new id that belongs in their list, so once the ids
+touched since the last full build exceed FULL_REBUILD_FRACTION of the graph, it is
+rebuilt from scratch.
+"""
+import os
+import sys
+import numpy as np
+
+import index_store
+
+DEFAULT_K = 20
+DEFAULT_SOURCE = "image" # Index whose vectors define similarity: "image" or "text"
+SEARCH_CHUNK = 8192 # Queries per Faiss search call
+INSERT_CHUNK = 64 # New ids whose two-hop candidates are reconstructed together
+FULL_REBUILD_FRACTION = 0.2
+GRAPH_FILES = ("neighbor_ids", "neighbor_distances") # Manifest entries
+
+class NeighborGraph:
+    """Neighbor and distance matrices plus {"k", "source", "nodes", "touched"} (kept in the manifest)."""
+
+    def __init__(self, neighbors, distances, info):
+        self.neighbors = neighbors
+        self.distances = distances
+        self.info = dict(info)
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    def lookup(self, node_id, count=None):
+        """[(neighbor id, distance)] of node_id, nearest first; [] for ids not in the graph."""
+        if not 0 <= node_id < len(self.neighbors):
+            return []
+        neighbors, distances = self.neighbors[node_id, :count], self.distances[node_id, :count]
+        valid = neighbors >= 0
+        return list(zip(neighbors[valid].tolist(), distances[valid].tolist()))
+
+    def stats(self):
+        return dict(self.info, rows=len(self.neighbors),
+                    mb=(self.neighbors.nbytes + self.distances.nbytes) / 2**20)
+
+    def write_funcs(self):
+        """Writers for index_store.publish, keyed like GRAPH_FILES."""
+        return dict(zip(GRAPH_FILES, (lambda path: _save(path, self.neighbors),
+                                      lambda path: _save(path, self.distances))))
+
+def _save(path, array):
+    with open(path, 'wb') as f: # np.save(path) would append .npy to publish's temp file name
+        np.save(f, np.ascontiguousarray(array))
+
+def graph_files(image_index_file):
+    """{GRAPH_FILES name: unversioned path}: neighbor_ids.npy etc. next to the image index."""
+    directory = os.path.dirname(os.path.abspath(image_index_file))
+    return {name: os.path.join(directory, f"{name}.npy") for name in GRAPH_FILES}
+
+def load_published(manifest, manifest_file):
+    """The graph published with a manifest's generation, memory-mapped; None if it has none."""
+    if not manifest or "neighbor_graph" not in manifest:
+        return None
+    paths = index_store.manifest_paths(manifest, manifest_file)
+    try:
+        return NeighborGraph(np.load(paths["neighbor_ids"], mmap_mode='r'),
+                             np.load(paths["neighbor_distances"], mmap_mode='r'), manifest["neighbor_graph"])
+    except (KeyError, OSError, ValueError) as e:
+        print(f"Warning: Could not load the neighbor graph of generation {manifest.get('generation')}: {e}",
+              file=sys.stderr)
+        return None
+
+def _search(index, ids, vectors, k):
+    """k neighbors of each vector other than its own id: (neighbors, distances), -1/inf padded."""
+    distances, labels = index.search(np.ascontiguousarray(vectors, dtype=np.float32), k + 1)
+    distances[labels < 0] = np.inf
+    # Move each query's own id to the end (keeping the order of the rest), then drop the last column
+    order = np.argsort(labels == ids[:, None], axis=1, kind='stable')
+    return np.take_along_axis(labels, order, 1)[:, :k], np.take_along_axis(distances, order, 1)[:, :k]
+
+def _search_rows(index, ids, neighbors, distances, k, vectors_of):
+    for start in range(0, len(ids), SEARCH_CHUNK):
+        chunk = ids[start:start + SEARCH_CHUNK]
+        neighbors[chunk], distances[chunk] = _search(index, chunk, vectors_of(start, chunk), k)
+
+def _empty(rows, k):
+    return np.full((rows, k), -1, dtype=np.int64), np.full((rows, k), np.inf, dtype=np.float32)
+
+def _offer(index, nodes, searched, neighbors, distances):
+    """Inserts each new node into the lists of its neighbors and their neighbors where it is close enough.
+
+    Rows in searched are already exact and are left alone.
+    """
+    candidates = [np.setdiff1d(np.union1d(neighbors[node], neighbors[neighbors[node][neighbors[node] >= 0]].ravel()),
+                               np.append(searched, -1)) for node in nodes.tolist()]
+    all_candidates = np.unique(np.concatenate(candidates)) if candidates else np.zeros(0, dtype=np.int64)
+    if not all_candidates.size:
+        return
+    node_vectors = index_store.reconstruct_ids(index, nodes)
+    candidate_vectors = index_store.reconstruct_ids(index, all_candidates)
+    for node, vector, others in zip(nodes.tolist(), node_vectors, candidates):
+        others_distances = ((candidate_vectors[np.searchsorted(all_candidates, others)] - vector) ** 2).sum(axis=1)
+        for other, distance in zip(others.tolist(), others_distances.tolist()):
+            if not distance < distances[other, -1]:
+                continue
+            pos = int(np.searchsorted(distances[other], distance, side='right'))
+            neighbors[other, pos + 1:], distances[other, pos + 1:] = neighbors[other, pos:-1], distances[other, pos:-1]
+            neighbors[other, pos], distances[other, pos] = node, distance
+
+def build(index, k=DEFAULT_K, source=DEFAULT_SOURCE):
+    """Graph of every vector in an id-mapped index."""
+    ids = index_store.index_ids(index)
+    neighbors, distances = _empty(int(ids.max()) + 1 if ids.size else 0, k)
+    _search_rows(index, ids, neighbors, distances, k,
+                 lambda start, chunk: index_store.reconstruct_positions(index, np.arange(start, start + len(chunk))))
+    return NeighborGraph(neighbors, distances, {"k": k, "source": source, "nodes": len(ids), "touched": 0})
+
+def update(graph, index, added_ids, removed_ids, k=DEFAULT_K, source=DEFAULT_SOURCE):
+    """The graph of index after added_ids were added and removed_ids removed since graph was built.
+
+    Changed ids belong in both lists. Falls back to build() when there is no usable graph
+    or too much has changed since the last full build.
+    """
+    added_ids = np.unique(np.asarray(added_ids, dtype=np.int64))
+    removed_ids = np.unique(np.asarray(removed_ids, dtype=np.int64))
+    if graph is None or graph.k != k or graph.info.get("source") != source:
+        return build(index, k, source)
+    touched = graph.info.get("touched", 0) + len(added_ids) + len(removed_ids)
+    if touched > FULL_REBUILD_FRACTION * max(1, index.ntotal):
+        print(f"{touched} ids changed since the neighbor graph was built; rebuilding it.")
+        return build(index, k, source)
+
+    ids = index_store.index_ids(index)
+    neighbors, distances = _empty(max(len(graph.neighbors), int(ids.max()) + 1 if ids.size else 0), k)
+    neighbors[:len(graph.neighbors)] = graph.neighbors
+    distances[:len(graph.distances)] = graph.distances
+    gone = np.union1d(removed_ids, added_ids)
+    gone = gone[(gone >= 0) & (gone < len(neighbors))]
+    neighbors[gone], distances[gone] = -1, np.inf
+    queries = np.union1d(added_ids, np.flatnonzero(np.isin(neighbors, gone).any(axis=1)))
+    queries = queries[np.isin(queries, ids)]
+    _search_rows(index, queries, neighbors, distances, k,
+                 lambda start, chunk: index_store.reconstruct_ids(index, chunk))
+
+    new_nodes = added_ids[np.isin(added_ids, ids)]
+    for start in range(0, len(new_nodes), INSERT_CHUNK):
+        _offer(index, new_nodes[start:start + INSERT_CHUNK], queries, neighbors, distances)
+    return NeighborGraph(neighbors, distances, {"k": k, "source": source, "nodes": len(ids), "touched": touched})
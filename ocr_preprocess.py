@@ -0,0 +1,95 @@
+"""Preprocessing between image files and EasyOCR: downscaling, a text gate and frame sampling.
+
+Passing file paths straight to reader.readtext() runs detection and recognition on the
+image at full size, and on whichever frame the image library picks for animations.
+read_text() instead:
+  - decodes each image once with PIL (JPEGs at reduced scale when they are larger than
+    needed) and shrinks it to at most max_side pixels on its longer side,
+  - skips OCR for frames whose edge density is below min_edge_density: text is dense,
+    high-contrast strokes, so flat, blank and smooth images can't contain any. Density is
+    taken in the busiest tile of a small thumbnail, so one short caption on a large
+    screenshot still passes. The gate costs about a millisecond,
+  - reads up to max_frames frames of animated GIF/WebP files, spread evenly over the
+    animation. Frames that look like ones already read (dHash) are skipped, and lines
+    seen in an earlier frame aren't repeated.
+"""
+from collections import namedtuple
+import numpy as np
+from PIL import Image, ImageFilter
+
+import perceptual_hash
+
+# max_side: longest side in pixels fed to OCR (0 keeps the full size)
+# min_edge_density: edge pixel fraction of the busiest tile below which OCR is skipped (0 disables the gate)
+# max_frames: frames read from animated images
+OCRSettings = namedtuple("OCRSettings", "max_side min_edge_density max_frames")
+DEFAULT_SETTINGS = OCRSettings(max_side=1600, min_edge_density=0.005, max_frames=4)
+GATE_SIDE = 256 # Thumbnail size the edge density is measured on
+GATE_TILES = 8 # The thumbnail is split into GATE_TILES x GATE_TILES tiles
+EDGE_THRESHOLD = 64 # Gradient magnitude (0-255) that counts as an edge
+SAME_FRAME_DISTANCE = 4 # dHash bits within which two frames count as the same picture
+
+def settings_from_config(ocr_config):
+    """OCRSettings from the "ocr" config section (missing keys keep their defaults)."""
+    return DEFAULT_SETTINGS._replace(**{name: ocr_config[name] for name in OCRSettings._fields if name in ocr_config})
+
+def settings_tag(settings):
+    """Short description of settings that change OCR output, for cache keys."""
+    return f"side{settings.max_side}-edge{settings.min_edge_density:g}-frames{settings.max_frames}"
+
+def edge_density(img):
+    """Fraction of pixels on a strong edge in the busiest tile of a GATE_SIDE grayscale thumbnail."""
+    thumb = img.convert("L")
+    thumb.thumbnail((GATE_SIDE, GATE_SIDE), Image.BILINEAR)
+    edges = np.asarray(thumb.filter(ImageFilter.FIND_EDGES))[1:-1, 1:-1] >= EDGE_THRESHOLD # Border is always 0
+    tile_h, tile_w = max(1, edges.shape[0] // GATE_TILES), max(1, edges.shape[1] // GATE_TILES)
+    return max((float(edges[y:y + tile_h, x:x + tile_w].mean())
+                for y in range(0, edges.shape[0], tile_h) for x in range(0, edges.shape[1], tile_w)), default=0.0)
+
+def frame_indices(n_frames, max_frames):
+    """Up to max_frames frame numbers spread evenly over an animation, always including the first."""
+    if n_frames <= 1 or max_frames <= 1:
+        return [0]
+    step = n_frames / min(n_frames, max_frames)
+    return sorted({int(i * step) for i in range(min(n_frames, max_frames))})
+
+def sample_frames(img, max_frames):
+    """The RGB frames of an image to OCR (one for still images)."""
+    frames = []
+    for index in frame_indices(getattr(img, "n_frames", 1), max_frames):
+        img.seek(index)
+        frames.append(img.convert("RGB"))
+    return frames
+
+def downscale(img, max_side):
+    """img resized so its longer side is at most max_side."""
+    if not max_side or max(img.size) <= max_side:
+        return img
+    scale = max_side / max(img.size)
+    # Area averaging: the usual filter for shrinking text, and faster than LANCZOS
+    return img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.BOX)
+
+def _normalized(line):
+    return " ".join(line.split()).casefold()
+
+def read_text(image_path, reader, settings=DEFAULT_SETTINGS):
+    """OCR text of an image file (all sampled frames, without repeated lines)."""
+    with Image.open(image_path) as img:
+        if img.format == "JPEG" and settings.max_side:
+            img.draft("RGB", (settings.max_side, settings.max_side)) # DCT scaling; never below the requested size
+        frames = sample_frames(img, settings.max_frames)
+    lines, seen_lines, seen_frames = [], set(), []
+    for frame in frames:
+        if len(frames) > 1:
+            frame_hash = perceptual_hash.dhash(frame)
+            if any(perceptual_hash.hamming(frame_hash, seen) <= SAME_FRAME_DISTANCE for seen in seen_frames):
+                continue
+            seen_frames.append(frame_hash)
+        if settings.min_edge_density and edge_density(frame) < settings.min_edge_density:
+            continue
+        # EasyOCR takes arrays in the RGB order its own file loader produces
+        for line in reader.readtext(np.asarray(downscale(frame, settings.max_side)), detail=0, paragraph=True):
+            if _normalized(line) and _normalized(line) not in seen_lines:
+                seen_lines.add(_normalized(line))
+                lines.append(line)
+    return " ".join(lines)
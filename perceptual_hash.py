@@ -0,0 +1,89 @@
+"""Perceptual hashing (dHash) and a BK-tree for finding near-duplicate images.
+
+A dHash compares the brightness of horizontally adjacent pixels in a small grayscale
+thumbnail, so re-encoded, resized or recompressed copies of an image hash to the same or
+nearby values; the Hamming distance between two hashes measures how different they look.
+HASH_SIZE 16 gives 256-bit hashes: coarser hashes can't tell apart two memes that share a
+template but carry different captions, and those must not be merged.
+"""
+from PIL import Image
+
+HASH_SIZE = 16 # Hash bits = HASH_SIZE ** 2
+DEFAULT_MAX_DISTANCE = 8 # Bits (of 256) two images may differ in and still count as near-duplicates
+
+def dhash(img, hash_size=HASH_SIZE):
+    """Difference hash of a PIL image as an int of hash_size ** 2 bits."""
+    if img.format == "JPEG":
+        img.draft("L", (hash_size * 4, hash_size * 4)) # Decode at reduced scale
+    pixels = list(img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def dhash_file(image_path, hash_size=HASH_SIZE):
+    """dHash of an image file (first frame of animations), or None if it can't be decoded."""
+    try:
+        with Image.open(image_path) as img:
+            return dhash(img, hash_size)
+    except Exception:
+        return None
+
+def to_hex(value, hash_size=HASH_SIZE):
+    return format(value, f"0{hash_size * hash_size // 4}x")
+
+def from_hex(text):
+    return int(text, 16)
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """Burkhard-Keller tree over hashes under Hamming distance.
+
+    A query within distance d only descends into children whose edge distance lies in
+    [dist - d, dist + d] (triangle inequality), so small radii visit a small part of the tree.
+    """
+
+    def __init__(self):
+        self.root = None # [hash, item, {distance: child node}]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, item, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, item, {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """All (distance, item) within max_distance of value, closest first."""
+        matches = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[1]))
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def nearest(self, value, max_distance):
+        """The closest (distance, item) within max_distance, or None."""
+        matches = self.search(value, max_distance)
+        return matches[0] if matches else None
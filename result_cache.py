@@ -0,0 +1,182 @@
+"""Caches for fused, hydrated /search results.
+
+Two backends share the same get/put/clear/stats interface:
+  - MemoryResultCache: per-process LRU.
+  - DiskResultCache: SQLite file that every worker process on the host can share.
+Keys include an index generation and a fingerprint of the model and search settings, so
+entries of an older index or configuration are simply never hit again and age out through
+normal eviction.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+import hashlib
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 4096
+
+RESULT_PARAMS = ("k_keyword", "k_vector", "max_results", "rrf_k", "collapse_duplicates", "nprobe", "efSearch")
+
+def settings_fingerprint(settings):
+    """Short hash of the settings results depend on besides the index (model, query encoder, hydration).
+
+    The disk cache outlives the process, and changing these settings doesn't change the
+    index generation, so the fingerprint goes into every key instead.
+    """
+    return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+def make_key(query, search_params, generation, fingerprint=""):
+    """Builds the cache key from the normalized query, result-shaping params, index generation and settings fingerprint.
+
+    Only whitespace is normalized: FTS5 operators are case-sensitive ("cat OR dog" vs.
+    "cat or dog"), so queries differing in case can have different results.
+    """
+    normalized = " ".join(query.split())
+    params = [search_params.get(name) for name in RESULT_PARAMS]
+    return json.dumps([normalized, params, generation, fingerprint], separators=(',', ':'))
+
+class MemoryResultCache:
+    """Thread-safe in-process LRU of key -> result list."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"backend": "memory", "size": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+class DiskResultCache:
+    """SQLite-backed cache shared by all processes that point at the same file.
+
+    Values are stored as JSON. Eviction is approximate LRU on last access time,
+    done every `evict_every` writes so most puts stay a single-row upsert.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, evict_every=64):
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        conn.commit()
+
+    def _conn(self):
+        # One connection per thread; SQLite handles the cross-process locking
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF") # It's a cache; losing it on a crash is fine
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        conn = self._conn()
+        hashed = self._hash(key)
+        try:
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (hashed,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), hashed))
+                conn.commit()
+        except sqlite3.Error:
+            row = None # Busy or corrupt cache: behave like a miss
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        conn = self._conn()
+        try:
+            conn.execute("INSERT OR REPLACE INTO results (key, value, last_used) VALUES (?, ?, ?)",
+                         (self._hash(key), json.dumps(value), time.time()))
+            with self._lock:
+                self._puts += 1
+                evict = self._puts % self.evict_every == 0
+            if evict:
+                conn.execute("""
+                    DELETE FROM results WHERE key IN (
+                        SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM results")
+        conn.commit()
+
+    def stats(self):
+        try:
+            size = self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"backend": "disk", "path": self.path, "size": size, "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+def create_result_cache(cache_config):
+    """Builds the cache described by the "result_cache" config section, or None if disabled."""
+    backend = cache_config.get("backend", "memory")
+    max_entries = cache_config.get("max_entries", DEFAULT_MAX_ENTRIES)
+    if backend == "none" or max_entries <= 0:
+        return None
+    if backend == "memory":
+        return MemoryResultCache(max_entries)
+    if backend == "disk":
+        return DiskResultCache(cache_config.get("path", "index/cache/results.db"), max_entries)
+    raise ValueError(f"Unknown result_cache backend: {backend}")
@@ -0,0 +1,188 @@
+"""Query (text) encoders for the search server.
+
+The server only ever embeds query text, so by default it loads just CLIP's text tower
+("clip_text" backend, via transformers) instead of the full sentence-transformers CLIP
+model with its vision tower. Both produce the same vectors as the indexer's
+SentenceTransformer model, so existing indices stay valid. Heavy libraries (torch,
+transformers, sentence_transformers, onnxruntime) are imported only when an encoder is created.
+
+Backends ("backend" in the "text_encoder" config section):
+  - clip_text: float32 text tower in PyTorch.
+  - clip_text_int8: the same with its Linear layers dynamically quantized to int8 (CPU).
+  - onnx: a text tower exported with `python text_encoder.py export-onnx`, run by ONNX
+    Runtime; export with --quantize for int8 weights.
+  - sentence_transformers: the full model, exactly as the indexer loads it.
+The CLIP backends only know the models in HF_CLIP_MODELS. clip_text falls back to
+sentence_transformers for any other model; clip_text_int8 and onnx refuse it.
+Approximate backends should be validated with benchmarks/check_encoder.py, which compares
+their top-k results against the reference model.
+
+Every backend exposes encode(texts, batch_size=..., show_progress_bar=...) and
+get_sentence_embedding_dimension(), like SentenceTransformer.
+"""
+import sys
+import argparse
+import numpy as np
+
+DEFAULT_BACKEND = "clip_text"
+CLIP_MAX_TOKENS = 77
+# sentence-transformers CLIP names -> the Hugging Face checkpoints they wrap
+HF_CLIP_MODELS = {
+    "clip-ViT-B-32": "openai/clip-vit-base-patch32",
+    "clip-ViT-B-16": "openai/clip-vit-base-patch16",
+    "clip-ViT-L-14": "openai/clip-vit-large-patch14",
+}
+
+def default_device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def set_torch_threads(threads):
+    """Caps torch's intra-op thread pool (per process; with N workers, ~cores / N)."""
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+def hf_clip_checkpoint(model_name, backend="clip_text"):
+    """The Hugging Face checkpoint of a sentence-transformers CLIP model; ValueError for any other model."""
+    if model_name not in HF_CLIP_MODELS:
+        raise ValueError(f"The {backend} backend supports only the CLIP models {', '.join(HF_CLIP_MODELS)}, "
+                         f"not {model_name}. Use \"backend\": \"sentence_transformers\" for other models.")
+    return HF_CLIP_MODELS[model_name]
+
+def _load_tokenizer(checkpoint):
+    from transformers import CLIPTokenizer
+    return CLIPTokenizer.from_pretrained(checkpoint)
+
+class CLIPTextEncoder:
+    """CLIP text tower plus projection (CLIPTextModelWithProjection), nothing else.
+
+    quantize=True replaces the Linear layers with dynamically quantized int8 versions,
+    which roughly halves CPU latency and shrinks the weights about 4x.
+    """
+
+    def __init__(self, model_name, device="cpu", quantize=False):
+        checkpoint = hf_clip_checkpoint(model_name, "clip_text_int8" if quantize else "clip_text")
+        import torch
+        from transformers import CLIPTextModelWithProjection
+        self.torch = torch
+        self.device = device
+        self.tokenizer = _load_tokenizer(checkpoint)
+        self.model = CLIPTextModelWithProjection.from_pretrained(checkpoint).to(device).eval()
+        if quantize:
+            if device != "cpu":
+                raise ValueError("clip_text_int8 runs on the CPU only")
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.config.projection_dim
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        embeddings = [np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)]
+        with self.torch.inference_mode():
+            for start in range(0, len(batch), batch_size):
+                tokens = self.tokenizer(batch[start:start + batch_size], padding=True, truncation=True,
+                                        max_length=CLIP_MAX_TOKENS, return_tensors="pt").to(self.device)
+                embeddings.append(self.model(**tokens).text_embeds.float().cpu().numpy())
+        embeddings = np.vstack(embeddings)
+        return embeddings[0] if single else embeddings
+
+class ONNXTextEncoder:
+    """A CLIP text tower exported by export_onnx(), run with ONNX Runtime on the CPU."""
+
+    def __init__(self, model_name, onnx_path, threads=None):
+        checkpoint = hf_clip_checkpoint(model_name, "onnx")
+        import onnxruntime
+        self.tokenizer = _load_tokenizer(checkpoint)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.dim = self.session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        embeddings = [np.zeros((0, self.dim), dtype=np.float32)]
+        for start in range(0, len(batch), batch_size):
+            tokens = self.tokenizer(batch[start:start + batch_size], padding=True, truncation=True,
+                                    max_length=CLIP_MAX_TOKENS, return_tensors="np")
+            embeddings.append(self.session.run(None, {"input_ids": tokens["input_ids"].astype(np.int64),
+                                                      "attention_mask": tokens["attention_mask"].astype(np.int64)})[0])
+        embeddings = np.vstack(embeddings).astype(np.float32)
+        return embeddings[0] if single else embeddings
+
+def export_onnx(model_name, onnx_path, quantize=False):
+    """Exports CLIP's text tower + projection to ONNX (optionally with int8 weights). Returns the path."""
+    checkpoint = hf_clip_checkpoint(model_name, "onnx")
+    import torch
+    from transformers import CLIPTextModelWithProjection
+    model = CLIPTextModelWithProjection.from_pretrained(checkpoint).eval()
+
+    class TextTower(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).text_embeds
+
+    sample = _load_tokenizer(checkpoint)(["a photo of a cat", "when the code compiles"], padding=True,
+                                      return_tensors="pt")
+    float_path = onnx_path if not quantize else f"{onnx_path}.float32"
+    torch.onnx.export(TextTower(), (sample["input_ids"], sample["attention_mask"]), float_path,
+                      input_names=["input_ids", "attention_mask"], output_names=["text_embeds"],
+                      dynamic_axes={"input_ids": {0: "batch", 1: "tokens"}, "attention_mask": {0: "batch", 1: "tokens"},
+                                    "text_embeds": {0: "batch"}},
+                      opset_version=17)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(float_path, onnx_path, weight_type=QuantType.QInt8)
+    print(f"Exported {model_name} text tower to {onnx_path}{' (int8 weights)' if quantize else ''}")
+    return onnx_path
+
+def load_text_encoder(model_name, encoder_config, device=None):
+    """Creates the query encoder described by the "text_encoder" config section."""
+    backend = encoder_config.get("backend", DEFAULT_BACKEND)
+    model_name = encoder_config.get("model", model_name)
+    threads = encoder_config.get("torch_threads")
+    if backend == "clip_text" and model_name not in HF_CLIP_MODELS:
+        # Not a CLIP model this backend can split; the full model gives the indexer's vectors
+        print(f"Warning: the clip_text backend supports only {', '.join(HF_CLIP_MODELS)}; "
+              f"loading {model_name} with sentence_transformers instead.", file=sys.stderr)
+        backend = "sentence_transformers"
+    if backend == "onnx":
+        return ONNXTextEncoder(model_name, encoder_config["onnx_path"], threads)
+    set_torch_threads(threads)
+    device = device or default_device()
+    if backend in ("clip_text", "clip_text_int8"):
+        return CLIPTextEncoder(model_name, device, quantize=backend == "clip_text_int8")
+    if backend == "sentence_transformers":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name, device=device)
+    raise ValueError(f"Unknown text_encoder backend: {backend}")
+
+WARMUP_QUERIES = ["funny cat", "when the code works on the first try", "distracted boyfriend meme"]
+
+def warm_up(encoder, batch_size=1):
+    """Runs a few encodes so one-time costs (allocations, kernel selection) don't hit the first requests."""
+    for query in WARMUP_QUERIES:
+        encoder.encode(query)
+    if batch_size > 1:
+        encoder.encode(WARMUP_QUERIES, batch_size=batch_size, show_progress_bar=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query encoder utilities.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export-onnx", help="Export the CLIP text tower for the onnx backend")
+    export_parser.add_argument("output", help="Path of the .onnx file to write")
+    export_parser.add_argument("--model", default="clip-ViT-B-32", help="Model name (default: clip-ViT-B-32)")
+    export_parser.add_argument("--quantize", action="store_true", help="Store weights as int8")
+    args = parser.parse_args()
+    export_onnx(args.model, args.output, quantize=args.quantize)
@@ -0,0 +1,57 @@
+"""Content-addressed thumbnail cache shared by the indexer (writes) and the search server (reads).
+
+Thumbnails live at <thumb_dir>/<hash[:2]>/<hash>_<size>.<ext>, keyed by the image's
+sha256 content hash. Identical files share thumbnails, a changed file gets new ones,
+and a thumbnail is never rewritten once it exists, which lets the server cache it forever.
+"""
+import os
+import sys
+from PIL import Image, features
+
+DEFAULT_THUMBNAIL_DIR = "index/thumbs"
+DEFAULT_THUMBNAIL_SIZES = (160, 320) # Longest side in px: the 150px result tiles at 1x and 2x
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+# WebP is about a third smaller than JPEG at similar quality; fall back if Pillow lacks it
+FORMAT, EXTENSION, MIMETYPE = (("WEBP", ".webp", "image/webp") if features.check("webp")
+                               else ("JPEG", ".jpg", "image/jpeg"))
+
+def thumbnail_path(thumb_dir, content_hash, size, extension=EXTENSION):
+    return os.path.join(thumb_dir, content_hash[:2], f"{content_hash}_{size}{extension}")
+
+def find_thumbnail(thumb_dir, content_hash, size):
+    """Returns (path, mimetype) of an existing thumbnail, or (None, None)."""
+    for extension, mimetype in ((".webp", "image/webp"), (".jpg", "image/jpeg")):
+        path = thumbnail_path(thumb_dir, content_hash, size, extension)
+        if os.path.exists(path):
+            return path, mimetype
+    return None, None
+
+def missing_sizes(thumb_dir, content_hash, sizes):
+    return [size for size in sizes if find_thumbnail(thumb_dir, content_hash, size)[0] is None]
+
+def make_thumbnails(image_path, content_hash, thumb_dir, sizes=DEFAULT_THUMBNAIL_SIZES):
+    """Writes the thumbnails of one image that don't exist yet. Returns the number written."""
+    sizes = sorted(missing_sizes(thumb_dir, content_hash, sizes), reverse=True)
+    if not sizes:
+        return 0
+    written = 0
+    try:
+        with Image.open(image_path) as img:
+            img.draft("RGB", (sizes[0], sizes[0])) # JPEG: decode at reduced scale, much faster
+            img = img.convert("RGBA" if FORMAT == "WEBP" and img.mode in ("RGBA", "LA", "P") else "RGB")
+            for size in sizes: # Largest first, each one downscaled from the previous
+                img.thumbnail((size, size)) # Bicubic with reducing_gap: fast and sharp enough at tile size
+                path = thumbnail_path(thumb_dir, content_hash, size)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.tmp-{os.getpid()}"
+                try:
+                    img.save(temp_path, FORMAT, quality=WEBP_QUALITY if FORMAT == "WEBP" else JPEG_QUALITY)
+                    os.replace(temp_path, path) # Readers never see a partial file
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                written += 1
+    except Exception as e:
+        print(f"Warning: Could not create thumbnails for {os.path.basename(image_path)}: {e}", file=sys.stderr)
+    return written
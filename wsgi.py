@@ -0,0 +1,19 @@
+"""WSGI entry point for serving with several worker processes.
+
+The model and indices are loaded once in the master before it forks, so with
+"index_load_mode": "mmap" every worker shares the index pages through the OS page
+cache (and the model weights copy-on-write):
+
+    MEME_SEARCH_CONFIG=config.json gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+import sys
+import app as meme_search
+
+config_path = os.environ.get("MEME_SEARCH_CONFIG", "config.json")
+if not meme_search.load_config(config_path):
+    sys.exit(1)
+if not meme_search.load_resources():
+    sys.exit(1)
+
+app = meme_search.app